@@ -3,34 +3,227 @@ Cari Hesap Takip - PWA / Bulut Sürümü
 PostgreSQL Production Version
 """
 
-from flask import Flask, render_template, request, jsonify, send_from_directory, jsonify
+from flask import Flask, Response, g, has_request_context, render_template, request, jsonify, send_from_directory, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 import os
+import base64
+import bisect
+import csv
+import io
+import hashlib
+import hmac
+import json
+import queue
+import re
+import select
+import zlib
+import click
+import threading
+import time
+import orjson
 import psycopg2
 import jwt
-from psycopg2 import errors
+from psycopg2 import errors, extensions
+from psycopg2.extras import execute_values
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 from functools import wraps
 
+try:
+    import brotli  # istege bagli; kurulu degilse yalnizca gzip
+except ImportError:
+    brotli = None
 
 
 # 🔽 BACKUP IMPORTLARI
 import subprocess
 import requests
-from datetime import datetime
+from datetime import date, datetime, timedelta
+
+class JSONProvider(DefaultJSONProvider):
+    """
+    orjson ile serilestirir: tarihler ISO metin (YYYY-MM-DD), tutarlar sabit
+    olcekli metin ("1250.00"). Yanit govdesi str'e donmeden bayt olarak yazilir.
+    """
+    OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, (date, datetime)):
+            return o.isoformat()
+        if isinstance(o, Decimal):
+            return str(o)
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        started = time.perf_counter()
+        body = orjson.dumps(obj, default=self.default, option=self.OPTIONS)
+        sure_ekle("json", time.perf_counter() - started)
+        return self._app.response_class(body, mimetype=self.mimetype)
 
 app = Flask(__name__)
+app.json = JSONProvider(app)
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
 SUPABASE_JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET")
+SUPABASE_JWKS_URL = os.environ.get("SUPABASE_JWKS_URL") or (
+    f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else None
+)
+JWT_AUDIENCE = os.environ.get("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWT_CACHE_SIZE = int(os.environ.get("JWT_CACHE_SIZE", 1024))
 
 PORT = int(os.environ.get("PORT", 5000))
 BUCKET = "db-backups"
+BACKUP_TABLES = ["cariler", "urunler", "faturalar", "hareketler", "satislar", "odemeler",
+                 "donemler", "devir_bakiyeleri"]
+BACKUP_KEEP_FULL = int(os.environ.get("BACKUP_KEEP_FULL", 7))
+BACKUP_MAX_CHAIN = int(os.environ.get("BACKUP_MAX_CHAIN", 48))
+BACKUP_LOCK_ID = 87412002
+
+# Arka plan isleri
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 1))
+BACKUP_INTERVAL_MINUTES = int(os.environ.get("BACKUP_INTERVAL_MINUTES", 60))
+SCHEDULER_LOCK_ID = 87412003
+BOLUM_LOCK_ID = 87412004
+
+# Faturada cari hareketi: "ozet" (fatura basina tek satir) veya "satir" (kalem basina)
+FATURA_HAREKET = os.environ.get("FATURA_HAREKET", "ozet")
+FATURA_MAX_KALEM = int(os.environ.get("FATURA_MAX_KALEM", 500))
+
+# Cari/urun aramasi: pg_trgm kelime benzerligi esigi ve sonuc limiti
+SEARCH_SIMILARITY = float(os.environ.get("SEARCH_SIMILARITY", 0.4))
+SEARCH_MAX_LIMIT = int(os.environ.get("SEARCH_MAX_LIMIT", 50))
+
+# Surec ici okuma onbellegi (urunler / cari listeleri)
+CACHE_TTL = float(os.environ.get("CACHE_TTL", 60))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 512))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+# Delta senkron ve cevrimdisi yazma kuyrugu
+SYNC_LOG_DAYS = int(os.environ.get("SYNC_LOG_DAYS", 30))
+SYNC_MAX_CHANGES = int(os.environ.get("SYNC_MAX_CHANGES", 5000))
+SYNC_MAX_BATCH = int(os.environ.get("SYNC_MAX_BATCH", 200))
+
+# Yanit sikistirma (Accept-Encoding: br / gzip)
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL", 6))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", 5))
+COMPRESS_MIMETYPES = {
+    "application/json", "application/x-ndjson", "text/html", "text/csv",
+    "text/css", "text/javascript", "application/javascript",
+}
+
+# Olcum: Server-Timing basligi, yavas sorgu logu ve /metrics
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "1") == "1"
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
+SLOW_QUERY_MAX_LEN = int(os.environ.get("SLOW_QUERY_MAX_LEN", 500))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+# Tutarlar kurus hassasiyetinde (NUMERIC(14,2)) tutulur
+KURUS = Decimal("0.01")
+
+# Toplu ice aktarma
+IMPORT_MAX_ROWS = int(os.environ.get("IMPORT_MAX_ROWS", 100000))
+
+# Baglanti havuzu ayarlari (saniye cinsinden sureler)
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+DB_POOL_MAX_LIFETIME = float(os.environ.get("DB_POOL_MAX_LIFETIME", 1800))
+DB_POOL_MAX_IDLE = float(os.environ.get("DB_POOL_MAX_IDLE", 300))
+DB_POOL_PING_AFTER = float(os.environ.get("DB_POOL_PING_AFTER", 30))
+# Railway SSL ister; yerel / test sunuculari icin DB_SSLMODE=prefer ya da disable
+DB_SSLMODE = os.environ.get("DB_SSLMODE", "require")
 
 # ───────────────────────────────────────────────────────
 # GİRİŞ
 # ───────────────────────────────────────────────────────
 
+class TokenCache:
+    """
+    Dogrulanmis JWT'ler icin sinirli LRU onbellek. Anahtar token'in
+    sha256'si, her kayit token'in exp zamaninda kendiliginden duser.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] <= time.time():
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, exp, payload):
+        with self._lock:
+            self._items[key] = (exp, payload)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+
+_token_cache = TokenCache(JWT_CACHE_SIZE)
+_jwks_client = None
+
+def jwks_client():
+    # Anahtar seti bellekte tutulur, `lifespan` dolunca yeniden indirilir
+    global _jwks_client
+    if _jwks_client is None:
+        _jwks_client = jwt.PyJWKClient(SUPABASE_JWKS_URL, cache_keys=True, lifespan=3600)
+    return _jwks_client
+
+def verify_token(token):
+    """
+    Supabase JWT'sini imzasiyla dogrular ve payload'i dondurur.
+    HS256 → SUPABASE_JWT_SECRET, RS256/ES256 → JWKS anahtarlari.
+    Ayni token icin tam dogrulama exp'e kadar yalnizca bir kez yapilir.
+    """
+    key = hashlib.sha256(token.encode()).hexdigest()
+    payload = _token_cache.get(key)
+    if payload is not None:
+        return payload
+
+    alg = jwt.get_unverified_header(token).get("alg")
+    if alg == "HS256":
+        if not SUPABASE_JWT_SECRET:
+            raise jwt.InvalidTokenError("SUPABASE_JWT_SECRET tanimli degil")
+        signing_key = SUPABASE_JWT_SECRET
+    elif alg in ("RS256", "ES256") and SUPABASE_JWKS_URL:
+        signing_key = jwks_client().get_signing_key_from_jwt(token).key
+    else:
+        raise jwt.InvalidTokenError(f"Desteklenmeyen algoritma: {alg}")
+
+    payload = jwt.decode(
+        token,
+        signing_key,
+        algorithms=[alg],
+        audience=JWT_AUDIENCE or None,
+        options={"require": ["exp"], "verify_aud": bool(JWT_AUDIENCE)},
+    )
+    _token_cache.put(key, payload["exp"], payload)
+    return payload
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -43,17 +236,11 @@ def token_required(f):
         if not token or len(token) < 10:
             return jsonify({"error": "Token bos"}), 401
 
-        # Supabase JWT payload kontrolu - PyJWT algoritma sorunu bypass
         try:
-            import base64, json as _json, time
-            parts = token.split(".")
-            if len(parts) != 3:
-                raise ValueError("Gecersiz JWT")
-            payload_b64 = parts[1] + "=" * (4 - len(parts[1]) % 4)
-            payload = _json.loads(base64.urlsafe_b64decode(payload_b64))
-            if payload.get("exp", 0) < time.time():
-                return jsonify({"error": "Oturum suresi doldu, tekrar giris yapin"}), 401
-        except Exception as e:
+            g.user = verify_token(token)
+        except jwt.ExpiredSignatureError:
+            return jsonify({"error": "Oturum suresi doldu, tekrar giris yapin"}), 401
+        except jwt.PyJWTError as e:
             print(f"Token hata: {e}")
             return jsonify({"error": "Gecersiz token"}), 401
 
@@ -65,21 +252,1049 @@ def token_required(f):
 # VERİTABANI
 # ───────────────────────────────────────────────────────
 
-def get_db():
-    conn = psycopg2.connect(
-        DATABASE_URL,
-        sslmode="require"  # 🔥 Railway için gerekli
-    )
-    conn.autocommit = True
-    return conn
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe psycopg2 baglanti havuzu.
+
+    - En fazla `maxconn` baglanti acar, dolunca `timeout` saniye bekler.
+    - Checkout sirasinda kapanmis / omru dolmus baglantilari atar,
+      `ping_after` saniyeden uzun bosta kalanlari SELECT 1 ile yoklar.
+    - Bosta `max_idle` saniyeden uzun kalanlari `minconn` sayisina kadar kapatir.
+    - Fork sonrasi (gunicorn --preload) ebeveynden gelen baglantilara
+      dokunmaz, cocuk surec kendi baglantilarini acar.
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=10, max_lifetime=1800,
+                 max_idle=300, ping_after=30, **connect_kwargs):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+        self.connect_kwargs = connect_kwargs
+        self._reset()
+        # Fork sonrasi miras kalan baglantilar: kapatilirsa ebeveynin
+        # soketine Terminate mesaji gider, o yuzden referansi tutulur.
+        self._fork_orphans = []
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _reset(self):
+        self._cond = threading.Condition()
+        self._idle = []        # [(conn, last_used)] - LIFO
+        self._born = {}        # id(conn) -> olusturulma zamani
+        self._size = 0
+        self._waiting = 0
+        self._pid = os.getpid()
+        self._stats = {
+            "checkouts": 0,
+            "created": 0,
+            "discarded": 0,
+            "timeouts": 0,
+            "waits": 0,
+            "wait_total": 0.0,
+            "wait_max": 0.0,
+        }
+
+    def _after_fork(self):
+        self._fork_orphans.extend(conn for conn, _ in self._idle)
+        self._reset()
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, **self.connect_kwargs)
+        conn.autocommit = True
+        return conn
+
+    def _usable(self, conn, last_used):
+        now = time.monotonic()
+        if conn.closed:
+            return False
+        if now - self._born.get(id(conn), now) > self.max_lifetime:
+            return False
+        if now - last_used > self.ping_after:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+            except psycopg2.Error:
+                return False
+        return True
+
+    def _discard(self, conn):
+        with self._cond:
+            if self._born.pop(id(conn), None) is not None:
+                self._size -= 1
+                self._stats["discarded"] += 1
+            self._cond.notify()
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        while True:
+            item, create = None, False
+            with self._cond:
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"{self.timeout:g} sn icinde bos baglanti bulunamadi"
+                        )
+                    waited = True
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                if self._idle:
+                    item = self._idle.pop()
+                else:
+                    self._size += 1
+                    create = True
+
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._born[id(conn)] = time.monotonic()
+                    self._stats["created"] += 1
+            else:
+                conn, last_used = item
+                if not self._usable(conn, last_used):
+                    self._discard(conn)
+                    continue
+
+            wait = time.monotonic() - started
+            with self._cond:
+                self._stats["checkouts"] += 1
+                if waited:
+                    self._stats["waits"] += 1
+                self._stats["wait_total"] += wait
+                self._stats["wait_max"] = max(self._stats["wait_max"], wait)
+            return conn
+
+    def putconn(self, conn):
+        if id(conn) not in self._born:
+            # Fork oncesinden kalan ya da havuza ait olmayan baglanti
+            self._fork_orphans.append(conn)
+            return
+        if conn.closed:
+            self._discard(conn)
+            return
+        try:
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if not conn.autocommit:
+                conn.autocommit = True
+        except psycopg2.Error:
+            self._discard(conn)
+            return
+        if time.monotonic() - self._born[id(conn)] > self.max_lifetime:
+            self._discard(conn)
+            return
+
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            self._idle.append((conn, now))
+            # En eski bos baglantilar listenin basinda
+            while (len(self._idle) > self.minconn
+                   and now - self._idle[0][1] > self.max_idle):
+                expired.append(self._idle.pop(0)[0])
+            self._cond.notify()
+        for old in expired:
+            self._discard(old)
+
+    def stats(self):
+        with self._cond:
+            s = dict(self._stats)
+            s.update({
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "waiting": self._waiting,
+                "min": self.minconn,
+                "max": self.maxconn,
+            })
+        s["wait_avg_ms"] = round(s["wait_total"] / s["checkouts"] * 1000, 3) if s["checkouts"] else 0.0
+        s["wait_total_ms"] = round(s.pop("wait_total") * 1000, 3)
+        s["wait_max_ms"] = round(s.pop("wait_max") * 1000, 3)
+        return s
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    DATABASE_URL,
+                    minconn=DB_POOL_MIN,
+                    maxconn=DB_POOL_MAX,
+                    timeout=DB_POOL_TIMEOUT,
+                    max_lifetime=DB_POOL_MAX_LIFETIME,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    ping_after=DB_POOL_PING_AFTER,
+                    cursor_factory=OlcumluCursor,
+                    sslmode=DB_SSLMODE
+                )
+    return _pool
+
+@contextmanager
+def get_db(transaction=False):
+    """
+    Havuzdan baglanti verir. Varsayilan autocommit; transaction=True ile
+    blok tek transaction olarak calisir (hata olursa tamami geri alinir).
+    """
+    pool = get_pool()
+    started = time.perf_counter()
+    conn = pool.getconn()
+    sure_ekle("db", time.perf_counter() - started)
+    try:
+        if transaction:
+            conn.autocommit = False
+        yield conn
+        if transaction:
+            conn.commit()
+    finally:
+        # Acik kalan/yarim transaction'i putconn geri alir
+        pool.putconn(conn)
+
+@app.errorhandler(PoolTimeout)
+def pool_timeout(e):
+    return jsonify({"error": "Veritabani mesgul, tekrar deneyin"}), 503
+
+@app.errorhandler(errors.CheckViolation)
+def check_violation(e):
+    # Kapanmis doneme yazma (donem_kilidi) ve diger CHECK kisitlari
+    return jsonify({"error": e.diag.message_primary}), 400
 
 def rows_to_dicts(cur):
+    started = time.perf_counter()
     cols = [desc[0] for desc in cur.description]
-    return [dict(zip(cols, row)) for row in cur.fetchall()]
+    rows = [dict(zip(cols, row)) for row in cur.fetchall()]
+    sure_ekle("rows", time.perf_counter() - started)
+    return rows
+
+def liste_bicimi(cols, rows):
+    """
+    Buyuk listeler icin: ?format=columns ise kolon adlari bir kez, satirlar
+    deger dizisi olarak ({"columns": [...], "rows": [[...], ...]}); degilse
+    her satir bir nesne.
+    """
+    if request.args.get("format") == "columns":
+        return {"columns": cols, "rows": rows}
+    return [dict(zip(cols, row)) for row in rows]
+
+def liste_sorgusu(cur):
+    """Sonucu dict'lere cevirmeden (kolonlar, satirlar) olarak okur."""
+    started = time.perf_counter()
+    cols, rows = [desc[0] for desc in cur.description], cur.fetchall()
+    sure_ekle("rows", time.perf_counter() - started)
+    return cols, rows
+
+class KayitBulunamadi(Exception):
+    pass
+
+def zorunlu(d, *alanlar):
+    eksik = [a for a in alanlar if d.get(a) in (None, "")]
+    if eksik:
+        raise ValueError(f"{', '.join(eksik)} zorunludur")
+
+def yazma_yaniti(islem, tur):
+    """
+    islem(cur, veri) → dict: tek transaction'da calistirir, hatalari JSON'a cevirir.
+    Ayni islemler toplu/cevrimdisi yazmada (/api/sync/yaz) da kullanilir.
+    X-Istemci-Id basligi gelirse islem /api/sync/yaz ile ayni kayitla bir kez
+    uygulanir: yaniti kaybolan istek kuyruktan tekrar gelirse ilk sonuc doner.
+    """
+    iid = request.headers.get("X-Istemci-Id")
+    if iid is not None and not 8 <= len(iid) <= 64:
+        return jsonify({"error": "Gecersiz istemci_id"}), 400
+    try:
+        with get_db(transaction=True) as conn:
+            cur = conn.cursor()
+            if iid:
+                cur.execute("""
+                    INSERT INTO istemci_islemleri (istemci_id, tur) VALUES (%s,%s)
+                    ON CONFLICT DO NOTHING RETURNING 1
+                """, (iid, tur))
+                if not cur.fetchone():
+                    cur.execute("SELECT sonuc FROM istemci_islemleri WHERE istemci_id=%s", (iid,))
+                    return jsonify({"ok": True, "tekrar": True, **(cur.fetchone()[0] or {})})
+            sonuc = islem(cur, request.json or {})
+            if iid:
+                cur.execute("UPDATE istemci_islemleri SET sonuc=%s WHERE istemci_id=%s",
+                            (app.json.dumps(sonuc), iid))
+    except KayitBulunamadi as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"ok": True, **sonuc})
+
+# Sayfalama imleci: son satirin (tarih, id) degeri, istemciye opak metin olarak gider
+def encode_cursor(*values):
+    raw = json.dumps([str(v) if v is not None else None for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(token, size=2):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Gecersiz imlec")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Gecersiz imlec")
+    return values
+
+def page_limit(default=50, maximum=500):
+    limit = request.args.get("limit", default, type=int)
+    return max(1, min(limit, maximum))
+
+def parse_amount(value):
+    """'1.234,50', '1234.5', 12 gibi tutarlari Decimal'e cevirir; bos -> 0."""
+    if value is None or value == "":
+        return Decimal(0)
+    if isinstance(value, (int, float)):
+        value = str(value)
+    s = str(value).strip().replace(" ", "")
+    if "," in s:
+        # Turkce bicim: nokta binlik ayirici, virgul ondalik
+        s = s.replace(".", "").replace(",", ".")
+    try:
+        d = Decimal(s)
+    except InvalidOperation:
+        raise ValueError(f"Gecersiz sayi: {value}")
+    if not d.is_finite():
+        raise ValueError(f"Gecersiz sayi: {value}")
+    return d
+
+
+def parse_date(value):
+    """YYYY-MM-DD veya GG.AA.YYYY tarihini date'e cevirir."""
+    if isinstance(value, date):
+        return value
+    s = str(value or "").strip()
+    for fmt in ("%Y-%m-%d", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(s, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Gecersiz tarih: {value!r}")
+
+
+def money(value):
+    """Tutari kurusa yuvarlanmis Decimal'e cevirir (ROUND_HALF_UP)."""
+    return parse_amount(value).quantize(KURUS, rounding=ROUND_HALF_UP)
+
+
+def tarih_araligi():
+    """
+    ?baslangic=&bitis= (dahil) ya da kisayol olarak ?ay=YYYY-MM / ?yil=YYYY.
+    (baslangic, bitis) date ikilisi dondurur; tarih indeksinde aralik taramasi olur.
+    """
+    baslangic = bitis = None
+    if request.args.get("yil"):
+        try:
+            yil = int(request.args["yil"])
+            baslangic, bitis = date(yil, 1, 1), date(yil, 12, 31)
+        except ValueError:
+            raise ValueError(f"Gecersiz yil: {request.args['yil']!r}")
+    if request.args.get("ay"):
+        try:
+            ay = datetime.strptime(request.args["ay"], "%Y-%m").date()
+        except ValueError:
+            raise ValueError(f"Gecersiz ay: {request.args['ay']!r} (YYYY-AA)")
+        sonraki = date(ay.year + ay.month // 12, ay.month % 12 + 1, 1)
+        baslangic, bitis = ay, sonraki - timedelta(days=1)
+    if request.args.get("baslangic"):
+        baslangic = parse_date(request.args["baslangic"])
+    if request.args.get("bitis"):
+        bitis = parse_date(request.args["bitis"])
+    return baslangic, bitis
+
+
+
+STREAM_CHUNK = 2000
+
+def stream_rows(sql, params, fmt):
+    """
+    Sorgu sonucunu sunucu tarafi (named) cursor ile parca parca yazar;
+    satirlarin tamami hicbir an bellekte tutulmaz.
+    fmt="ndjson" → satir basina bir JSON nesnesi, fmt="json" → tek JSON dizisi.
+    """
+    def generate():
+        with get_db(transaction=True) as conn:
+            cur = conn.cursor(name="liste_akisi")
+            cur.itersize = STREAM_CHUNK
+            cur.execute(sql, params)
+            cols = None
+            sep = "\n" if fmt == "ndjson" else ","
+            started = False
+            if fmt == "json":
+                yield "["
+            while True:
+                rows = cur.fetchmany(STREAM_CHUNK)
+                if not rows:
+                    break
+                if cols is None:
+                    cols = [desc[0] for desc in cur.description]
+                chunk = sep.join(app.json.dumps(dict(zip(cols, row))) for row in rows)
+                if started:
+                    chunk = sep + chunk
+                started = True
+                yield chunk
+            if fmt == "json":
+                yield "]"
+            elif started:
+                yield "\n"
+            cur.close()
+
+    mimetype = "application/x-ndjson" if fmt == "ndjson" else "application/json"
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+def sayfali_liste(anahtar, select_sql, alias, filtre_alanlari):
+    """
+    Satis/odeme listeleri icin ortak sayfalama ve filtreleme.
+    ?cari_id=, ?urun_id= (filtre_alanlari icindekiler), ?baslangic=, ?bitis=, ?ay=, ?yil=
+    ?limit=&cursor= → {anahtar: [...], "sonraki": imlec}
+    ?stream=json|ndjson → tum eslesen satirlar akis olarak
+    """
+    where, params = [], []
+    for alan in filtre_alanlari:
+        value = request.args.get(alan, type=int)
+        if value:
+            where.append(f"{alias}.{alan}=%s")
+            params.append(value)
+    try:
+        baslangic, bitis = tarih_araligi()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if baslangic:
+        where.append(f"{alias}.tarih >= %s")
+        params.append(baslangic)
+    if bitis:
+        where.append(f"{alias}.tarih <= %s")
+        params.append(bitis)
+
+    order = f" ORDER BY {alias}.tarih DESC, {alias}.id DESC"
+
+    stream = request.args.get("stream")
+    if stream:
+        if stream not in ("json", "ndjson"):
+            return jsonify({"error": "Gecersiz akis bicimi"}), 400
+        sql = select_sql + (" WHERE " + " AND ".join(where) if where else "") + order
+        return stream_rows(sql, params, stream)
+
+    if request.args.get("cursor"):
+        try:
+            tarih, rid = decode_cursor(request.args["cursor"])
+            where.append(f"({alias}.tarih, {alias}.id) < (%s, %s)")
+            params += [parse_date(tarih), int(rid)]
+        except ValueError:
+            return jsonify({"error": "Gecersiz imlec"}), 400
+
+    limit = page_limit(100)
+    sql = select_sql + (" WHERE " + " AND ".join(where) if where else "") + order + " LIMIT %s"
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, params + [limit + 1])
+        cols, rows = liste_sorgusu(cur)
+
+    sonraki = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        son = rows[-1]
+        sonraki = encode_cursor(son[cols.index("tarih")], son[cols.index("id")])
+    return jsonify({anahtar: liste_bicimi(cols, rows), "sonraki": sonraki})
+
+def tablo_surumu(tablolar, cid=None):
+    with get_db() as conn:
+        cur = conn.cursor()
+        surum, degisme = "0", None
+        if tablolar:
+            cur.execute("""
+                SELECT string_agg(surum::text, '.' ORDER BY tablo), max(degisme)
+                FROM tablo_surum WHERE tablo = ANY(%s)
+            """, (list(tablolar),))
+            surum, degisme = cur.fetchone()
+        if cid is not None:
+            cur.execute("SELECT xmin::text FROM cari_bakiye WHERE cari_id=%s", (cid,))
+            r = cur.fetchone()
+            surum = f"{surum}-{r[0] if r else 0}"
+    return surum, degisme
+
+def etag_ile(*tablolar, cari=False):
+    """
+    GET ucu icin kosullu yanit: ETag tablolarin surum sayaclarindan
+    (cari=True ise ayrica cari_bakiye satirinin xmin'inden) uretilir.
+    Ekstre donduren uclar DONEM_TABLOLARI'ni da verir: arsivleme/bolum
+    tasima bakiyeyi degistirmez ama satirlarin yerini degistirir.
+    If-None-Match eslesirse ana sorgu hic calismadan 304 doner.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            key = ("surum", tablolar, kwargs.get("cid") if cari else None)
+            cached = onbellek.get(key)
+            if cached:
+                surum, degisme = cached
+            else:
+                nesil = onbellek.nesil
+                surum, degisme = tablo_surumu(tablolar, kwargs["cid"] if cari else None)
+                onbellek.set(key, (surum, degisme),
+                             tablolar + (("hareketler", "cariler") if cari else ()), nesil)
+            # Sema (ve yanit bicimi) degisince eski ETag'ler gecersiz olsun
+            etag = f"{MIGRATIONS[-1][0]}-{surum}"
+
+            if request.if_none_match.contains_weak(etag):
+                resp = Response(status=304)
+            else:
+                resp = app.make_response(f(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+            resp.set_etag(etag, weak=True)
+            if degisme:
+                resp.last_modified = degisme
+            resp.headers["Cache-Control"] = "private, no-cache"
+            return resp
+        return wrapper
+    return decorator
+
+# ───────────────────────────────────────────────────────
+# ⏱ ÖLÇÜM
+# ───────────────────────────────────────────────────────
+
+# Sayaclar surec icidir; Prometheus her worker'i ayri hedef olarak toplamali.
+SURE_KOVALARI = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+IS_KOVALARI = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+def _etiketler(adlar, degerler):
+    parcalar = []
+    for ad, deger in zip(adlar, degerler):
+        deger = str(deger).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parcalar.append(f'{ad}="{deger}"')
+    return "{" + ",".join(parcalar) + "}" if parcalar else ""
+
+
+class Sayac:
+    """Prometheus counter; etiket degerleri basina ayri seri."""
+
+    def __init__(self, ad, aciklama, etiketler=()):
+        self.ad = ad
+        self.aciklama = aciklama
+        self.etiketler = etiketler
+        self._seriler = {}
+        self._lock = threading.Lock()
+
+    def artir(self, *etiket, n=1):
+        with self._lock:
+            self._seriler[etiket] = self._seriler.get(etiket, 0) + n
+
+    def satirlar(self):
+        yield f"# HELP {self.ad} {self.aciklama}"
+        yield f"# TYPE {self.ad} counter"
+        with self._lock:
+            seriler = sorted(self._seriler.items())
+        for etiket, deger in seriler:
+            if isinstance(deger, float):
+                deger = f"{deger:.6f}"
+            yield f"{self.ad}{_etiketler(self.etiketler, etiket)} {deger}"
+
+
+class Histogram:
+    """Prometheus histogram: kova sayaclari, toplam ve adet."""
+
+    def __init__(self, ad, aciklama, etiketler=(), kovalar=SURE_KOVALARI):
+        self.ad = ad
+        self.aciklama = aciklama
+        self.etiketler = etiketler
+        self.kovalar = kovalar
+        self._seriler = {}
+        self._lock = threading.Lock()
+
+    def gozlem(self, deger, *etiket):
+        i = bisect.bisect_left(self.kovalar, deger)
+        with self._lock:
+            seri = self._seriler.get(etiket)
+            if seri is None:
+                seri = self._seriler[etiket] = [[0] * (len(self.kovalar) + 1), 0.0]
+            seri[0][i] += 1
+            seri[1] += deger
+
+    def satirlar(self):
+        yield f"# HELP {self.ad} {self.aciklama}"
+        yield f"# TYPE {self.ad} histogram"
+        with self._lock:
+            seriler = sorted((e, list(k), t) for e, (k, t) in self._seriler.items())
+        for etiket, kovalar, toplam in seriler:
+            birikim = 0
+            for le, n in zip(self.kovalar + ("+Inf",), kovalar):
+                birikim += n
+                yield f"{self.ad}_bucket{_etiketler(self.etiketler + ('le',), etiket + (le,))} {birikim}"
+            yield f"{self.ad}_sum{_etiketler(self.etiketler, etiket)} {toplam:.6f}"
+            yield f"{self.ad}_count{_etiketler(self.etiketler, etiket)} {birikim}"
+
+
+ISTEK_SURESI = Histogram("cari_http_request_duration_seconds", "Istek suresi (route sablonu basina)",
+                         ("method", "route"))
+ISTEK_SAYISI = Sayac("cari_http_requests_total", "Istek sayisi", ("method", "route", "status"))
+ISTEK_DB_SURESI = Sayac("cari_http_db_seconds_total", "Isteklerde SQL'de gecen toplam sure",
+                        ("method", "route"))
+SORGU_SURESI = Histogram("cari_db_query_duration_seconds", "Tek SQL ifadesinin suresi")
+YAVAS_SORGU = Sayac("cari_db_slow_queries_total", f"SLOW_QUERY_MS ({SLOW_QUERY_MS:g} ms) ustu sorgular")
+IS_SURESI = Histogram("cari_job_duration_seconds", "Arka plan isi (yedek / geri yukleme) suresi",
+                      ("tur", "durum"), IS_KOVALARI)
+
+# Server-Timing girdileri ve aciklamalari, basliktaki sirayla
+SUNUCU_ZAMANLAMA = {
+    "db": "baglanti",
+    "sql": "sorgu",
+    "rows": "satirlar",
+    "json": "serilestirme",
+    "sikistirma": "sikistirma",
+}
+
+def sure_ekle(ad, sure):
+    """Istek icindeyse suresi Server-Timing olcumune eklenir (arka plan thread'lerinde yok sayilir)."""
+    if has_request_context():
+        olcum = g.get("olcum")
+        if olcum is not None:
+            toplam, adet = olcum.get(ad, (0.0, 0))
+            olcum[ad] = (toplam + sure, adet + 1)
+
+# Yavas sorgu logunda degerler yazilmaz: metin sabitleri ve sayilar "?" olur,
+# execute_values'un uzun VALUES listesi tek demete iner.
+_SORGU_SABIT = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SORGU_DEMETLER = re.compile(r"(\((?:\?|NULL)(?:, ?(?:\?|NULL))*\))(?:, ?\((?:\?|NULL)(?:, ?(?:\?|NULL))*\))+")
+
+def sorgu_kalibi(query):
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    elif not isinstance(query, str):
+        query = str(query)
+    query = " ".join(_SORGU_SABIT.sub("?", query).split())
+    query = _SORGU_DEMETLER.sub(r"\1, ...", query)
+    if len(query) > SLOW_QUERY_MAX_LEN:
+        query = query[:SLOW_QUERY_MAX_LEN] + "…"
+    return query
+
+def _deger_tipi(v):
+    if isinstance(v, (list, tuple)):
+        return f"{type(v).__name__}[{len(v)}]"
+    return type(v).__name__
+
+def parametre_sekli(params):
+    """Parametrelerin degerleri degil tipleri: (int, str, list[3])."""
+    if params is None:
+        return "-"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {_deger_tipi(v)}" for k, v in params.items()) + "}"
+    return "(" + ", ".join(_deger_tipi(v) for v in params) + ")"
+
+def sorgu_bitti(query, params, sure):
+    sure_ekle("sql", sure)
+    SORGU_SURESI.gozlem(sure)
+    if sure * 1000 >= SLOW_QUERY_MS:
+        YAVAS_SORGU.artir()
+        if has_request_context():
+            yer = f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+        else:
+            yer = threading.current_thread().name
+        print(f"⚠ yavas sorgu {sure * 1000:.0f} ms [{yer}] {sorgu_kalibi(query)} "
+              f"params={parametre_sekli(params)}")
+
+
+class OlcumluCursor(extensions.cursor):
+    """Her execute suresini istek olcumune ve metriklere yazar, yavas olanlari loglar."""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            sorgu_bitti(query, vars, time.perf_counter() - started)
 
-def init_db():
-    conn = get_db()
-    cur = conn.cursor()
+
+@app.before_request
+def olcume_basla():
+    g.olcum = {}
+    g.olcum_baslangic = time.perf_counter()
+
+@app.after_request
+def sunucu_zamanlamasi(resp):
+    """
+    Istek suresini metriklere yazar ve Server-Timing basligini ekler.
+    Sikistirmadan sonra calissin diye o hook'tan once kaydedilir
+    (after_request'ler ters sirada calisir). Akislarda govde sonradan
+    uretildigi icin yalnizca ilk yanita kadarki sure gorunur.
+    """
+    started = g.pop("olcum_baslangic", None)
+    if started is None:
+        return resp
+    sure = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else "eslesmeyen"
+    olcum = g.pop("olcum", {})
+    ISTEK_SURESI.gozlem(sure, request.method, route)
+    ISTEK_SAYISI.artir(request.method, route, str(resp.status_code))
+    if "sql" in olcum:
+        ISTEK_DB_SURESI.artir(request.method, route, n=olcum["sql"][0])
+
+    if SERVER_TIMING:
+        parcalar = []
+        for ad, aciklama in SUNUCU_ZAMANLAMA.items():
+            if ad in olcum:
+                toplam, adet = olcum[ad]
+                if ad == "sql":
+                    aciklama = f"{adet} sorgu"
+                parcalar.append(f'{ad};dur={toplam * 1000:.2f};desc="{aciklama}"')
+        parcalar.append(f'app;dur={sure * 1000:.2f};desc="toplam"')
+        resp.headers["Server-Timing"] = ", ".join(parcalar)
+    return resp
+
+def metrikler_metni():
+    satirlar = []
+    for metrik in (ISTEK_SURESI, ISTEK_SAYISI, ISTEK_DB_SURESI, SORGU_SURESI, YAVAS_SORGU, IS_SURESI):
+        satirlar.extend(metrik.satirlar())
+
+    havuz = get_pool().stats()
+    satirlar += [
+        "# HELP cari_db_pool_connections Havuzdaki baglantilar",
+        "# TYPE cari_db_pool_connections gauge",
+        f'cari_db_pool_connections{{state="idle"}} {havuz["idle"]}',
+        f'cari_db_pool_connections{{state="in_use"}} {havuz["in_use"]}',
+        "# HELP cari_db_pool_max_connections Havuz ust siniri",
+        "# TYPE cari_db_pool_max_connections gauge",
+        f'cari_db_pool_max_connections {havuz["max"]}',
+        "# HELP cari_db_pool_waiting Bos baglanti bekleyen istekler",
+        "# TYPE cari_db_pool_waiting gauge",
+        f'cari_db_pool_waiting {havuz["waiting"]}',
+    ]
+    for ad in ("checkouts", "created", "discarded", "timeouts"):
+        satirlar += [
+            f"# HELP cari_db_pool_{ad}_total Havuz {ad} sayisi",
+            f"# TYPE cari_db_pool_{ad}_total counter",
+            f"cari_db_pool_{ad}_total {havuz[ad]}",
+        ]
+    satirlar += [
+        "# HELP cari_db_pool_wait_seconds_total Baglanti beklemede gecen toplam sure",
+        "# TYPE cari_db_pool_wait_seconds_total counter",
+        f'cari_db_pool_wait_seconds_total {havuz["wait_total_ms"] / 1000:.6f}',
+    ]
+
+    ob = onbellek.stats()
+    for ad, tur in (("hits", "counter"), ("misses", "counter"), ("evictions", "counter"),
+                    ("entries", "gauge"), ("bytes", "gauge")):
+        metrik = f"cari_cache_{ad}_total" if tur == "counter" else f"cari_cache_{ad}"
+        satirlar += [f"# HELP {metrik} Onbellek {ad}", f"# TYPE {metrik} {tur}", f"{metrik} {ob[ad]}"]
+    return "\n".join(satirlar) + "\n"
+
+# ───────────────────────────────────────────────────────
+# 📦 YANIT SIKIŞTIRMA
+# ───────────────────────────────────────────────────────
+
+def _sikistirici(kodlama):
+    """(process, flush, finish) uclusu; akislarda her parca flush ile gonderilir."""
+    if kodlama == "br":
+        c = brotli.Compressor(quality=BROTLI_QUALITY)
+        return c.process, c.flush, c.finish
+    z = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)  # 31: gzip basligi
+    return z.compress, lambda: z.flush(zlib.Z_SYNC_FLUSH), z.flush
+
+def _sikistirilmis_akis(parcalar, kodlama):
+    process, flush, finish = _sikistirici(kodlama)
+    for parca in parcalar:
+        if parca:
+            yield process(parca) + flush()
+    yield finish()
+
+@app.after_request
+def yaniti_sikistir(resp):
+    """JSON/HTML yanitlari Accept-Encoding'e gore brotli ya da gzip ile sikistirir."""
+    if (request.method == "HEAD" or resp.direct_passthrough
+            or resp.status_code in (204, 206, 304) or resp.status_code < 200
+            or resp.mimetype not in COMPRESS_MIMETYPES
+            or "Content-Encoding" in resp.headers):
+        return resp
+    resp.vary.add("Accept-Encoding")
+    kodlama = request.accept_encodings.best_match(["br", "gzip"] if brotli else ["gzip"])
+    if not kodlama:
+        return resp
+
+    if resp.is_streamed:
+        resp.response = _sikistirilmis_akis(resp.iter_encoded(), kodlama)
+        resp.headers.pop("Content-Length", None)
+    else:
+        data = resp.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return resp
+        started = time.perf_counter()
+        process, _, finish = _sikistirici(kodlama)
+        resp.set_data(process(data) + finish())
+        sure_ekle("sikistirma", time.perf_counter() - started)
+    resp.headers["Content-Encoding"] = kodlama
+    return resp
+
+# ───────────────────────────────────────────────────────
+# ⚡ ÖNBELLEK
+# ───────────────────────────────────────────────────────
+
+class Onbellek:
+    """
+    Surec ici LRU + TTL onbellek. Her kayit dayandigi tablolarla etiketlenir;
+    tablo degisince (LISTEN/NOTIFY ya da bu surecteki bir yazma) o kayitlar duser.
+    Dinleyici bagli degilken diger surecleri duyamayacagi icin devre disidir.
+    """
+
+    def __init__(self, maxsize, max_bytes, ttl):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = False
+        self._items = OrderedDict()   # key -> (value, expires, tablolar, boyut)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.nesil = 0                # her invalidate'te artar
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[1] <= time.monotonic():
+                if item is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value, tablolar, nesil=None):
+        """nesil: deger okunmaya baslanirken alinan self.nesil; arada
+        invalidate olduysa bayat olabilecek deger yazilmaz."""
+        if not self.enabled:
+            return
+        size = len(value) if isinstance(value, bytes) else 64
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if nesil is not None and nesil != self.nesil:
+                return
+            if key in self._items:
+                self._drop(key)
+            self._items[key] = (value, time.monotonic() + self.ttl, frozenset(tablolar), size)
+            self._bytes += size
+            while len(self._items) > self.maxsize or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._items)))
+                self.evictions += 1
+
+    def invalidate(self, tablo=None):
+        """tablo verilmezse hepsi."""
+        with self._lock:
+            keys = [k for k, item in self._items.items() if tablo is None or tablo in item[2]]
+            for k in keys:
+                self._drop(k)
+            self.nesil += 1
+            self.invalidations += 1
+
+    def _drop(self, key):
+        self._bytes -= self._items.pop(key)[3]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+onbellek = Onbellek(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_TTL)
+
+def onbellekli(*tablolar):
+    """GET yanitini (JSON govdesi) adres + sorgu metni anahtariyla onbellege alir."""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            key = ("yanit", request.path, request.query_string)
+            body = onbellek.get(key)
+            if body is not None:
+                return Response(body, mimetype="application/json")
+            nesil = onbellek.nesil
+            resp = app.make_response(f(*args, **kwargs))
+            if resp.status_code == 200 and not resp.is_streamed:
+                onbellek.set(key, resp.get_data(), tablolar, nesil)
+            return resp
+        return wrapper
+    return decorator
+
+@app.after_request
+def yazmada_onbellegi_temizle(resp):
+    # Bu surecin kendi yazmasi NOTIFY gelmeden de hemen gorunsun
+    if request.method not in ("GET", "HEAD", "OPTIONS") and resp.status_code < 400:
+        onbellek.invalidate()
+    return resp
+
+def onbellek_dinleyici():
+    """
+    tablo_degisti kanalini dinler (tablo_surum tetikleyicisi NOTIFY eder);
+    diger worker ve replikalardaki yazmalar bu surecin onbellegini dusurur.
+    Baglanti koparsa onbellek kapanir, yeniden baglaninca bos baslar.
+    """
+    while True:
+        conn = None
+        try:
+            pool = get_pool()
+            conn = psycopg2.connect(pool.dsn, **pool.connect_kwargs)
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute("LISTEN tablo_degisti")
+            onbellek.invalidate()
+            onbellek.enabled = True
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    cur.execute("SELECT 1")
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    onbellek.invalidate(conn.notifies.pop(0).payload)
+        except Exception as e:
+            print(f"⚠ onbellek dinleyici: {e}")
+        finally:
+            onbellek.enabled = False
+            onbellek.invalidate()
+            if conn is not None:
+                conn.close()
+        time.sleep(5)
+
+# ───────────────────────────────────────────────────────
+# MİGRASYONLAR
+# ───────────────────────────────────────────────────────
+#
+# Sema degisiklikleri sirali, numarali migrasyonlarla uygulanir.
+# Uygulananlar schema_migrations tablosunda tutulur.
+#
+#   flask --app app db upgrade     → bekleyenleri uygula
+#   flask --app app db status      → durum listesi
+#
+# CREATE INDEX CONCURRENTLY gibi transaction icinde calisamayan
+# adimlar transactional=False ile isaretlenir.
+
+MIGRATIONS = []
+MIGRATION_LOCK_ID = 87412001  # pg_advisory_lock anahtari
+
+def migration(version, name, transactional=True):
+    def register(fn):
+        MIGRATIONS.append((version, name, transactional, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+def create_index_concurrently(cur, name, table, columns, unique=False, where=None, using=None):
+    # Yarida kalmis CONCURRENTLY denemesi INVALID indeks birakir, once onu sil
+    cur.execute("""
+        SELECT i.indisvalid FROM pg_class c
+        JOIN pg_index i ON i.indexrelid=c.oid
+        WHERE c.relname=%s
+    """, (name,))
+    r = cur.fetchone()
+    if r and r[0]:
+        return
+    if r:
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    cur.execute(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY {name} ON {table}"
+        + (f" USING {using}" if using else "") + f" ({columns})"
+        + (f" WHERE {where}" if where else "")
+    )
+
+def _ensure_migrations_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            duration_ms INTEGER
+        )
+    """)
+
+def migrate(target=None):
+    """Bekleyen migrasyonlari sirayla uygular, uygulananlari dondurur."""
+    applied = []
+    with get_db() as conn:
+        cur = conn.cursor()
+        # Ayni anda baslayan worker'lar / deploy'lar birbirini beklesin
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            _ensure_migrations_table(cur)
+            cur.execute("SELECT version FROM schema_migrations")
+            done = {r[0] for r in cur.fetchall()}
+
+            for version, name, transactional, fn in MIGRATIONS:
+                if version in done or (target is not None and version > target):
+                    continue
+                started = time.monotonic()
+                if transactional:
+                    conn.autocommit = False
+                try:
+                    fn(cur)
+                    ms = int((time.monotonic() - started) * 1000)
+                    cur.execute("""
+                        INSERT INTO schema_migrations (version,name,duration_ms)
+                        VALUES (%s,%s,%s)
+                    """, (version, name, ms))
+                    if transactional:
+                        conn.commit()
+                except Exception:
+                    if transactional:
+                        conn.rollback()
+                    raise
+                finally:
+                    conn.autocommit = True
+                applied.append((version, name, ms))
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+    return applied
+
+def migration_status():
+    with get_db() as conn:
+        cur = conn.cursor()
+        _ensure_migrations_table(cur)
+        cur.execute("SELECT version, applied_at FROM schema_migrations")
+        done = dict(cur.fetchall())
+    return [(v, name, done.get(v)) for v, name, _, _ in MIGRATIONS]
+
+
+@migration(1, "temel tablolar")
+def m001_temel_tablolar(cur):
     cur.execute("""
             CREATE TABLE IF NOT EXISTS cariler (
                 id SERIAL PRIMARY KEY,
@@ -132,65 +1347,2028 @@ def init_db():
                 aciklama TEXT
             );
         """)
-    conn.close()
+
+
+@migration(2, "yabanci anahtar ve tarih indeksleri", transactional=False)
+def m002_indeksler(cur):
+    # Ekstre, ozet ve cascade silmeler cari_id + tarih sirasiyla okur
+    create_index_concurrently(cur, "idx_hareketler_cari_tarih", "hareketler", "cari_id, tarih, id")
+    create_index_concurrently(cur, "idx_satislar_cari_tarih", "satislar", "cari_id, tarih, id")
+    create_index_concurrently(cur, "idx_odemeler_cari_tarih", "odemeler", "cari_id, tarih, id")
+    # ON DELETE RESTRICT kontrolu (urun silme)
+    create_index_concurrently(cur, "idx_satislar_urun", "satislar", "urun_id")
+    # Liste ekranlari: ORDER BY tarih DESC, id DESC
+    create_index_concurrently(cur, "idx_satislar_tarih", "satislar", "tarih, id")
+    create_index_concurrently(cur, "idx_odemeler_tarih", "odemeler", "tarih, id")
+
+
+# Tum bakiyeleri hareketler tablosundan bastan hesaplar
+BAKIYE_YENIDEN_HESAPLA_SQL = """
+    INSERT INTO cari_bakiye (cari_id, borc, alacak, hareket_sayisi)
+    SELECT c.id,
+           COALESCE(SUM(h.borc), 0),
+           COALESCE(SUM(h.alacak), 0),
+           COUNT(h.id)
+    FROM cariler c
+    LEFT JOIN hareketler h ON h.cari_id = c.id
+    GROUP BY c.id
+    ON CONFLICT (cari_id) DO UPDATE SET
+        borc = EXCLUDED.borc,
+        alacak = EXCLUDED.alacak,
+        hareket_sayisi = EXCLUDED.hareket_sayisi
+"""
+
+BAKIYE_SON_TARIH_SQL = """
+    UPDATE cari_bakiye b SET son_tarih = h.son_tarih
+    FROM (SELECT cari_id, MAX(tarih) AS son_tarih FROM hareketler GROUP BY cari_id) h
+    WHERE h.cari_id = b.cari_id AND b.son_tarih IS DISTINCT FROM h.son_tarih
+"""
+
+@migration(3, "cari_bakiye ozet tablosu")
+def m003_cari_bakiye(cur):
+    # Backfill ile tetikleyici arasinda yazma kacmasin
+    cur.execute("LOCK TABLE hareketler IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS cari_bakiye (
+            cari_id INTEGER PRIMARY KEY REFERENCES cariler(id) ON DELETE CASCADE,
+            borc NUMERIC NOT NULL DEFAULT 0,
+            alacak NUMERIC NOT NULL DEFAULT 0,
+            bakiye NUMERIC GENERATED ALWAYS AS (borc - alacak) STORED,
+            hareket_sayisi INTEGER NOT NULL DEFAULT 0
+        );
+
+        CREATE OR REPLACE FUNCTION cari_bakiye_guncelle() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                UPDATE cari_bakiye SET
+                    borc = borc - COALESCE(OLD.borc, 0),
+                    alacak = alacak - COALESCE(OLD.alacak, 0),
+                    hareket_sayisi = hareket_sayisi - 1
+                WHERE cari_id = OLD.cari_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO cari_bakiye (cari_id, borc, alacak, hareket_sayisi)
+                VALUES (NEW.cari_id, COALESCE(NEW.borc, 0), COALESCE(NEW.alacak, 0), 1)
+                ON CONFLICT (cari_id) DO UPDATE SET
+                    borc = cari_bakiye.borc + EXCLUDED.borc,
+                    alacak = cari_bakiye.alacak + EXCLUDED.alacak,
+                    hareket_sayisi = cari_bakiye.hareket_sayisi + 1;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION cari_bakiye_temizle() RETURNS trigger AS $$
+        BEGIN
+            DELETE FROM cari_bakiye;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS trg_hareketler_bakiye ON hareketler;
+        CREATE TRIGGER trg_hareketler_bakiye
+            AFTER INSERT OR DELETE OR UPDATE OF cari_id, borc, alacak ON hareketler
+            FOR EACH ROW EXECUTE FUNCTION cari_bakiye_guncelle();
+
+        DROP TRIGGER IF EXISTS trg_hareketler_bakiye_truncate ON hareketler;
+        CREATE TRIGGER trg_hareketler_bakiye_truncate
+            AFTER TRUNCATE ON hareketler
+            FOR EACH STATEMENT EXECUTE FUNCTION cari_bakiye_temizle();
+    """)
+    cur.execute(BAKIYE_YENIDEN_HESAPLA_SQL)
+
+
+def bakiye_kontrol(fix=False):
+    """
+    cari_bakiye ozetini hareketler tablosuyla karsilastirir.
+    Farkli cikan carileri [(cari_id, ozet_borc, ozet_alacak, gercek_borc, gercek_alacak)]
+    olarak dondurur; fix=True ise tum ozeti yeniden hesaplar.
+    """
+    with get_db(transaction=True) as conn:
+        cur = conn.cursor()
+        if fix:
+            cur.execute("LOCK TABLE hareketler IN SHARE ROW EXCLUSIVE MODE")
+        cur.execute(f"""
+            SELECT c.id,
+                   COALESCE(b.borc, 0), COALESCE(b.alacak, 0),
+                   COALESCE(h.borc, 0), COALESCE(h.alacak, 0)
+            FROM cariler c
+            LEFT JOIN cari_bakiye b ON b.cari_id = c.id
+            LEFT JOIN ({HAREKET_TOPLAMLARI_SQL}) h ON h.cari_id = c.id
+            WHERE COALESCE(b.borc, 0) <> COALESCE(h.borc, 0)
+               OR COALESCE(b.alacak, 0) <> COALESCE(h.alacak, 0)
+            ORDER BY c.id
+        """)
+        drift = cur.fetchall()
+        if fix:
+            bakiye_yeniden_hesapla(cur)
+    return drift
+
+
+@migration(4, "cari_bakiye son hareket tarihi")
+def m004_cari_bakiye_son_tarih(cur):
+    cur.execute("LOCK TABLE hareketler IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute("""
+        ALTER TABLE cari_bakiye ADD COLUMN IF NOT EXISTS son_tarih TEXT;
+
+        CREATE OR REPLACE FUNCTION cari_bakiye_guncelle() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                UPDATE cari_bakiye SET
+                    borc = borc - COALESCE(OLD.borc, 0),
+                    alacak = alacak - COALESCE(OLD.alacak, 0),
+                    hareket_sayisi = hareket_sayisi - 1
+                WHERE cari_id = OLD.cari_id;
+                -- Son hareket silindiyse bir oncekini indeksten bul
+                UPDATE cari_bakiye SET son_tarih = (
+                    SELECT MAX(tarih) FROM hareketler WHERE cari_id = OLD.cari_id
+                )
+                WHERE cari_id = OLD.cari_id AND son_tarih = OLD.tarih;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO cari_bakiye (cari_id, borc, alacak, hareket_sayisi, son_tarih)
+                VALUES (NEW.cari_id, COALESCE(NEW.borc, 0), COALESCE(NEW.alacak, 0), 1, NEW.tarih)
+                ON CONFLICT (cari_id) DO UPDATE SET
+                    borc = cari_bakiye.borc + EXCLUDED.borc,
+                    alacak = cari_bakiye.alacak + EXCLUDED.alacak,
+                    hareket_sayisi = cari_bakiye.hareket_sayisi + 1,
+                    son_tarih = GREATEST(cari_bakiye.son_tarih, EXCLUDED.son_tarih);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS trg_hareketler_bakiye ON hareketler;
+        CREATE TRIGGER trg_hareketler_bakiye
+            AFTER INSERT OR DELETE OR UPDATE OF cari_id, tarih, borc, alacak ON hareketler
+            FOR EACH ROW EXECUTE FUNCTION cari_bakiye_guncelle();
+
+        CREATE INDEX IF NOT EXISTS idx_cari_bakiye_bakiye ON cari_bakiye (bakiye);
+    """)
+    cur.execute(BAKIYE_SON_TARIH_SQL)
+
+
+# Migration 5'te degisiklik_log'a baglanan tablolar; sonradan eklenenler
+# kendi migration'larinda baglanir (BACKUP_TABLES buyudukce eski adimlar degismesin)
+LOG_TABLES_V5 = ("cariler", "urunler", "hareketler", "satislar", "odemeler")
+
+
+@migration(5, "degisiklik_log ve yedek katalogu")
+def m005_degisiklik_log(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS degisiklik_log (
+            id BIGSERIAL PRIMARY KEY,
+            tablo TEXT NOT NULL,
+            kayit_id INTEGER NOT NULL,
+            islem CHAR(1) NOT NULL,
+            xid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+            zaman TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS idx_degisiklik_log_xid ON degisiklik_log (xid);
+
+        CREATE OR REPLACE FUNCTION degisiklik_kaydet() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO degisiklik_log (tablo, kayit_id, islem)
+                VALUES (TG_TABLE_NAME, OLD.id, 'D');
+            ELSE
+                INSERT INTO degisiklik_log (tablo, kayit_id, islem)
+                VALUES (TG_TABLE_NAME, NEW.id, left(TG_OP, 1));
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE TABLE IF NOT EXISTS yedekler (
+            id SERIAL PRIMARY KEY,
+            ad TEXT NOT NULL UNIQUE,
+            tur TEXT NOT NULL,
+            temel TEXT,
+            onceki TEXT,
+            snapshot TEXT,
+            olusturma TIMESTAMPTZ NOT NULL DEFAULT now(),
+            boyut BIGINT NOT NULL DEFAULT 0,
+            satirlar JSONB,
+            manifest JSONB
+        );
+        CREATE INDEX IF NOT EXISTS idx_yedekler_temel ON yedekler (temel);
+    """)
+    for table in LOG_TABLES_V5:
+        cur.execute(f"""
+            DROP TRIGGER IF EXISTS trg_{table}_log ON {table};
+            CREATE TRIGGER trg_{table}_log
+                AFTER INSERT OR UPDATE OR DELETE ON {table}
+                FOR EACH ROW EXECUTE FUNCTION degisiklik_kaydet();
+        """)
+
+
+@migration(6, "arka plan isleri tablosu")
+def m006_isler(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS isler (
+            id SERIAL PRIMARY KEY,
+            tur TEXT NOT NULL,
+            parametre JSONB,
+            durum TEXT NOT NULL DEFAULT 'bekliyor',
+            ilerleme REAL NOT NULL DEFAULT 0,
+            mesaj TEXT,
+            sonuc JSONB,
+            hata TEXT,
+            olusturma TIMESTAMPTZ NOT NULL DEFAULT now(),
+            baslangic TIMESTAMPTZ,
+            bitis TIMESTAMPTZ,
+            guncelleme TIMESTAMPTZ NOT NULL DEFAULT now(),
+            sure_ms INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_isler_tur_olusturma ON isler (tur, olusturma);
+    """)
+
+
+@migration(7, "tetikleyiciler ifade seviyesine")
+def m007_toplu_tetikleyiciler(cur):
+    # Satir bazli tetikleyiciler toplu yuklemede her satir icin ayri UPDATE/INSERT
+    # calistiriyordu; gecis tablolari ile ifade basina tek gruplu sorgu yeterli.
+    # PostgreSQL gecis tablosu olan tetikleyicide tek olay ve kolon listesi yok
+    # sarti koydugu icin her olay ayri tetikleyici.
+    cur.execute("LOCK TABLE hareketler IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION cari_bakiye_toplu() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                UPDATE cari_bakiye b SET
+                    borc = b.borc - e.borc,
+                    alacak = b.alacak - e.alacak,
+                    hareket_sayisi = b.hareket_sayisi - e.sayi
+                FROM (
+                    SELECT cari_id, SUM(COALESCE(borc, 0)) AS borc,
+                           SUM(COALESCE(alacak, 0)) AS alacak, COUNT(*) AS sayi
+                    FROM eski GROUP BY cari_id
+                ) e
+                WHERE b.cari_id = e.cari_id;
+                -- Son hareket silindiyse bir oncekini indeksten bul
+                UPDATE cari_bakiye b SET son_tarih = (
+                    SELECT MAX(tarih) FROM hareketler h WHERE h.cari_id = b.cari_id
+                )
+                FROM (SELECT cari_id, MAX(tarih) AS son FROM eski GROUP BY cari_id) e
+                WHERE b.cari_id = e.cari_id AND b.son_tarih <= e.son;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO cari_bakiye (cari_id, borc, alacak, hareket_sayisi, son_tarih)
+                SELECT cari_id, SUM(COALESCE(borc, 0)), SUM(COALESCE(alacak, 0)),
+                       COUNT(*), MAX(tarih)
+                FROM yeni GROUP BY cari_id
+                ON CONFLICT (cari_id) DO UPDATE SET
+                    borc = cari_bakiye.borc + EXCLUDED.borc,
+                    alacak = cari_bakiye.alacak + EXCLUDED.alacak,
+                    hareket_sayisi = cari_bakiye.hareket_sayisi + EXCLUDED.hareket_sayisi,
+                    son_tarih = GREATEST(cari_bakiye.son_tarih, EXCLUDED.son_tarih);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS trg_hareketler_bakiye ON hareketler;
+        DROP TRIGGER IF EXISTS trg_hareketler_bakiye_ins ON hareketler;
+        DROP TRIGGER IF EXISTS trg_hareketler_bakiye_upd ON hareketler;
+        DROP TRIGGER IF EXISTS trg_hareketler_bakiye_del ON hareketler;
+        CREATE TRIGGER trg_hareketler_bakiye_ins
+            AFTER INSERT ON hareketler REFERENCING NEW TABLE AS yeni
+            FOR EACH STATEMENT EXECUTE FUNCTION cari_bakiye_toplu();
+        CREATE TRIGGER trg_hareketler_bakiye_upd
+            AFTER UPDATE ON hareketler REFERENCING OLD TABLE AS eski NEW TABLE AS yeni
+            FOR EACH STATEMENT EXECUTE FUNCTION cari_bakiye_toplu();
+        CREATE TRIGGER trg_hareketler_bakiye_del
+            AFTER DELETE ON hareketler REFERENCING OLD TABLE AS eski
+            FOR EACH STATEMENT EXECUTE FUNCTION cari_bakiye_toplu();
+        DROP FUNCTION IF EXISTS cari_bakiye_guncelle();
+
+        CREATE OR REPLACE FUNCTION degisiklik_kaydet_toplu() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO degisiklik_log (tablo, kayit_id, islem)
+                SELECT TG_TABLE_NAME, id, 'D' FROM eski;
+            ELSE
+                INSERT INTO degisiklik_log (tablo, kayit_id, islem)
+                SELECT TG_TABLE_NAME, id, left(TG_OP, 1) FROM yeni;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+    """)
+    for table in LOG_TABLES_V5:
+        create_log_triggers(cur, table)
+    cur.execute("DROP FUNCTION IF EXISTS degisiklik_kaydet()")
+
+
+def create_log_triggers(cur, table):
+    """Tabloyu degisiklik_log'a baglar (artimli yedekler icin, ifade seviyesinde)."""
+    cur.execute(f"""
+        DROP TRIGGER IF EXISTS trg_{table}_log ON {table};
+        DROP TRIGGER IF EXISTS trg_{table}_log_ins ON {table};
+        DROP TRIGGER IF EXISTS trg_{table}_log_upd ON {table};
+        DROP TRIGGER IF EXISTS trg_{table}_log_del ON {table};
+        CREATE TRIGGER trg_{table}_log_ins
+            AFTER INSERT ON {table} REFERENCING NEW TABLE AS yeni
+            FOR EACH STATEMENT EXECUTE FUNCTION degisiklik_kaydet_toplu();
+        CREATE TRIGGER trg_{table}_log_upd
+            AFTER UPDATE ON {table} REFERENCING NEW TABLE AS yeni
+            FOR EACH STATEMENT EXECUTE FUNCTION degisiklik_kaydet_toplu();
+        CREATE TRIGGER trg_{table}_log_del
+            AFTER DELETE ON {table} REFERENCING OLD TABLE AS eski
+            FOR EACH STATEMENT EXECUTE FUNCTION degisiklik_kaydet_toplu();
+    """)
+
+
+@migration(8, "faturalar")
+def m008_faturalar(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS faturalar (
+            id SERIAL PRIMARY KEY,
+            cari_id INTEGER NOT NULL REFERENCES cariler(id) ON DELETE CASCADE,
+            tarih TEXT NOT NULL,
+            no TEXT,
+            aciklama TEXT,
+            toplam NUMERIC NOT NULL DEFAULT 0,
+            hareket TEXT NOT NULL DEFAULT 'ozet',
+            olusturma TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS idx_faturalar_cari_tarih ON faturalar (cari_id, tarih, id);
+
+        ALTER TABLE satislar ADD COLUMN IF NOT EXISTS fatura_id INTEGER
+            REFERENCES faturalar(id) ON DELETE CASCADE;
+        CREATE INDEX IF NOT EXISTS idx_satislar_fatura ON satislar (fatura_id)
+            WHERE fatura_id IS NOT NULL;
+    """)
+    create_log_triggers(cur, "faturalar")
+
+
+@migration(9, "hareketler kaynak ve ref_id doldurma")
+def m009_hareket_kaynak(cur):
+    # kaynak + ref_id: hareketi olusturan satir (satislar / odemeler / faturalar).
+    # Eski kayitlarda bag yoktu; ayni cari/tarih/tutar gruplari id sirasiyla birebir eslenir.
+    cur.execute("""
+        ALTER TABLE hareketler ADD COLUMN IF NOT EXISTS kaynak TEXT;
+
+        UPDATE hareketler SET kaynak = CASE tur WHEN 'fatura' THEN 'faturalar' ELSE 'satislar' END
+        WHERE ref_id IS NOT NULL AND kaynak IS NULL AND tur IN ('fatura', 'satış');
+
+        UPDATE hareketler h SET kaynak = 'satislar', ref_id = m.sid
+        FROM (
+            SELECT hh.id, ss.id AS sid
+            FROM (
+                SELECT id, cari_id, tarih, borc,
+                       row_number() OVER (PARTITION BY cari_id, tarih, borc ORDER BY id) AS rn
+                FROM hareketler WHERE tur = 'satış' AND ref_id IS NULL
+            ) hh
+            JOIN (
+                SELECT s.id, s.cari_id, s.tarih, s.toplam,
+                       row_number() OVER (PARTITION BY s.cari_id, s.tarih, s.toplam ORDER BY s.id) AS rn
+                FROM satislar s
+                WHERE s.fatura_id IS NULL AND NOT EXISTS (
+                    SELECT 1 FROM hareketler x WHERE x.kaynak = 'satislar' AND x.ref_id = s.id
+                )
+            ) ss ON ss.cari_id = hh.cari_id AND ss.tarih = hh.tarih
+                AND ss.toplam = hh.borc AND ss.rn = hh.rn
+        ) m
+        WHERE h.id = m.id;
+
+        UPDATE hareketler h SET kaynak = 'odemeler', ref_id = m.oid
+        FROM (
+            SELECT hh.id, oo.id AS oid
+            FROM (
+                SELECT id, cari_id, tarih, alacak,
+                       row_number() OVER (PARTITION BY cari_id, tarih, alacak ORDER BY id) AS rn
+                FROM hareketler WHERE tur = 'ödeme' AND ref_id IS NULL
+            ) hh
+            JOIN (
+                SELECT o.id, o.cari_id, o.tarih, o.tutar,
+                       row_number() OVER (PARTITION BY o.cari_id, o.tarih, o.tutar ORDER BY o.id) AS rn
+                FROM odemeler o
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM hareketler x WHERE x.kaynak = 'odemeler' AND x.ref_id = o.id
+                )
+            ) oo ON oo.cari_id = hh.cari_id AND oo.tarih = hh.tarih
+                AND oo.tutar = hh.alacak AND oo.rn = hh.rn
+        ) m
+        WHERE h.id = m.id;
+    """)
+
+
+@migration(10, "hareketler kaynak indeksi", transactional=False)
+def m010_hareket_kaynak_indeks(cur):
+    # Her kaynak satirinin tek hareketi olur; silme/duzenleme bu indeksten gider
+    create_index_concurrently(cur, "idx_hareketler_kaynak_ref", "hareketler",
+                              "kaynak, ref_id", unique=True, where="ref_id IS NOT NULL")
+
+
+def _tarih_donustur(kolon):
+    # Eski metin tarihler: ISO (YYYY-MM-DD...) ya da GG.AA.YYYY
+    return f"""CASE WHEN {kolon} ~ '^\\d{{1,2}}\\.\\d{{1,2}}\\.\\d{{4}}$'
+                    THEN to_date({kolon}, 'DD.MM.YYYY')
+                    ELSE left({kolon}, 10)::date END"""
+
+
+@migration(11, "tarih DATE, tutarlar NUMERIC(14,2)")
+def m011_tarih_tutar_tipleri(cur):
+    # Tarihler metin karsilastirmasi yerine DATE; float ile yazilmis tutarlar
+    # (0.30000000000000004 gibi) kurusa yuvarlanir. Indeksler yeniden kurulur.
+    cur.execute("LOCK TABLE faturalar, hareketler, satislar, odemeler, cari_bakiye "
+                "IN ACCESS EXCLUSIVE MODE")
+    cur.execute(f"""
+        ALTER TABLE hareketler
+            ALTER COLUMN tarih TYPE DATE USING {_tarih_donustur("tarih")},
+            ALTER COLUMN borc TYPE NUMERIC(14,2) USING round(borc, 2),
+            ALTER COLUMN alacak TYPE NUMERIC(14,2) USING round(alacak, 2);
+        ALTER TABLE satislar
+            ALTER COLUMN tarih TYPE DATE USING {_tarih_donustur("tarih")},
+            ALTER COLUMN toplam TYPE NUMERIC(14,2) USING round(toplam, 2);
+        ALTER TABLE odemeler
+            ALTER COLUMN tarih TYPE DATE USING {_tarih_donustur("tarih")},
+            ALTER COLUMN tutar TYPE NUMERIC(14,2) USING round(tutar, 2);
+        ALTER TABLE faturalar
+            ALTER COLUMN tarih TYPE DATE USING {_tarih_donustur("tarih")},
+            ALTER COLUMN toplam TYPE NUMERIC(14,2) USING round(toplam, 2);
+
+        -- Uretilmis kolonun kaynak tipleri degisemez: bakiye dusurulup yeniden eklenir
+        ALTER TABLE cari_bakiye
+            DROP COLUMN bakiye,
+            ALTER COLUMN borc TYPE NUMERIC(16,2) USING round(borc, 2),
+            ALTER COLUMN alacak TYPE NUMERIC(16,2) USING round(alacak, 2),
+            ALTER COLUMN son_tarih TYPE DATE USING {_tarih_donustur("son_tarih")};
+        ALTER TABLE cari_bakiye
+            ADD COLUMN bakiye NUMERIC(16,2) GENERATED ALWAYS AS (borc - alacak) STORED;
+        CREATE INDEX IF NOT EXISTS idx_cari_bakiye_bakiye ON cari_bakiye (bakiye);
+    """)
+    cur.execute(BAKIYE_YENIDEN_HESAPLA_SQL)
+    # Tip donusumu degisiklik_log'a yazilmaz; sonraki yedek full alinmali
+    cur.execute("INSERT INTO yedekler (ad,tur) VALUES (%s,'sema')", (set_name("sema"),))
+
+
+@migration(12, "hareketler tarih indeksi", transactional=False)
+def m012_hareket_tarih_indeks(cur):
+    # Cari bagimsiz ay/yil araliklari (raporlar, donem sorgulari) icin
+    create_index_concurrently(cur, "idx_hareketler_tarih", "hareketler", "tarih, id")
+
+
+@migration(13, "tablo surum sayaclari")
+def m013_tablo_surum(cur):
+    # Her yazma ifadesi tablonun sayacini bir artirir; GET uclari ETag'i
+    # ana sorguyu calistirmadan bu kucuk tablodan uretir (bkz. etag_ile)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS tablo_surum (
+            tablo TEXT PRIMARY KEY,
+            surum BIGINT NOT NULL DEFAULT 1,
+            degisme TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+
+        CREATE OR REPLACE FUNCTION tablo_surum_artir() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO tablo_surum (tablo) VALUES (TG_TABLE_NAME)
+            ON CONFLICT (tablo) DO UPDATE SET
+                surum = tablo_surum.surum + 1,
+                degisme = now();
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+    """)
+    for table in ("cariler", "urunler", "faturalar", "hareketler", "satislar", "odemeler"):
+        create_surum_trigger(cur, table)
+
+
+def create_surum_trigger(cur, table):
+    cur.execute(f"""
+        INSERT INTO tablo_surum (tablo) VALUES ('{table}') ON CONFLICT DO NOTHING;
+        DROP TRIGGER IF EXISTS trg_{table}_surum ON {table};
+        CREATE TRIGGER trg_{table}_surum
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION tablo_surum_artir();
+    """)
+
+
+@migration(14, "senkronizasyon")
+def m014_senkron(cur):
+    # sinir: degisiklik_log'da bu xid'den eskisi silinmis (ya da veri geri
+    # yuklenmis) olabilir; imleci daha eski istemciler bastan yuklemeli
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS senkron_sinir (
+            id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+            sinir xid8 NOT NULL
+        );
+        INSERT INTO senkron_sinir (sinir)
+        VALUES (pg_snapshot_xmax(pg_current_snapshot()))
+        ON CONFLICT DO NOTHING;
+
+        CREATE TABLE IF NOT EXISTS istemci_islemleri (
+            istemci_id TEXT PRIMARY KEY,
+            tur TEXT NOT NULL,
+            sonuc JSONB,
+            olusturma TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS idx_istemci_islemleri_olusturma
+            ON istemci_islemleri (olusturma);
+    """)
+
+
+@migration(15, "tablo degisikligi bildirimi")
+def m015_tablo_bildirim(cur):
+    # Surec ici onbellekler (bkz. onbellek_dinleyici) LISTEN tablo_degisti ile dusurulur
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION tablo_surum_artir() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO tablo_surum (tablo) VALUES (TG_TABLE_NAME)
+            ON CONFLICT (tablo) DO UPDATE SET
+                surum = tablo_surum.surum + 1,
+                degisme = now();
+            PERFORM pg_notify('tablo_degisti', TG_TABLE_NAME);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+    """)
+
+
+# Turkce harfler ve yaygin aksanlar ASCII'ye, sonra kucuk harf. unaccent STABLE
+# oldugu (ve Supabase'de ayri semada durdugu) icin indekste kullanilamiyor.
+ARAMA_HARF_KAYNAK = "İIıÇçĞğÖöŞşÜüÂâÎîÛûÉéÈèÊêËëÁáÀàÄäÓóÒòÔôÚúÙùÑñ"
+ARAMA_HARF_HEDEF  = "iiiccggoossuuaaiiuueeeeeeeeaaaaaaoooooouuuunn"
+
+@migration(16, "arama fonksiyonlari")
+def m016_arama_fonksiyonlari(cur):
+    cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    cur.execute(f"""
+        CREATE OR REPLACE FUNCTION arama_metni(t TEXT) RETURNS TEXT AS $$
+            SELECT lower(translate(coalesce(t, ''),
+                                   '{ARAMA_HARF_KAYNAK}', '{ARAMA_HARF_HEDEF}'))
+        $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+        -- Telefon yalnizca rakamlariyla aranir: "0532 123" == "0532-123"
+        CREATE OR REPLACE FUNCTION cari_arama_metni(firma_adi TEXT, yetkili TEXT,
+                                                    telefon TEXT, email TEXT)
+        RETURNS TEXT AS $$
+            SELECT arama_metni(firma_adi) || ' ' || arama_metni(yetkili) || ' '
+                || arama_metni(email) || ' '
+                || regexp_replace(coalesce(telefon, ''), '\\D', '', 'g')
+        $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+        CREATE OR REPLACE FUNCTION urun_arama_metni(ad TEXT, kod TEXT) RETURNS TEXT AS $$
+            SELECT arama_metni(ad) || ' ' || arama_metni(kod)
+        $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+    """)
+
+
+@migration(17, "arama indeksleri", transactional=False)
+def m017_arama_indeksleri(cur):
+    create_index_concurrently(cur, "idx_cariler_arama", "cariler",
+                              "cari_arama_metni(firma_adi, yetkili, telefon, email) gin_trgm_ops",
+                              using="gin")
+    create_index_concurrently(cur, "idx_cariler_firma_trgm", "cariler",
+                              "arama_metni(firma_adi) gin_trgm_ops", using="gin")
+    create_index_concurrently(cur, "idx_urunler_arama", "urunler",
+                              "urun_arama_metni(ad, kod) gin_trgm_ops", using="gin")
+
+
+# Rapor ozet tablolari: hedef -> (kaynak tablo, {anahtar: ifade}, {toplam kolonu: ifade}).
+# Her ozette ayrica satir sayisi (satir) tutulur; 0'a dusen satir silinir.
+AY_IFADESI = "date_trunc('month', tarih)::date"
+RAPOR_OZETLERI = {
+    "rapor_aylik_satis": ("satislar",
+                          {"ay": AY_IFADESI, "cari_id": "cari_id", "urun_id": "urun_id"},
+                          {"adet": "adet", "tutar": "toplam"}),
+    "rapor_aylik_odeme": ("odemeler",
+                          {"ay": AY_IFADESI, "yontem": "COALESCE(NULLIF(yontem, ''), 'Diğer')"},
+                          {"tutar": "tutar"}),
+    "rapor_cari_aylik":  ("hareketler",
+                          {"cari_id": "cari_id", "ay": AY_IFADESI},
+                          {"borc": "COALESCE(borc, 0)", "alacak": "COALESCE(alacak, 0)"}),
+}
+
+def _ozet_upsert(hedef, kaynak, anahtarlar, degerler, isaret=""):
+    kolonlar = ", ".join([*anahtarlar, *degerler, "satir"])
+    secim = ", ".join([*anahtarlar.values(),
+                       *(f"{isaret}SUM({v})" for v in degerler.values()),
+                       f"{isaret}COUNT(*)"])
+    gruplar = ", ".join(str(i + 1) for i in range(len(anahtarlar)))
+    guncelle = ", ".join(f"{k} = {hedef}.{k} + EXCLUDED.{k}" for k in [*degerler, "satir"])
+    return f"""
+        INSERT INTO {hedef} ({kolonlar})
+        SELECT {secim} FROM {kaynak} GROUP BY {gruplar}
+        ON CONFLICT ({", ".join(anahtarlar)}) DO UPDATE SET {guncelle}"""
+
+def rapor_yeniden_hesapla(cur):
+    """
+    Ozetleri kaynak tablolardan bastan kurar (migrasyon, geri yukleme, --fix).
+    Arsivlenmis yillarin kaynak satirlari artik tabloda (ve yedekte) yok;
+    o aylarin ozet satirlari korunur, yalnizca sonraki aylar yeniden kurulur.
+    """
+    sinir = None
+    cur.execute("SELECT to_regclass('public.donemler')")
+    if cur.fetchone()[0]:
+        cur.execute("SELECT make_date(max(yil) + 1, 1, 1) FROM donemler WHERE arsiv IS NOT NULL")
+        sinir = cur.fetchone()[0]
+    for hedef, (kaynak, anahtarlar, degerler) in RAPOR_OZETLERI.items():
+        if sinir is None:
+            cur.execute(f"TRUNCATE {hedef}")
+            cur.execute(_ozet_upsert(hedef, kaynak, anahtarlar, degerler))
+        else:
+            cur.execute(f"DELETE FROM {hedef} WHERE ay >= %s", (sinir,))
+            cur.execute(_ozet_upsert(hedef, f"(SELECT * FROM {kaynak} WHERE tarih >= %(sinir)s) k",
+                                     anahtarlar, degerler), {"sinir": sinir})
+
+def create_rapor_triggers(cur, hedef):
+    """Kaynak tablodaki her ifade yalnizca etkiledigi ay/cari/urun satirlarini gunceller."""
+    kaynak, anahtarlar, degerler = RAPOR_OZETLERI[hedef]
+    eslesme = " AND ".join(f"o.{k} = e.{k}" for k in anahtarlar)
+    cur.execute(f"""
+        CREATE OR REPLACE FUNCTION {hedef}_toplu() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                {_ozet_upsert(hedef, "eski", anahtarlar, degerler, isaret="-")};
+                DELETE FROM {hedef} o
+                USING (SELECT DISTINCT {", ".join(f"{v} AS {k}" for k, v in anahtarlar.items())}
+                       FROM eski) e
+                WHERE {eslesme} AND o.satir = 0;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                {_ozet_upsert(hedef, "yeni", anahtarlar, degerler)};
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS trg_{kaynak}_rapor_ins ON {kaynak};
+        DROP TRIGGER IF EXISTS trg_{kaynak}_rapor_upd ON {kaynak};
+        DROP TRIGGER IF EXISTS trg_{kaynak}_rapor_del ON {kaynak};
+        CREATE TRIGGER trg_{kaynak}_rapor_ins
+            AFTER INSERT ON {kaynak} REFERENCING NEW TABLE AS yeni
+            FOR EACH STATEMENT EXECUTE FUNCTION {hedef}_toplu();
+        CREATE TRIGGER trg_{kaynak}_rapor_upd
+            AFTER UPDATE ON {kaynak} REFERENCING OLD TABLE AS eski NEW TABLE AS yeni
+            FOR EACH STATEMENT EXECUTE FUNCTION {hedef}_toplu();
+        CREATE TRIGGER trg_{kaynak}_rapor_del
+            AFTER DELETE ON {kaynak} REFERENCING OLD TABLE AS eski
+            FOR EACH STATEMENT EXECUTE FUNCTION {hedef}_toplu();
+    """)
+
+@migration(18, "rapor ozet tablolari")
+def m018_rapor_ozetleri(cur):
+    cur.execute("LOCK TABLE satislar, odemeler, hareketler IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute("""
+        CREATE TABLE rapor_aylik_satis (
+            ay DATE NOT NULL,
+            cari_id INTEGER NOT NULL,
+            urun_id INTEGER NOT NULL,
+            adet NUMERIC NOT NULL DEFAULT 0,
+            tutar NUMERIC(16,2) NOT NULL DEFAULT 0,
+            satir INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (ay, cari_id, urun_id)
+        );
+
+        CREATE TABLE rapor_aylik_odeme (
+            ay DATE NOT NULL,
+            yontem TEXT NOT NULL,
+            tutar NUMERIC(16,2) NOT NULL DEFAULT 0,
+            satir INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (ay, yontem)
+        );
+
+        CREATE TABLE rapor_cari_aylik (
+            cari_id INTEGER NOT NULL,
+            ay DATE NOT NULL,
+            borc NUMERIC(16,2) NOT NULL DEFAULT 0,
+            alacak NUMERIC(16,2) NOT NULL DEFAULT 0,
+            satir INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (cari_id, ay)
+        );
+    """)
+    for hedef in RAPOR_OZETLERI:
+        create_rapor_triggers(cur, hedef)
+    rapor_yeniden_hesapla(cur)
+
+
+# Yillik bolumlere ayrilan defter tablolari. Birincil anahtar bolum anahtarini
+# icermek zorunda: (id, tarih). Tarihi bolumlerin disinda kalan satirlar
+# (cok eski / ileri tarihli hatali girisler) {tablo}_diger bolumune duser.
+DONEM_TABLOLARI = ("hareketler", "satislar", "odemeler")
+DONEM_FK = {
+    "hareketler": ["FOREIGN KEY (cari_id) REFERENCES cariler(id) ON DELETE CASCADE"],
+    "satislar": ["FOREIGN KEY (cari_id) REFERENCES cariler(id) ON DELETE CASCADE",
+                 "FOREIGN KEY (urun_id) REFERENCES urunler(id) ON DELETE RESTRICT",
+                 "FOREIGN KEY (fatura_id) REFERENCES faturalar(id) ON DELETE CASCADE"],
+    "odemeler": ["FOREIGN KEY (cari_id) REFERENCES cariler(id) ON DELETE CASCADE"],
+}
+DONEM_INDEKSLERI = {
+    "hareketler": ["idx_hareketler_cari_tarih ON hareketler (cari_id, tarih, id)",
+                   "idx_hareketler_tarih ON hareketler (tarih, id)",
+                   "idx_hareketler_kaynak_ref ON hareketler (kaynak, ref_id) WHERE ref_id IS NOT NULL"],
+    "satislar": ["idx_satislar_cari_tarih ON satislar (cari_id, tarih, id)",
+                 "idx_satislar_tarih ON satislar (tarih, id)",
+                 "idx_satislar_fatura ON satislar (fatura_id) WHERE fatura_id IS NOT NULL",
+                 "idx_satislar_urun ON satislar (urun_id)"],
+    "odemeler": ["idx_odemeler_cari_tarih ON odemeler (cari_id, tarih, id)",
+                 "idx_odemeler_tarih ON odemeler (tarih, id)"],
+}
+
+@migration(19, "yillik bolumler ve donem kapanisi")
+def m019_yillik_bolumler(cur):
+    # Tablolar bolumlu kopyalarina tasinip yeniden adlandirilir; tetikleyiciler,
+    # indeksler ve FK'ler yeni ebeveyne kurulur. Bolumlu tabloda benzersiz
+    # indeks bolum anahtarini (tarih) icermek zorunda; kaynak satira tek
+    # hareket kurali (kaynak, ref_id) migrasyon 22'deki tetikleyiciyle korunur.
+    cur.execute("LOCK TABLE satislar, odemeler, hareketler IN ACCESS EXCLUSIVE MODE")
+    cur.execute("""
+        CREATE TABLE donemler (
+            id SERIAL PRIMARY KEY,
+            yil INTEGER NOT NULL UNIQUE,
+            kapanis TIMESTAMPTZ NOT NULL DEFAULT now(),
+            arsiv TIMESTAMPTZ
+        );
+
+        -- yil: bu satir o yilin acilis (bir onceki yilin kapanis) bakiyesi;
+        -- borc/alacak/hareket_sayisi o yila kadarki kumulatif toplamlar
+        CREATE TABLE devir_bakiyeleri (
+            id SERIAL PRIMARY KEY,
+            cari_id INTEGER NOT NULL REFERENCES cariler(id) ON DELETE CASCADE,
+            yil INTEGER NOT NULL,
+            borc NUMERIC(16,2) NOT NULL DEFAULT 0,
+            alacak NUMERIC(16,2) NOT NULL DEFAULT 0,
+            hareket_sayisi INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (cari_id, yil)
+        );
+
+        CREATE OR REPLACE FUNCTION donem_kilidi() RETURNS trigger AS $$
+        DECLARE
+            sinir DATE;
+            kapali DATE;
+        BEGIN
+            SELECT make_date(max(yil) + 1, 1, 1) INTO sinir FROM donemler;
+            IF sinir IS NULL THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                SELECT min(tarih) INTO kapali FROM eski WHERE tarih < sinir;
+            END IF;
+            IF kapali IS NULL AND TG_OP IN ('INSERT', 'UPDATE') THEN
+                SELECT min(tarih) INTO kapali FROM yeni WHERE tarih < sinir;
+            END IF;
+            IF kapali IS NOT NULL THEN
+                RAISE EXCEPTION '% yılı kapatıldı, bu döneme ait kayıtlar değiştirilemez',
+                    extract(year FROM kapali) USING ERRCODE = 'check_violation';
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+    """)
+
+    cur.execute(f"""
+        SELECT DISTINCT y FROM (
+            SELECT extract(year FROM tarih)::int AS y FROM hareketler
+            UNION SELECT extract(year FROM tarih)::int FROM satislar
+            UNION SELECT extract(year FROM tarih)::int FROM odemeler
+        ) t
+        WHERE y BETWEEN 1900 AND %s
+    """, (date.today().year + 1,))
+    yillar = sorted({r[0] for r in cur.fetchall()} | {date.today().year, date.today().year + 1})
+
+    for table in DONEM_TABLOLARI:
+        cur.execute(f"""
+            CREATE TABLE {table}_bolumlu (LIKE {table} INCLUDING DEFAULTS) PARTITION BY RANGE (tarih);
+            CREATE TABLE {table}_diger PARTITION OF {table}_bolumlu DEFAULT;
+        """)
+        for yil in yillar:
+            cur.execute(f"""
+                CREATE TABLE {table}_{yil} PARTITION OF {table}_bolumlu
+                FOR VALUES FROM (%s) TO (%s)
+            """, (date(yil, 1, 1), date(yil + 1, 1, 1)))
+        cur.execute(f"""
+            INSERT INTO {table}_bolumlu SELECT * FROM {table};
+            ALTER SEQUENCE {table}_id_seq OWNED BY NONE;
+            DROP TABLE {table};
+            ALTER TABLE {table}_bolumlu RENAME TO {table};
+            ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id;
+            ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, tarih);
+        """)
+        for fk in DONEM_FK[table]:
+            cur.execute(f"ALTER TABLE {table} ADD {fk}")
+        for index in DONEM_INDEKSLERI[table]:
+            cur.execute(f"CREATE INDEX {index}")
+
+        create_log_triggers(cur, table)
+        create_surum_trigger(cur, table)
+        for hedef, (kaynak, _, _) in RAPOR_OZETLERI.items():
+            if kaynak == table:
+                create_rapor_triggers(cur, hedef)
+        create_donem_triggers(cur, table)
+
+    cur.execute("""
+        CREATE TRIGGER trg_hareketler_bakiye_ins
+            AFTER INSERT ON hareketler REFERENCING NEW TABLE AS yeni
+            FOR EACH STATEMENT EXECUTE FUNCTION cari_bakiye_toplu();
+        CREATE TRIGGER trg_hareketler_bakiye_upd
+            AFTER UPDATE ON hareketler REFERENCING OLD TABLE AS eski NEW TABLE AS yeni
+            FOR EACH STATEMENT EXECUTE FUNCTION cari_bakiye_toplu();
+        CREATE TRIGGER trg_hareketler_bakiye_del
+            AFTER DELETE ON hareketler REFERENCING OLD TABLE AS eski
+            FOR EACH STATEMENT EXECUTE FUNCTION cari_bakiye_toplu();
+        CREATE TRIGGER trg_hareketler_bakiye_truncate
+            AFTER TRUNCATE ON hareketler
+            FOR EACH STATEMENT EXECUTE FUNCTION cari_bakiye_temizle();
+    """)
+    for table in ("donemler", "devir_bakiyeleri"):
+        create_log_triggers(cur, table)
+    cur.execute("ANALYZE hareketler, satislar, odemeler")
+    # Tablolar yeniden yazildi ve yedege iki tablo eklendi; sonraki yedek full alinmali
+    cur.execute("INSERT INTO yedekler (ad,tur) VALUES (%s,'sema')", (set_name("sema"),))
+
+
+def create_donem_triggers(cur, table):
+    """Kapanmis yillara (donemler) dusen ekleme / degisiklik / silmeyi reddeder."""
+    cur.execute(f"""
+        DROP TRIGGER IF EXISTS trg_{table}_donem_ins ON {table};
+        DROP TRIGGER IF EXISTS trg_{table}_donem_upd ON {table};
+        DROP TRIGGER IF EXISTS trg_{table}_donem_del ON {table};
+        CREATE TRIGGER trg_{table}_donem_ins
+            AFTER INSERT ON {table} REFERENCING NEW TABLE AS yeni
+            FOR EACH STATEMENT EXECUTE FUNCTION donem_kilidi();
+        CREATE TRIGGER trg_{table}_donem_upd
+            AFTER UPDATE ON {table} REFERENCING OLD TABLE AS eski NEW TABLE AS yeni
+            FOR EACH STATEMENT EXECUTE FUNCTION donem_kilidi();
+        CREATE TRIGGER trg_{table}_donem_del
+            AFTER DELETE ON {table} REFERENCING OLD TABLE AS eski
+            FOR EACH STATEMENT EXECUTE FUNCTION donem_kilidi();
+    """)
+
+
+@migration(20, "fiyatlar NUMERIC(14,2)")
+def m020_fiyat_tipleri(cur):
+    # Birim fiyatlar da tutarlar gibi kurusa sabitlenir; aciklamadaki
+    # "@ 1.00₺" ile borc ayni fiyattan hesaplanir
+    cur.execute("LOCK TABLE urunler, satislar IN ACCESS EXCLUSIVE MODE")
+    cur.execute("""
+        ALTER TABLE urunler
+            ALTER COLUMN fiyat TYPE NUMERIC(14,2) USING round(fiyat, 2);
+        ALTER TABLE satislar
+            ALTER COLUMN birim_fiyat TYPE NUMERIC(14,2) USING round(birim_fiyat, 2);
+    """)
+    # Tip donusumu degisiklik_log'a yazilmaz; sonraki yedek full alinmali
+    cur.execute("INSERT INTO yedekler (ad,tur) VALUES (%s,'sema')", (set_name("sema"),))
+
+
+@migration(21, "arama fonksiyonlari sema nitelikli")
+def m021_arama_fonksiyonlari_sema(cur):
+    # Indeks ifadesindeki fonksiyonlar bos search_path ile de (autovacuum,
+    # pg_dump/pg_restore, REINDEX) cozulebilmeli. SET search_path yerine
+    # nitelikli ad: SET'li SQL fonksiyonlari satir ici acilamaz (inline).
+    # Govde anlami ayni; indeksleri yeniden kurmaya gerek yok.
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION cari_arama_metni(firma_adi TEXT, yetkili TEXT,
+                                                    telefon TEXT, email TEXT)
+        RETURNS TEXT AS $$
+            SELECT public.arama_metni(firma_adi) || ' ' || public.arama_metni(yetkili) || ' '
+                || public.arama_metni(email) || ' '
+                || regexp_replace(coalesce(telefon, ''), '\\D', '', 'g')
+        $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+        CREATE OR REPLACE FUNCTION urun_arama_metni(ad TEXT, kod TEXT) RETURNS TEXT AS $$
+            SELECT public.arama_metni(ad) || ' ' || public.arama_metni(kod)
+        $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+    """)
+
+
+@migration(22, "hareketler kaynak tekilligi")
+def m022_hareket_kaynak_tekil(cur):
+    # m010'daki benzersiz (kaynak, ref_id) indeksi bolumlemeyle kalkti; ayni
+    # kural ifade seviyesinde denetlenir. Kaynak basina danisma kilidi:
+    # ayni kaynaga eszamanli ikinci ekleme ilkinin bitmesini bekler, sonra
+    # (READ COMMITTED, yeni snapshot) onun satirini gorup reddedilir.
+    cur.execute("""
+        SELECT kaynak, ref_id, count(*) FROM hareketler
+        WHERE ref_id IS NOT NULL
+        GROUP BY kaynak, ref_id HAVING count(*) > 1
+        ORDER BY kaynak, ref_id LIMIT 20
+    """)
+    tekrar = cur.fetchall()
+    if tekrar:
+        raise Exception("Ayni kaynaga birden fazla hareket var, once duzeltilmeli: "
+                        + ", ".join(f"{k}#{r} ({n})" for k, r, n in tekrar))
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION hareket_kaynak_tekil() RETURNS trigger AS $$
+        DECLARE
+            k TEXT;
+            r INTEGER;
+        BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext(t.kaynak), t.ref_id)
+            FROM (SELECT DISTINCT kaynak, ref_id FROM yeni
+                  WHERE ref_id IS NOT NULL ORDER BY 1, 2) t;
+            SELECT n.kaynak, n.ref_id INTO k, r
+            FROM yeni n
+            JOIN hareketler h ON h.kaynak = n.kaynak AND h.ref_id = n.ref_id AND h.id <> n.id
+            WHERE n.ref_id IS NOT NULL
+            LIMIT 1;
+            IF FOUND THEN
+                RAISE EXCEPTION '% #% için zaten bir hareket var', k, r
+                    USING ERRCODE = 'unique_violation';
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER trg_hareketler_kaynak_ins
+            AFTER INSERT ON hareketler REFERENCING NEW TABLE AS yeni
+            FOR EACH STATEMENT EXECUTE FUNCTION hareket_kaynak_tekil();
+        CREATE TRIGGER trg_hareketler_kaynak_upd
+            AFTER UPDATE ON hareketler REFERENCING NEW TABLE AS yeni
+            FOR EACH STATEMENT EXECUTE FUNCTION hareket_kaynak_tekil();
+    """)
+
+
+@app.cli.group("db")
+def db_cli():
+    """Veritabani sema yonetimi."""
+
+@db_cli.command("upgrade")
+@click.option("--target", type=int, default=None, help="Bu surume kadar uygula")
+def db_upgrade(target):
+    applied = migrate(target)
+    for version, name, ms in applied:
+        click.echo(f"✓ {version:03d} {name} ({ms} ms)")
+    if not applied:
+        click.echo("✓ Sema guncel")
+
+@db_cli.command("bakiye-kontrol")
+@click.option("--fix", is_flag=True, help="Farklari duzelt (ozeti yeniden hesapla)")
+def db_bakiye_kontrol(fix):
+    drift = bakiye_kontrol(fix=fix)
+    for cid, b, a, gb, ga in drift:
+        click.echo(f"cari {cid}: ozet {b}/{a} ≠ hareketler {gb}/{ga} (fark {(b - a) - (gb - ga)})")
+    if not drift:
+        click.echo("✓ Tum bakiyeler tutarli")
+    elif fix:
+        click.echo(f"✓ {len(drift)} cari duzeltildi")
+    else:
+        click.echo(f"⚠ {len(drift)} caride fark var (--fix ile duzeltin)")
+
+@db_cli.command("status")
+def db_status():
+    for version, name, applied_at in migration_status():
+        mark = applied_at.strftime("%Y-%m-%d %H:%M") if applied_at else "bekliyor"
+        click.echo(f"{version:03d} {name:<45} {mark}")
 
 # ───────────────────────────────────────────────────────
-# 🔒 BACKUP SİSTEMİ (Supabase Storage)
+# 📅 DÖNEM KAPANIŞI
 # ───────────────────────────────────────────────────────
 
-def create_backup():
-    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    filename = f"backup_{timestamp}.sql"
-    filepath = f"/tmp/{filename}"
-    print("PYTHON BACKUP CALISIYOR")
-    
-    with get_db() as conn:
+# Kapanan her yilin sonunda cari basina bir devir satiri (devir_bakiyeleri)
+# yazilir ve o yila kadarki tarihler kilitlenir (donem_kilidi). Ekstre
+# sorgulari eski bir yilda bakiyeyi o yilin bolumu + tek devir satirindan
+# bulur. Arsivlenen yillarin bolumleri ayrilip `arsiv` semasina tasinir;
+# tum zamanlar toplami son arsiv yilinin devrinden devam eder.
+
+# Carinin tum zamanlar toplami: son arsivlenen yilin devri + hareketler'de kalanlar
+HAREKET_TOPLAMLARI_SQL = """
+    SELECT COALESCE(h.cari_id, d.cari_id) AS cari_id,
+           COALESCE(d.borc, 0) + COALESCE(h.borc, 0) AS borc,
+           COALESCE(d.alacak, 0) + COALESCE(h.alacak, 0) AS alacak,
+           COALESCE(d.hareket_sayisi, 0) + COALESCE(h.sayi, 0) AS sayi
+    FROM (
+        SELECT cari_id, SUM(borc) AS borc, SUM(alacak) AS alacak, COUNT(*) AS sayi
+        FROM hareketler GROUP BY cari_id
+    ) h
+    FULL JOIN (
+        SELECT cari_id, borc, alacak, hareket_sayisi FROM devir_bakiyeleri
+        WHERE yil = (SELECT max(yil) + 1 FROM donemler WHERE arsiv IS NOT NULL)
+    ) d ON d.cari_id = h.cari_id
+"""
+
+def bakiye_yeniden_hesapla(cur):
+    cur.execute(f"""
+        INSERT INTO cari_bakiye (cari_id, borc, alacak, hareket_sayisi)
+        SELECT c.id, COALESCE(t.borc, 0), COALESCE(t.alacak, 0), COALESCE(t.sayi, 0)
+        FROM cariler c
+        LEFT JOIN ({HAREKET_TOPLAMLARI_SQL}) t ON t.cari_id = c.id
+        ON CONFLICT (cari_id) DO UPDATE SET
+            borc = EXCLUDED.borc,
+            alacak = EXCLUDED.alacak,
+            hareket_sayisi = EXCLUDED.hareket_sayisi
+    """)
+    cur.execute(BAKIYE_SON_TARIH_SQL)
+
+def bolum_olustur(cur, table, yil):
+    """
+    Tablonun yil bolumunu yoksa olusturur. O yila ait satirlar daha once
+    varsayilan bolume (_diger) dustuyse yeni bolume tasinir; bu dogrudan
+    bolum uzerinde calistigi icin ebeveyn tetikleyicileri calismaz.
+    """
+    ad = f"{table}_{yil}"
+    cur.execute("SELECT to_regclass(%s)", (f"public.{ad}",))
+    if cur.fetchone()[0]:
+        return False
+    aralik = {"bas": date(yil, 1, 1), "son": date(yil + 1, 1, 1)}
+    cur.execute(f"SELECT 1 FROM {table}_diger WHERE tarih >= %(bas)s AND tarih < %(son)s LIMIT 1",
+                aralik)
+    if not cur.fetchone():
+        cur.execute(f"CREATE TABLE {ad} PARTITION OF {table} FOR VALUES FROM (%(bas)s) TO (%(son)s)",
+                    aralik)
+        return True
+    cur.execute(f"""
+        CREATE TABLE {ad} (LIKE {table} INCLUDING DEFAULTS);
+        WITH tasinan AS (
+            DELETE FROM {table}_diger WHERE tarih >= %(bas)s AND tarih < %(son)s RETURNING *
+        )
+        INSERT INTO {ad} SELECT * FROM tasinan;
+        ALTER TABLE {table} ATTACH PARTITION {ad} FOR VALUES FROM (%(bas)s) TO (%(son)s);
+    """, aralik)
+    return True
+
+def bolumleri_hazirla():
+    """
+    Bu yil ve gelecek yilin bolumlerini hazirlar; varsayilan bolume dusmus
+    satirlari da kendi yillarinin bolumune tasir (migrasyon 19 uygulanmadiysa
+    hicbir sey yapmaz).
+    """
+    olusan = []
+    bu_yil = date.today().year
+    with get_db(transaction=True) as conn:
         cur = conn.cursor()
+        cur.execute("SELECT to_regclass('public.hareketler_diger')")
+        if not cur.fetchone()[0]:
+            return olusan
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (BOLUM_LOCK_ID,))
+        for table in DONEM_TABLOLARI:
+            cur.execute(f"""
+                SELECT DISTINCT extract(year FROM tarih)::int FROM {table}_diger
+                WHERE tarih >= '1900-01-01' AND tarih < %s
+            """, (date(bu_yil + 2, 1, 1),))
+            for yil in sorted({bu_yil, bu_yil + 1} | {y for (y,) in cur.fetchall()}):
+                if bolum_olustur(cur, table, yil):
+                    olusan.append(f"{table}_{yil}")
+    return olusan
+
+def bolumler(cur):
+    """[(tablo, bolum, satir sayisi tahmini)] — ekli bolumler, yila gore."""
+    cur.execute("""
+        SELECT p.relname, c.relname, c.reltuples::bigint
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = ANY(%s) AND p.relnamespace = 'public'::regnamespace
+        ORDER BY p.relname, c.relname
+    """, (list(DONEM_TABLOLARI),))
+    return cur.fetchall()
+
+def _donem_kilitle(cur):
+    # Kapanis / arsiv sirasinda yazma olmasin; ikinci bir kapanis da beklesin
+    cur.execute("LOCK TABLE donemler, satislar, odemeler, hareketler IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute("SELECT max(yil) FROM donemler")
+    return cur.fetchone()[0]
+
+def donem_kapat(cur, yil):
+    """
+    yil sonunu kapatir: her carinin yil sonu kumulatif toplamini yil+1'in
+    devir satiri olarak yazar. Yillar sirayla kapanir; ilk kapanista onceki
+    tum yillar da kapanmis olur. Kapanan yilin bolumu ve bir onceki devir
+    disinda hicbir sey okunmaz.
+    """
+    son = _donem_kilitle(cur)
+    if yil >= date.today().year:
+        raise ValueError("İçinde bulunulan ya da gelecek bir yıl kapatılamaz")
+    if son is not None and yil <= son:
+        raise ValueError(f"{yil} yılı zaten kapalı")
+    if son is not None and yil != son + 1:
+        raise ValueError(f"Önce {son + 1} yılı kapatılmalı")
 
-        with open(filepath, "w", encoding="utf-8") as f:
-            # public şemasındaki tabloları al
+    for table in DONEM_TABLOLARI:
+        bolum_olustur(cur, table, yil + 1)
+    aralik = {"yil": yil, "bas": date(yil, 1, 1) if son is not None else date.min,
+              "son": date(yil + 1, 1, 1)}
+    cur.execute("""
+        INSERT INTO devir_bakiyeleri (cari_id, yil, borc, alacak, hareket_sayisi)
+        SELECT cari_id, %(yil)s + 1, SUM(borc), SUM(alacak), SUM(sayi)
+        FROM (
+            SELECT cari_id, borc, alacak, hareket_sayisi AS sayi
+            FROM devir_bakiyeleri WHERE yil = %(yil)s
+            UNION ALL
+            SELECT cari_id, COALESCE(SUM(borc), 0), COALESCE(SUM(alacak), 0), COUNT(*)
+            FROM hareketler WHERE tarih >= %(bas)s AND tarih < %(son)s
+            GROUP BY cari_id
+        ) t
+        GROUP BY cari_id
+    """, aralik)
+    cariler = cur.rowcount
+    cur.execute("INSERT INTO donemler (yil) VALUES (%s)", (yil,))
+    return {"yil": yil, "cariler": cariler}
+
+def donem_ac(cur, yil):
+    """Son kapanan (arsivlenmemis) yili yeniden acar; devir satirlari silinir."""
+    son = _donem_kilitle(cur)
+    if son is None or yil != son:
+        raise ValueError("Yalnızca son kapatılan yıl yeniden açılabilir")
+    cur.execute("SELECT arsiv FROM donemler WHERE yil=%s", (yil,))
+    if cur.fetchone()[0]:
+        raise ValueError(f"{yil} yılı arşivlendi, yeniden açılamaz")
+    cur.execute("DELETE FROM devir_bakiyeleri WHERE yil=%s", (yil + 1,))
+    cur.execute("DELETE FROM donemler WHERE yil=%s", (yil,))
+    return {"yil": yil}
+
+def donem_arsivle(cur, yil):
+    """
+    yil dahil onceki tum bolumleri ebeveynden ayirir ve `arsiv` semasina
+    tasir (veri silinmez). Ayrilan bolumlerin FK'leri kaldirilir; cari/urun
+    silmek arsive dokunmaz. Yalnizca kapanisi yapilmis (devri olan) yil secilebilir.
+    """
+    son = _donem_kilitle(cur)
+    cur.execute("SELECT arsiv FROM donemler WHERE yil=%s", (yil,))
+    row = cur.fetchone()
+    if not row and son is not None and yil < son:
+        # Ilk kapanis onceki yillari da kapatir ama onlar icin ayri devir yazilmaz
+        cur.execute("SELECT min(yil), max(yil) FILTER (WHERE arsiv IS NOT NULL) FROM donemler")
+        ilk, arsivli = cur.fetchone()
+        if arsivli is not None and yil < arsivli:
+            raise ValueError(f"{yil} yılı zaten arşivlendi")
+        raise ValueError(f"{yil} yılının ayrı devri yok; en erken {ilk} yılı arşivlenebilir")
+    if not row:
+        raise ValueError(f"{yil} yılı kapatılmamış; yalnızca kapatılmış yıllar arşivlenebilir")
+    if row[0]:
+        raise ValueError(f"{yil} yılı zaten arşivlendi")
+
+    sinir = date(yil + 1, 1, 1)
+    cur.execute("CREATE SCHEMA IF NOT EXISTS arsiv")
+    ayrilan = []
+    for table in DONEM_TABLOLARI:
+        # Varsayilan bolume dusmus eski satirlar once kendi yillarinin bolumune
+        cur.execute(f"SELECT DISTINCT extract(year FROM tarih)::int FROM {table}_diger WHERE tarih < %s",
+                    (sinir,))
+        for (y,) in cur.fetchall():
+            bolum_olustur(cur, table, y)
+        for parent, bolum, _ in bolumler(cur):
+            if parent != table or not re.fullmatch(rf"{table}_\d{{4}}", bolum) or int(bolum[-4:]) > yil:
+                continue
+            cur.execute("SELECT to_regclass(%s)", (f"arsiv.{bolum}",))
+            if cur.fetchone()[0]:
+                raise ValueError(f"arsiv.{bolum} zaten var; önce taşınmalı ya da silinmeli")
+            cur.execute(f"ALTER TABLE {table} DETACH PARTITION {bolum}")
             cur.execute("""
-                SELECT tablename FROM pg_tables
-                WHERE schemaname='public'
-            """)
-            tables = cur.fetchall()
+                SELECT conname FROM pg_constraint
+                WHERE conrelid = %s::regclass AND contype = 'f'
+            """, (bolum,))
+            for (fk,) in cur.fetchall():
+                cur.execute(f"ALTER TABLE {bolum} DROP CONSTRAINT {fk}")
+            cur.execute(f"ALTER TABLE {bolum} SET SCHEMA arsiv")
+            ayrilan.append(f"arsiv.{bolum}")
+
+    cur.execute("UPDATE donemler SET arsiv = now() WHERE yil <= %s AND arsiv IS NULL", (yil,))
+    # Ayirma tetikleyici calistirmaz: ETag / onbellek ve senkron imlecleri elle dusurulur
+    cur.execute("""
+        UPDATE tablo_surum SET surum = surum + 1, degisme = now() WHERE tablo = ANY(%(t)s);
+        SELECT pg_notify('tablo_degisti', t) FROM unnest(%(t)s::text[]) t;
+    """, {"t": list(DONEM_TABLOLARI)})
+    cur.execute(SENKRON_SIFIRLA_SQL)
+    # Ayrilan satirlar degisiklik_log'a silme olarak dusmez; sonraki yedek full alinmali
+    cur.execute("INSERT INTO yedekler (ad,tur) VALUES (%s,'arsiv')", (set_name("arsiv"),))
+    return {"yil": yil, "bolumler": ayrilan}
+
+@db_cli.command("donem-kapat")
+@click.argument("yil", type=int)
+def db_donem_kapat(yil):
+    """YIL sonunu kapatir, cari devirlerini yazar ve o yila kadarki kayitlari kilitler."""
+    try:
+        with get_db(transaction=True) as conn:
+            sonuc = donem_kapat(conn.cursor(), yil)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"✓ {yil} kapatildi, {sonuc['cariler']} cari icin {yil + 1} devri yazildi")
 
-            for (table,) in tables:
-                f.write(f"\n-- TABLE: {table}\n")
+@db_cli.command("donem-ac")
+@click.argument("yil", type=int)
+def db_donem_ac(yil):
+    """Son kapatilan YIL'i yeniden acar."""
+    try:
+        with get_db(transaction=True) as conn:
+            donem_ac(conn.cursor(), yil)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"✓ {yil} yeniden acildi")
 
-                cur.execute(f"SELECT * FROM {table}")
-                rows = cur.fetchall()
+@db_cli.command("arsivle")
+@click.argument("yil", type=int)
+def db_arsivle(yil):
+    """YIL dahil onceki yillarin bolumlerini ayirip arsiv semasina tasir."""
+    try:
+        with get_db(transaction=True) as conn:
+            sonuc = donem_arsivle(conn.cursor(), yil)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for bolum in sonuc["bolumler"]:
+        click.echo(f"→ {bolum}")
+    click.echo(f"✓ {len(sonuc['bolumler'])} bolum arsivlendi")
 
-                for row in rows:
-                    values = []
-                    for val in row:
-                        if val is None:
-                            values.append("NULL")
-                        elif isinstance(val, str):
-                            values.append("'" + val.replace("'", "''") + "'")
-                        else:
-                            values.append(str(val))
+@db_cli.command("bolumler")
+def db_bolumler():
+    """Bu yil ve gelecek yilin bolumlerini hazirlar, ekli bolumleri listeler."""
+    for ad in bolumleri_hazirla():
+        click.echo(f"✓ {ad} olusturuldu")
+    with get_db() as conn:
+        cur = conn.cursor()
+        for parent, bolum, satir in bolumler(cur):
+            click.echo(f"{parent:<12} {bolum:<20} ~{max(satir, 0)} satir")
+        cur.execute("SELECT yil, kapanis, arsiv FROM donemler ORDER BY yil")
+        for yil, kapanis, arsiv in cur.fetchall():
+            durum = f"arsiv {arsiv:%Y-%m-%d}" if arsiv else "kapali"
+            click.echo(f"{yil} {durum} (kapanis {kapanis:%Y-%m-%d})")
 
-                    values_str = ", ".join(values)
-                    f.write(f"INSERT INTO {table} VALUES ({values_str});\n")
 
-    return filename, filepath
+# ───────────────────────────────────────────────────────
+# 🔒 BACKUP SİSTEMİ (Supabase Storage)
+# ───────────────────────────────────────────────────────
 
+class StreamPipe:
+    """
+    COPY ciktisini gzip'leyip sinirli bir kuyruk uzerinden HTTP yuklemeye
+    aktarir. Uretici (psycopg2 copy_expert) write() cagirir, tuketici
+    (requests) iter() ile okur; bellekte en fazla birkac parca bulunur.
+    """
+    CHUNK = 256 * 1024
+    _ABORT = object()
 
-def upload_to_supabase(filename, path):
-    url = f"{SUPABASE_URL}/storage/v1/object/{BUCKET}/{filename}"
+    def __init__(self, maxsize=8, level=6):
+        self._q = queue.Queue(maxsize)
+        self._buf = bytearray()
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 → gzip basligi
+        self._done = threading.Event()
+        self.sha256 = hashlib.sha256()
+        self.size = 0
 
-    headers = {
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-        "Content-Type": "text/plain"
-    }
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._buf += self._z.compress(data)
+        if len(self._buf) >= self.CHUNK:
+            self._emit()
 
-    with open(path, "rb") as f:
-        r = requests.post(url, headers=headers, data=f)
+    def _emit(self):
+        if not self._buf:
+            return
+        chunk = bytes(self._buf)
+        self._buf.clear()
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+        self._put(chunk)
 
+    def _put(self, item):
+        while not self._done.is_set():
+            try:
+                self._q.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+        raise IOError("Yukleme yarida kesildi")
+
+    def finish(self):
+        self._buf += self._z.flush()
+        self._emit()
+        self._put(None)
+
+    def cancel(self):
+        # Tuketici vazgecti (yukleme hatasi); uretici beklemeyi birakir
+        self._done.set()
+
+    def fail(self):
+        # Tuketiciyi hatayla bitir ki yarim dosya basarili yukleme sayilmasin
+        try:
+            self._put(self._ABORT)
+        except IOError:
+            pass
+
+    def __iter__(self):
+        try:
+            while True:
+                chunk = self._q.get()
+                if chunk is None:
+                    return
+                if chunk is self._ABORT:
+                    raise IOError("Yedek akisi iptal edildi")
+                yield chunk
+        finally:
+            self._done.set()
+
+
+def storage_url(path):
+    return f"{SUPABASE_URL}/storage/v1/object/{BUCKET}/{path}"
+
+def storage_headers(content_type=None):
+    headers = {"Authorization": f"Bearer {SUPABASE_KEY}"}
+    if content_type:
+        headers["Content-Type"] = content_type
+    return headers
+
+def storage_upload(path, data, content_type):
+    r = requests.post(storage_url(path), headers=storage_headers(content_type), data=data)
     if r.status_code not in [200, 201]:
         raise Exception(r.text)
 
+def storage_upload_stream(path, pipe, content_type):
+    """Pipe'i ayri bir thread'de chunked transfer ile yukler."""
+    result = {}
+
+    def run():
+        try:
+            r = requests.post(storage_url(path), headers=storage_headers(content_type),
+                              data=iter(pipe))
+            if r.status_code not in [200, 201]:
+                result["error"] = r.text
+        except Exception as e:
+            result["error"] = str(e)
+        finally:
+            pipe.cancel()
+
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+    return t, result
+
+def table_columns(cur, table):
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema='public' AND table_name=%s AND is_generated='NEVER'
+        ORDER BY ordinal_position
+    """, (table,))
+    return [r[0] for r in cur.fetchall()]
+
+def copy_to_storage(cur, select_sql, path):
+    """
+    Sorgu sonucunu COPY TO STDOUT ile okuyup gzip'li CSV olarak dogrudan
+    Storage'a yukler. Gecici dosya yok; {rows, bytes, sha256} dondurur.
+    """
+    copy_sql = f"COPY ({select_sql}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+    pipe = StreamPipe()
+    t, result = storage_upload_stream(path, pipe, "application/gzip")
+    try:
+        cur.copy_expert(copy_sql, pipe)
+        pipe.finish()
+    except Exception:
+        pipe.fail()
+        t.join()
+        raise
+    t.join()
+    if "error" in result:
+        raise Exception(f"{path} yuklenemedi: {result['error']}")
+
+    rows = cur.rowcount
+    if rows is None or rows < 0:
+        cur.execute(f"SELECT count(*) FROM ({select_sql}) q")
+        rows = cur.fetchone()[0]
+    return {"file": path, "rows": rows, "bytes": pipe.size, "sha256": pipe.sha256.hexdigest()}
+
+def set_name(prefix):
+    # Ayni saniyede iki set (zamanlanmis + elle) birbirinin dosyalarini ezmesin
+    return f"{prefix}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')[:-3]}"
+
+def backup_plan(cur, kind):
+    """
+    Yeni yedegin turunu ve zincirini belirler.
+    kind="auto": son full'den sonra BACKUP_MAX_CHAIN'den az artimli varsa
+    artimli, yoksa (ya da son islem geri yukleme / sema degisikligi ise) full.
+    """
+    cur.execute("""
+        SELECT ad, tur, temel, snapshot FROM yedekler
+        ORDER BY id DESC LIMIT 1
+    """)
+    last = cur.fetchone()
+    if kind == "full" or not last or last[1] not in ("full", "incremental"):
+        if kind == "incremental":
+            raise Exception("Artimli yedek icin once full yedek gerekli")
+        return {"type": "full"}
+
+    base = last[2] or last[0]
+    cur.execute("SELECT count(*) FROM yedekler WHERE temel=%s", (base,))
+    chain = cur.fetchone()[0]
+    if kind == "auto" and chain >= BACKUP_MAX_CHAIN:
+        return {"type": "full"}
+    return {"type": "incremental", "base": base, "parent": last[0], "parent_snapshot": last[3]}
+
+def create_backup(kind="auto", progress=None):
+    """
+    Veri tablolarini tek bir tutarli snapshot'tan yedekler:
+        backup_<zaman>/<tablo>.csv.gz          (COPY CSV, gzip)
+        backup_<zaman>/<tablo>.deleted.csv.gz  (artimli: silinen id'ler)
+        backup_<zaman>/manifest.json           (tur, zincir, satir sayisi, sha256)
+
+    Artimli yedek, bir onceki yedegin snapshot'inda gorunmeyen
+    transaction'larin degisiklik_log kayitlarindan yalnizca degisen
+    satirlarin guncel halini ve silinen id'leri alir.
+    Manifest en son yazilir; manifest'i olmayan set yarim kalmis sayilir.
+    """
+    report = progress or (lambda event: None)
+    name = set_name("backup")
+    started = time.monotonic()
+
+    with get_db(transaction=True) as conn:
+        cur = conn.cursor()
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        cur.execute("SELECT pg_current_snapshot()::text, pg_try_advisory_xact_lock(%s)",
+                    (BACKUP_LOCK_ID,))
+        snapshot, locked = cur.fetchone()
+        if not locked:
+            raise Exception("Baska bir yedekleme suruyor")
+
+        plan = backup_plan(cur, kind)
+        manifest = {
+            "format": 2,
+            "name": name,
+            "type": plan["type"],
+            "base": plan.get("base"),
+            "parent": plan.get("parent"),
+            "snapshot": snapshot,
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "tables": [],
+        }
+
+        # Sadece veri tablolari, bagimlilik sirasiyla (ozet/sistem tablolari haric)
+        for i, table in enumerate(BACKUP_TABLES):
+            report({"stage": "table", "table": table,
+                    "percent": round(i * 100 / len(BACKUP_TABLES), 1)})
+            columns = table_columns(cur, table)
+            cols = ", ".join(columns)
+            path = f"{name}/{table}.csv.gz"
+
+            if plan["type"] == "full":
+                info = copy_to_storage(cur, f"SELECT {cols} FROM {table}", path)
+                manifest["tables"].append({"name": table, "columns": columns, **info})
+                continue
+
+            degisen = cur.mogrify("""
+                SELECT DISTINCT kayit_id FROM degisiklik_log
+                WHERE tablo=%s
+                  AND xid >= pg_snapshot_xmin(%s::pg_snapshot)
+                  AND NOT pg_visible_in_snapshot(xid, %s::pg_snapshot)
+            """, (table, plan["parent_snapshot"], plan["parent_snapshot"])).decode()
+            info = copy_to_storage(
+                cur, f"SELECT {cols} FROM {table} WHERE id IN ({degisen})", path
+            )
+            deleted = copy_to_storage(
+                cur,
+                f"SELECT d.kayit_id AS id FROM ({degisen}) d "
+                f"WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.id = d.kayit_id)",
+                f"{name}/{table}.deleted.csv.gz"
+            )
+            manifest["tables"].append({"name": table, "columns": columns, **info, "deleted": deleted})
+
+    manifest["duration_ms"] = int((time.monotonic() - started) * 1000)
+    storage_upload(f"{name}/manifest.json", json.dumps(manifest).encode("utf-8"), "application/json")
+    catalog_add(manifest)
+    prune_backups()
+    report({"stage": "done", "percent": 100.0})
+    return manifest
+
+def manifest_files(manifest):
+    files = [f"{manifest['name']}/manifest.json"]
+    for t in manifest.get("tables", []):
+        files.append(t["file"])
+        if t.get("deleted"):
+            files.append(t["deleted"]["file"])
+    return files
+
+def manifest_bytes(manifest):
+    return sum(t["bytes"] + (t.get("deleted") or {}).get("bytes", 0)
+               for t in manifest.get("tables", []))
+
+def catalog_add(manifest):
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO yedekler (ad,tur,temel,onceki,snapshot,boyut,satirlar,manifest)
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
+        """, (
+            manifest["name"],
+            manifest["type"],
+            manifest.get("base"),
+            manifest.get("parent"),
+            manifest["snapshot"],
+            manifest_bytes(manifest),
+            json.dumps({t["name"]: t["rows"] for t in manifest["tables"]}),
+            json.dumps(manifest)
+        ))
+        if manifest["type"] == "full":
+            # Bu snapshot'tan once biten degisiklikler artik hicbir artimliya
+            # gerekmez; delta senkron icin son SYNC_LOG_DAYS gun yine de tutulur
+            cur.execute("""
+                WITH s AS (
+                    SELECT LEAST(
+                        pg_snapshot_xmin(%s::pg_snapshot),
+                        (SELECT min(xid) FROM degisiklik_log
+                         WHERE zaman >= now() - make_interval(days => %s))
+                    ) AS sinir
+                ),
+                silinen AS (
+                    DELETE FROM degisiklik_log WHERE xid < (SELECT sinir FROM s)
+                )
+                UPDATE senkron_sinir SET sinir = GREATEST(sinir, (SELECT sinir FROM s))
+            """, (manifest["snapshot"], SYNC_LOG_DAYS))
+
+def storage_delete(paths):
+    r = requests.delete(f"{SUPABASE_URL}/storage/v1/object/{BUCKET}",
+                        headers=storage_headers("application/json"),
+                        data=json.dumps({"prefixes": paths}))
+    if r.status_code not in [200, 201]:
+        raise Exception(r.text)
+
+def prune_backups(keep_full=None):
+    """Son `keep_full` full seti ve onlara bagli artimlilari tutar, gerisini siler."""
+    keep_full = BACKUP_KEEP_FULL if keep_full is None else keep_full
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT ad FROM yedekler WHERE tur='full'
+            ORDER BY id DESC OFFSET %s
+        """, (keep_full,))
+        old = [r[0] for r in cur.fetchall()]
+        if not old:
+            return []
+        cur.execute("""
+            SELECT ad, manifest FROM yedekler
+            WHERE ad = ANY(%s) OR temel = ANY(%s)
+        """, (old, old))
+        sets = cur.fetchall()
+
+    pruned = []
+    for ad, manifest in sets:
+        storage_delete(manifest_files(manifest))
+        with get_db() as conn:
+            conn.cursor().execute("DELETE FROM yedekler WHERE ad=%s", (ad,))
+        pruned.append(ad)
+    return pruned
+
+
+class BackupNotFound(Exception):
+    pass
+
+
+class GunzipReader:
+    """
+    HTTP parcalarini okurken gzip'i acan file-like nesne (copy_expert icin).
+    Sikistirilmis baytlarin sha256'sini de hesaplar.
+    """
+
+    def __init__(self, chunks, on_bytes=None):
+        self._chunks = iter(chunks)
+        self._z = zlib.decompressobj(31)
+        self._buf = b""
+        self._eof = False
+        self._on_bytes = on_bytes
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def read(self, n=-1):
+        while not self._eof and (n < 0 or len(self._buf) < n):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._buf += self._z.flush()
+                self._eof = True
+                break
+            self.sha256.update(chunk)
+            self.size += len(chunk)
+            self._buf += self._z.decompress(chunk)
+            if self._on_bytes:
+                self._on_bytes(self.size)
+        if n < 0:
+            out, self._buf = self._buf, b""
+        else:
+            out, self._buf = self._buf[:n], self._buf[n:]
+        return out
+
+
+def storage_get(path, stream=False):
+    r = requests.get(storage_url(path), headers=storage_headers(), stream=stream)
+    if r.status_code in (400, 404):
+        raise BackupNotFound(path)
+    if r.status_code != 200:
+        raise Exception(r.text)
+    return r
+
+def reset_sequences(cur, tables):
+    # TRUNCATE ... RESTART IDENTITY sonrasi SERIAL'lar yuklenen en buyuk id'den devam etsin
+    for table in tables:
+        cur.execute(f"""
+            SELECT setval(pg_get_serial_sequence('{table}', 'id'),
+                          COALESCE(MAX(id), 0) + 1, false)
+            FROM {table}
+        """)
+
+# Geri yuklemeden once alinmis senkron imlecleri gecersiz olur (tam yukleme)
+SENKRON_SIFIRLA_SQL = """
+    UPDATE senkron_sinir SET sinir = GREATEST(sinir, pg_snapshot_xmax(pg_current_snapshot()))
+"""
+
+def truncate_data_tables(cur):
+    # Suren bir yedeklemenin bitmesini bekle: COPY TO ile TRUNCATE tablolari
+    # ters sirada kilitledigi icin aksi halde kilitlenme (deadlock) olur
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (BACKUP_LOCK_ID,))
+    cur.execute("""
+        TRUNCATE TABLE
+        devir_bakiyeleri,
+        donemler,
+        hareketler,
+        satislar,
+        odemeler,
+        faturalar,
+        urunler,
+        cariler
+        RESTART IDENTITY CASCADE
+    """)
+
+def set_user_triggers(cur, enabled):
+    # Bakiye ve degisiklik_log tetikleyicileri (FK tetikleyicileri haric)
+    action = "ENABLE" if enabled else "DISABLE"
+    for table in BACKUP_TABLES:
+        cur.execute(f"ALTER TABLE {table} {action} TRIGGER USER")
+
+def backup_chain(name):
+    """Hedef sete kadar uygulanacak manifestler: [full, artimli..., hedef]."""
+    chain = [storage_get(f"{name}/manifest.json").json()]
+    while chain[0].get("type", "full") == "incremental":
+        chain.insert(0, storage_get(f"{chain[0]['parent']}/manifest.json").json())
+    return chain
+
+def copy_from_storage(cur, entry, target, columns, on_bytes):
+    """gzip'li CSV'yi Storage'dan akitip COPY FROM STDIN ile yukler, dogrular."""
+    r = storage_get(entry["file"], stream=True)
+    reader = GunzipReader(r.iter_content(256 * 1024), on_bytes=on_bytes)
+    cur.copy_expert(
+        f"COPY {target} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, HEADER true)",
+        reader, size=64 * 1024
+    )
+    rows = cur.rowcount
+    if rows is None or rows < 0:
+        cur.execute(f"SELECT count(*) FROM {target}")
+        rows = cur.fetchone()[0]
+
+    if reader.sha256.hexdigest() != entry["sha256"]:
+        raise Exception(f"{entry['file']}: sha256 uyusmuyor, yedek bozuk")
+    if rows != entry["rows"]:
+        raise Exception(f"{entry['file']}: {rows} satir yuklendi, manifest {entry['rows']} diyor")
+    return rows
+
+def apply_incremental(cur, manifest, on_bytes):
+    """
+    Artimli seti uygular: once silinenler (cocuk tablolardan baslayarak),
+    sonra degisen satirlar gecici tablodan upsert (ebeveynlerden baslayarak).
+    """
+    tables = {t["name"]: t for t in manifest["tables"]}
+    for table in reversed(BACKUP_TABLES):
+        t = tables.get(table)
+        if not t or not t["deleted"]["rows"]:
+            continue
+        cur.execute("CREATE TEMP TABLE _silinen (id INTEGER) ON COMMIT DROP")
+        copy_from_storage(cur, t["deleted"], "_silinen", ["id"], on_bytes)
+        cur.execute(f"DELETE FROM {table} WHERE id IN (SELECT id FROM _silinen)")
+        cur.execute("DROP TABLE _silinen")
+
+    for table in BACKUP_TABLES:
+        t = tables.get(table)
+        if not t or not t["rows"]:
+            continue
+        cols = t["columns"]
+        cur.execute(f"CREATE TEMP TABLE _degisen (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+        copy_from_storage(cur, t, "_degisen", cols, on_bytes)
+        anahtar = ["id"]
+        if table in DONEM_TABLOLARI:
+            # Bolumlu tabloda anahtar (id, tarih); tarihi degisen satirin eskisi baska bolumde
+            anahtar.append("tarih")
+            cur.execute(f"DELETE FROM {table} t USING _degisen d WHERE t.id = d.id AND t.tarih <> d.tarih")
+        updates = ", ".join(f"{c}=EXCLUDED.{c}" for c in cols if c not in anahtar)
+        cur.execute(f"""
+            INSERT INTO {table} ({', '.join(cols)})
+            SELECT {', '.join(cols)} FROM _degisen
+            ON CONFLICT ({', '.join(anahtar)}) DO UPDATE SET {updates}
+        """)
+        cur.execute("DROP TABLE _degisen")
+
+def restore_backup_set(name, progress=None):
+    """
+    Bir yedek setini tek transaction icinde geri yukler. Hedef artimli ise
+    bagli oldugu full set ve aradaki artimlilar sirayla uygulanir:
+    TRUNCATE → full tablolar COPY FROM STDIN → artimlilar (sil + upsert)
+    → manifest ile satir sayisi / sha256 kontrolu → sequence ve bakiye ozeti.
+    Herhangi bir adim hata verirse veritabani hic degismemis olur.
+
+    progress(dict) verilirse set/tablo bazinda ilerleme bildirilir.
+    """
+    report = progress or (lambda event: None)
+    chain = backup_chain(name)
+    total_bytes = sum(manifest_bytes(m) for m in chain) or 1
+    done = {"bytes": 0}
+    started = time.monotonic()
+    result = {}
+
+    def on_bytes_from(base, label):
+        def on_bytes(n):
+            report({"stage": "bytes", "table": label,
+                    "percent": round((base + n) * 100 / total_bytes, 1)})
+        return on_bytes
+
+    with get_db(transaction=True) as conn:
+        cur = conn.cursor()
+        truncate_data_tables(cur)
+        # Satir bazli tetikleyiciler yerine bakiye ozeti en sonda toplu hesaplanir
+        set_user_triggers(cur, False)
+
+        for i, manifest in enumerate(chain):
+            report({"stage": "set", "set": manifest["name"], "index": i, "count": len(chain)})
+            for t in manifest["tables"]:
+                if t["name"] not in BACKUP_TABLES:
+                    raise Exception(f"Bilinmeyen tablo: {t['name']}")
+
+            if manifest.get("type", "full") == "full":
+                for t in manifest["tables"]:
+                    report({"stage": "table", "table": t["name"],
+                            "percent": round(done["bytes"] * 100 / total_bytes, 1)})
+                    copy_from_storage(cur, t, t["name"], t["columns"],
+                                      on_bytes_from(done["bytes"], t["name"]))
+                    done["bytes"] += t["bytes"]
+            else:
+                apply_incremental(cur, manifest, on_bytes_from(done["bytes"], manifest["name"]))
+                done["bytes"] += manifest_bytes(manifest)
+
+        set_user_triggers(cur, True)
+        reset_sequences(cur, BACKUP_TABLES)
+        bakiye_yeniden_hesapla(cur)
+        rapor_yeniden_hesapla(cur)
+
+        for table in BACKUP_TABLES:
+            cur.execute(f"SELECT count(*) FROM {table}")
+            result[table] = cur.fetchone()[0]
+
+        # Geri yuklenen veri eski zincirden farkli; sonraki yedek full olmali
+        cur.execute("""
+            INSERT INTO yedekler (ad,tur,onceki,snapshot)
+            VALUES (%s,'restore',%s,pg_current_snapshot()::text)
+        """, (set_name("restore"), name))
+        cur.execute(SENKRON_SIFIRLA_SQL)
+
+    report({"stage": "done", "percent": 100.0})
+    return {
+        "file": name,
+        "sets": [m["name"] for m in chain],
+        "tables": result,
+        "duration_ms": int((time.monotonic() - started) * 1000),
+    }
+
+def restore_legacy_sql(filename):
+    """Eski INSERT metni (.sql) yedekleri: tek transaction, tek execute."""
+    sql_content = storage_get(filename).text
+    started = time.monotonic()
+    with get_db(transaction=True) as conn:
+        cur = conn.cursor()
+        truncate_data_tables(cur)
+        set_user_triggers(cur, False)
+        # ";" ile bolmek aciklama icindeki ";" karakterlerini bozuyordu
+        cur.execute(sql_content)
+        set_user_triggers(cur, True)
+        reset_sequences(cur, BACKUP_TABLES)
+        bakiye_yeniden_hesapla(cur)
+        rapor_yeniden_hesapla(cur)
+        cur.execute("""
+            INSERT INTO yedekler (ad,tur,onceki,snapshot)
+            VALUES (%s,'restore',%s,pg_current_snapshot()::text)
+        """, (set_name("restore"), filename))
+        cur.execute(SENKRON_SIFIRLA_SQL)
+    return {"file": filename, "duration_ms": int((time.monotonic() - started) * 1000)}
+
+def list_backup_catalog():
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT ad, tur, temel, onceki, olusturma, boyut, satirlar
+            FROM yedekler
+            ORDER BY id DESC
+        """)
+        return rows_to_dicts(cur)
+
+@db_cli.command("backup")
+@click.option("--kind", type=click.Choice(["auto", "full", "incremental"]), default="auto")
+def db_backup(kind):
+    """Yedek alir (varsayilan: gerekiyorsa full, degilse artimli)."""
+    manifest = create_backup(kind)
+    click.echo(f"✓ {manifest['name']} ({manifest['type']}, {manifest_bytes(manifest)} bayt, "
+               f"{manifest['duration_ms']} ms)")
+
+@db_cli.command("restore")
+@click.argument("name")
+def db_restore(name):
+    """Yedek setini (backup_<zaman>) geri yukler; artimli ise zinciriyle."""
+    last = {}
+
+    def progress(event):
+        if event["stage"] == "set":
+            click.echo(f"⇢ {event['set']} ({event['index'] + 1}/{event['count']})")
+        elif event["stage"] == "table":
+            click.echo(f"→ {event['table']} %{event['percent']}")
+        elif event["stage"] == "bytes" and event["percent"] != last.get("percent"):
+            last["percent"] = event["percent"]
+            click.echo(f"  %{event['percent']}")
+
+    result = restore_backup_set(name, progress=progress)
+    for table, rows in result["tables"].items():
+        click.echo(f"✓ {table}: {rows} satir")
+    click.echo(f"✓ Geri yukleme tamam ({result['duration_ms']} ms)")
+
+@db_cli.command("prune")
+@click.option("--keep", type=int, default=None, help="Tutulacak full set sayisi")
+def db_prune(keep):
+    for ad in prune_backups(keep):
+        click.echo(f"✗ {ad} silindi")
+
+
+# ───────────────────────────────────────────────────────
+# ARKA PLAN İŞLERİ
+# ───────────────────────────────────────────────────────
+#
+# Yedekleme / geri yukleme istek icinde degil, surec icindeki bir thread
+# havuzunda calisir. Durum "isler" tablosunda tutulur; boylece hangi
+# worker'a gelirse gelsin /api/jobs/<id> ayni sonucu verir.
+
+_executor = None
+_executor_lock = threading.Lock()
+_background_started = False
+
+def job_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="is")
+    return _executor
+
+def _job_backup(params, progress):
+    manifest = create_backup(params.get("tur", "auto"), progress=progress)
+    return {
+        "file": manifest["name"],
+        "type": manifest["type"],
+        "tables": {t["name"]: t["rows"] for t in manifest["tables"]},
+        "bytes": manifest_bytes(manifest),
+        "duration_ms": manifest["duration_ms"],
+    }
+
+def _job_restore(params, progress):
+    name = params["name"]
+    if name.endswith(".sql"):
+        return restore_legacy_sql(name)
+    return restore_backup_set(name, progress=progress)
+
+JOB_TYPES = {
+    "backup": _job_backup,
+    "restore": _job_restore,
+}
+
+def update_job(job_id, **fields):
+    sets = ", ".join(f"{k}=%s" for k in fields)
+    with get_db() as conn:
+        conn.cursor().execute(
+            f"UPDATE isler SET {sets}, guncelleme=now() WHERE id=%s",
+            list(fields.values()) + [job_id]
+        )
+
+def run_job(job_id, tur, params):
+    started = time.monotonic()
+    update_job(job_id, durum="calisiyor", baslangic=datetime.utcnow())
+    last = {"t": 0.0}
+
+    def progress(event):
+        # Ilerleme DB'ye en fazla saniyede bir yazilir
+        now = time.monotonic()
+        if event.get("stage") != "done" and now - last["t"] < 1:
+            return
+        last["t"] = now
+        mesaj = event.get("table") or event.get("set") or event.get("stage")
+        update_job(job_id, ilerleme=event.get("percent", 0), mesaj=mesaj)
+
+    try:
+        result = JOB_TYPES[tur](params, progress)
+        update_job(job_id, durum="tamam", ilerleme=100, sonuc=json.dumps(result, default=str),
+                   bitis=datetime.utcnow(), sure_ms=int((time.monotonic() - started) * 1000))
+        IS_SURESI.gozlem(time.monotonic() - started, tur, "tamam")
+    except Exception as e:
+        print(f"⚠ is {job_id} ({tur}) hatasi: {e}")
+        IS_SURESI.gozlem(time.monotonic() - started, tur, "hata")
+        update_job(job_id, durum="hata", hata=str(e),
+                   bitis=datetime.utcnow(), sure_ms=int((time.monotonic() - started) * 1000))
+
+def create_job(cur, tur, params):
+    cur.execute("""
+        INSERT INTO isler (tur, parametre) VALUES (%s, %s) RETURNING id
+    """, (tur, json.dumps(params)))
+    return cur.fetchone()[0]
+
+def submit_job(tur, params):
+    with get_db() as conn:
+        job_id = create_job(conn.cursor(), tur, params)
+    job_executor().submit(run_job, job_id, tur, params)
+    return job_id
+
+def schedule_due_backup():
+    """Son BACKUP_INTERVAL_MINUTES icinde yedek isi yoksa yenisini baslatir."""
+    with get_db(transaction=True) as conn:
+        cur = conn.cursor()
+        # Birden fazla worker/replica ayni anda karar vermesin
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (SCHEDULER_LOCK_ID,))
+        if not cur.fetchone()[0]:
+            return None
+        cur.execute("""
+            SELECT 1 FROM isler
+            WHERE tur='backup' AND olusturma > now() - make_interval(mins => %s)
+            LIMIT 1
+        """, (BACKUP_INTERVAL_MINUTES,))
+        if cur.fetchone():
+            return None
+        params = {"tur": "auto", "zamanlanmis": True}
+        job_id = create_job(cur, "backup", params)
+    job_executor().submit(run_job, job_id, "backup", params)
+    return job_id
+
+def backup_scheduler():
+    while True:
+        time.sleep(60)
+        try:
+            job_id = schedule_due_backup()
+            if job_id:
+                print(f"✓ Zamanlanmis yedek basladi (is {job_id})")
+        except Exception as e:
+            print(f"⚠ Zamanlayici hatasi: {e}")
+
+def start_background():
+    """
+    Eksik yil bolumlerini olusturur, onbellek dinleyicisini ve zamanlanmis
+    yedeklemeyi baslatir. Gunicorn'da gunicorn.conf.py icindeki
+    post_worker_init, dogrudan calistirmada __main__ cagirir; flask CLI
+    komutlari calistirmaz.
+    """
+    global _background_started
+    if _background_started:
+        return
+    _background_started = True
+    threading.Thread(target=onbellek_dinleyici, name="onbellek-dinleyici", daemon=True).start()
+    try:
+        for ad in bolumleri_hazirla():
+            print(f"✓ {ad} bolumu olusturuldu")
+    except Exception as e:
+        print(f"⚠ bolum hazirlama hatasi: {e}")
+    if BACKUP_INTERVAL_MINUTES > 0 and SUPABASE_URL and SUPABASE_KEY:
+        threading.Thread(target=backup_scheduler, name="yedek-zamanlayici", daemon=True).start()
+
+def job_dict(row):
+    # Uzun suredir ilerleme yazmayan "calisiyor" isi, surecin oldugu anlamina gelir
+    if row.pop("bayat") and row["durum"] == "calisiyor":
+        row["durum"] = "kesildi"
+    return row
+
+JOB_SELECT = """
+    SELECT id, tur, parametre, durum, ilerleme, mesaj, sonuc, hata,
+           olusturma, baslangic, bitis, sure_ms,
+           guncelleme < now() - interval '10 minutes' AS bayat
+    FROM isler
+"""
+
+@app.route("/api/jobs/backup", methods=["POST"])
+@token_required
+def api_job_backup():
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        return jsonify({"error": "Supabase config missing"}), 500
+    kind = (request.get_json(silent=True) or {}).get("tur") or request.args.get("tur", "auto")
+    if kind not in ("auto", "full", "incremental"):
+        return jsonify({"error": "Gecersiz yedek turu"}), 400
+    return jsonify({"job_id": submit_job("backup", {"tur": kind})}), 202
+
+@app.route("/api/jobs/restore", methods=["POST"])
+@token_required
+def api_job_restore():
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        return jsonify({"error": "Supabase config missing"}), 500
+    name = (request.get_json(silent=True) or {}).get("name") or request.args.get("name")
+    if not name:
+        return jsonify({"error": "Yedek adi zorunludur"}), 400
+    if not name.endswith(".sql"):
+        try:
+            storage_get(f"{name}/manifest.json")
+        except BackupNotFound:
+            return jsonify({"error": "Backup file not found"}), 404
+    return jsonify({"job_id": submit_job("restore", {"name": name})}), 202
+
+@app.route("/api/jobs")
+@token_required
+def api_jobs():
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute(JOB_SELECT + " ORDER BY id DESC LIMIT %s", (page_limit(20, 100),))
+        rows = rows_to_dicts(cur)
+    return jsonify([job_dict(r) for r in rows])
+
+@app.route("/api/jobs/<int:job_id>")
+@token_required
+def api_job(job_id):
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute(JOB_SELECT + " WHERE id=%s", (job_id,))
+        rows = rows_to_dicts(cur)
+    if not rows:
+        return jsonify({"error": "Is bulunamadi"}), 404
+    return jsonify(job_dict(rows[0]))
 
 @app.route("/backup-now")
 @token_required
@@ -199,13 +3377,17 @@ def manual_backup():
         if not SUPABASE_URL or not SUPABASE_KEY:
             return jsonify({"error": "Supabase config missing"}), 500
 
-        filename, path = create_backup()
-        upload_to_supabase(filename, path)
+        kind = request.args.get("tur", "auto")
+        if kind not in ("auto", "full", "incremental"):
+            return jsonify({"error": "Gecersiz yedek turu"}), 400
+
+        job_id = submit_job("backup", {"tur": kind})
 
         return jsonify({
-            "status": "Backup uploaded",
-            "file": filename
-        })
+            "status": "Backup queued",
+            "job_id": job_id,
+            "status_url": f"/api/jobs/{job_id}"
+        }), 202
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -238,52 +3420,48 @@ def restore_backup(filename):
         if not SUPABASE_URL or not SUPABASE_KEY:
             return jsonify({"error": "Supabase config missing"}), 500
 
-        # 1️⃣ Supabase'ten dosyayı indir
-        download_url = f"{SUPABASE_URL}/storage/v1/object/{BUCKET}/{filename}"
-
-        headers = {
-            "Authorization": f"Bearer {SUPABASE_KEY}"
-        }
+        if not filename.endswith(".sql"):
+            storage_get(f"{filename}/manifest.json")
 
-        r = requests.get(download_url, headers=headers)
+        job_id = submit_job("restore", {"name": filename})
 
-        if r.status_code != 200:
-            return jsonify({"error": "Backup file not found"}), 404
-
-        sql_content = r.text
-
-        # 2️⃣ Database'e yaz
-        with get_db() as conn:
-            cur = conn.cursor()
-
-            # Önce tüm tabloları temizle
-            cur.execute("""
-                TRUNCATE TABLE 
-                hareketler,
-                satislar,
-                odemeler,
-                urunler,
-                cariler
-                RESTART IDENTITY CASCADE;
-            """)
-
-            # SQL dosyasını çalıştır
-            commands = sql_content.split(";")
-
-            for command in commands:
-                command = command.strip()
-                if command:
-                    cur.execute(command)
-
-        return jsonify({"status": "Restore completed"})
+        return jsonify({
+            "status": "Restore queued",
+            "job_id": job_id,
+            "status_url": f"/api/jobs/{job_id}"
+        }), 202
 
+    except BackupNotFound:
+        return jsonify({"error": "Backup file not found"}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/backups")
+@app.route("/backups")
+@token_required
+def list_backups():
+    return jsonify(list_backup_catalog())
+
+@app.route("/api/pool-stats")
+@token_required
+def api_pool_stats():
+    return jsonify(get_pool().stats())
+
+@app.route("/api/cache-stats")
 @token_required
-def list_backups():
-    return "BACKUPS V2 CALISIYOR"
+def api_cache_stats():
+    return jsonify(onbellek.stats())
+
+def metrik_yaniti():
+    return Response(metrikler_metni(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/metrics")
+def metrics():
+    # Prometheus JWT alamaz: METRICS_TOKEN tanimliysa sabit Bearer token ile okunur
+    if METRICS_TOKEN:
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"):
+            return jsonify({"error": "Gecersiz token"}), 401
+        return metrik_yaniti()
+    return token_required(metrik_yaniti)()
 
 
 
@@ -291,42 +3469,184 @@ def list_backups():
 # CARİLER
 # ───────────────────────────────────────────────────────
 
+CARI_SIRALAMA = {
+    "firma_adi": "c.firma_adi",
+    "bakiye_desc": "bakiye DESC, c.firma_adi",
+    "bakiye_asc": "bakiye ASC, c.firma_adi",
+    "son_tarih": "b.son_tarih DESC NULLS LAST, c.firma_adi",
+}
+
+CARI_DURUM = {
+    "borclu": "COALESCE(b.bakiye,0) > 0",
+    "alacakli": "COALESCE(b.bakiye,0) < 0",
+    "sifir": "COALESCE(b.bakiye,0) = 0",
+}
+
 @app.route("/api/cariler")
 @token_required
+@etag_ile("cariler", "hareketler")
+@onbellekli("cariler", "hareketler")
 def api_cariler():
+    """
+    ?with_balance=1          → borc/alacak/bakiye/son_tarih alanlari eklenir
+    ?durum=borclu|alacakli|sifir, ?min_bakiye=1000
+    ?sort=firma_adi|bakiye_desc|bakiye_asc|son_tarih, ?limit=20
+    Bakiye filtre/siralamasi kullanilirsa with_balance otomatik acilir.
+    """
     q = request.args.get("q", "")
+    sort = request.args.get("sort", "firma_adi")
+    durum = request.args.get("durum")
+    min_bakiye = request.args.get("min_bakiye") or None
+    limit = page_limit() if request.args.get("limit") else None
+
+    if sort not in CARI_SIRALAMA:
+        return jsonify({"error": "Gecersiz siralama"}), 400
+    if durum and durum not in CARI_DURUM:
+        return jsonify({"error": "Gecersiz durum"}), 400
+    if min_bakiye:
+        try:
+            min_bakiye = parse_amount(min_bakiye)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    with_balance = (request.args.get("with_balance") == "1"
+                    or sort != "firma_adi" or durum or min_bakiye is not None)
+
+    where, params = ["TRUE"], []
+    if q:
+        where.append("arama_metni(c.firma_adi) LIKE '%%' || arama_metni(%s) || '%%'")
+        params.append(like_escape(q))
+    if durum:
+        where.append(CARI_DURUM[durum])
+    if min_bakiye is not None:
+        where.append("COALESCE(b.bakiye,0) >= %s")
+        params.append(min_bakiye)
+
+    if with_balance:
+        sql = f"""
+            SELECT c.*,
+                   COALESCE(b.borc,0) AS borc,
+                   COALESCE(b.alacak,0) AS alacak,
+                   COALESCE(b.bakiye,0) AS bakiye,
+                   b.son_tarih
+            FROM cariler c
+            LEFT JOIN cari_bakiye b ON b.cari_id=c.id
+            WHERE {" AND ".join(where)}
+            ORDER BY {CARI_SIRALAMA[sort]}
+        """
+    else:
+        sql = f"SELECT * FROM cariler c WHERE {' AND '.join(where)} ORDER BY c.firma_adi"
+    if limit:
+        sql += " LIMIT %s"
+        params.append(limit)
+
     with get_db() as conn:
         cur = conn.cursor()
-        cur.execute(
-            "SELECT * FROM cariler WHERE firma_adi ILIKE %s ORDER BY firma_adi",
-            (f"%{q}%",)
-        )
-        rows = rows_to_dicts(cur)
-    return jsonify(rows)
+        cur.execute(sql, params)
+        cols, rows = liste_sorgusu(cur)
+    return jsonify(liste_bicimi(cols, rows))
 
-@app.route("/api/cariler", methods=["POST"])
+@app.route("/api/bootstrap")
 @token_required
-def api_cari_ekle():
-    d = request.json
-    if not d.get("firma_adi"):
-        return jsonify({"error": "Firma adı zorunludur"}), 400
+@etag_ile("cariler", "urunler")
+@onbellekli("cariler", "urunler")
+def api_bootstrap():
+    """
+    Acilis ve satis/odeme formlari icin referans listeleri tek istekte:
+    {"cariler", "urunler", "surum": {tablo: sayac}}; ?format=columns desteklenir.
+    surum, ETag'in de dayandigi tablo sayaclaridir.
+    """
+    with get_db(transaction=True) as conn:
+        cur = conn.cursor()
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        cur.execute("SELECT * FROM cariler ORDER BY firma_adi")
+        cariler = liste_bicimi(*liste_sorgusu(cur))
+        cur.execute("SELECT * FROM urunler ORDER BY ad")
+        urunler = liste_bicimi(*liste_sorgusu(cur))
+        cur.execute("SELECT tablo, surum FROM tablo_surum WHERE tablo IN ('cariler', 'urunler')")
+        surum = dict(cur.fetchall())
+    return jsonify({"cariler": cariler, "urunler": urunler, "surum": surum})
 
-    with get_db() as conn:
+def like_escape(q):
+    return q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+CARI_ARAMA = "cari_arama_metni(c.firma_adi, c.yetkili, c.telefon, c.email)"
+URUN_ARAMA = "urun_arama_metni(u.ad, u.kod)"
+
+@app.route("/api/ara")
+@token_required
+def api_ara():
+    """
+    Yazarken arama: ?q=...&tur=cari|urun (bos: ikisi)&limit=10
+    Buyuk/kucuk harf (İ/ı dahil) ve aksan duyarsiz; parca eslesme ya da
+    pg_trgm kelime benzerligi (yazim hatasi toleransi). Ad basi eslesmeler
+    one, sonra benzerlik skoruna gore siralanir.
+    """
+    q = request.args.get("q", "").strip()
+    tur = request.args.get("tur")
+    if tur not in (None, "cari", "urun"):
+        return jsonify({"error": "Gecersiz tur"}), 400
+    limit = min(request.args.get("limit", 10, type=int) or 10, SEARCH_MAX_LIMIT)
+
+    sonuc = {}
+    if tur != "urun":
+        sonuc["cariler"] = []
+    if tur != "cari":
+        sonuc["urunler"] = []
+    if not q:
+        return jsonify(sonuc)
+    params = {"q": q, "like": like_escape(q), "limit": limit}
+    with get_db(transaction=True) as conn:
         cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO cariler
-            (firma_adi,yetkili,telefon,email,adres,notlar)
-            VALUES (%s,%s,%s,%s,%s,%s)
-        """, (
-            d["firma_adi"],
-            d.get("yetkili",""),
-            d.get("telefon",""),
-            d.get("email",""),
-            d.get("adres",""),
-            d.get("notlar","")
-        ))
+        cur.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)",
+                    (str(SEARCH_SIMILARITY),))
+        if tur != "urun":
+            cur.execute(f"""
+                SELECT c.*, round(word_similarity(arama_metni(%(q)s), {CARI_ARAMA})::numeric, 3)::float AS skor
+                FROM cariler c
+                WHERE {CARI_ARAMA} LIKE '%%' || arama_metni(%(like)s) || '%%'
+                   OR arama_metni(%(q)s) <%% {CARI_ARAMA}
+                ORDER BY arama_metni(c.firma_adi) LIKE arama_metni(%(like)s) || '%%' DESC,
+                         skor DESC, c.firma_adi
+                LIMIT %(limit)s
+            """, params)
+            sonuc["cariler"] = rows_to_dicts(cur)
+        if tur != "cari":
+            cur.execute(f"""
+                SELECT u.*, round(word_similarity(arama_metni(%(q)s), {URUN_ARAMA})::numeric, 3)::float AS skor
+                FROM urunler u
+                WHERE {URUN_ARAMA} LIKE '%%' || arama_metni(%(like)s) || '%%'
+                   OR arama_metni(%(q)s) <%% {URUN_ARAMA}
+                ORDER BY arama_metni(u.kod) = arama_metni(%(q)s) DESC,
+                         arama_metni(u.ad) LIKE arama_metni(%(like)s) || '%%' DESC,
+                         skor DESC, u.ad
+                LIMIT %(limit)s
+            """, params)
+            sonuc["urunler"] = rows_to_dicts(cur)
+    return jsonify(sonuc)
 
-    return jsonify({"ok": True})
+def cari_ekle(cur, d):
+    if not d.get("firma_adi"):
+        raise ValueError("Firma adı zorunludur")
+    cur.execute("""
+        INSERT INTO cariler
+        (firma_adi,yetkili,telefon,email,adres,notlar)
+        VALUES (%s,%s,%s,%s,%s,%s)
+        RETURNING id
+    """, (
+        d["firma_adi"],
+        d.get("yetkili",""),
+        d.get("telefon",""),
+        d.get("email",""),
+        d.get("adres",""),
+        d.get("notlar","")
+    ))
+    return {"id": cur.fetchone()[0]}
+
+@app.route("/api/cariler", methods=["POST"])
+@token_required
+def api_cari_ekle():
+    return yazma_yaniti(cari_ekle, "cari")
 
 @app.route("/api/cariler/<int:cid>", methods=["PUT"])
 @token_required
@@ -357,80 +3677,212 @@ def api_cari_guncelle(cid):
 @app.route("/api/cariler/<int:cid>", methods=["DELETE"])
 @token_required
 def api_cari_sil(cid):
-    with get_db() as conn:
+    with get_db(transaction=True) as conn:
         cur = conn.cursor()
+        # Satir kilidi: bakiyeyi degistirecek eszamanli hareket silmeyi bekler
+        cur.execute("SELECT bakiye FROM cari_bakiye WHERE cari_id=%s FOR UPDATE", (cid,))
+        r = cur.fetchone()
+        if r and r[0] != 0:
+            return jsonify({"error": f"Cari bakiyesi sıfır değil ({r[0]:,.2f}₺); önce sıfırlayın"}), 409
         cur.execute("DELETE FROM cariler WHERE id=%s", (cid,))
     return jsonify({"ok": True})
 
 @app.route("/api/cariler/<int:cid>/ozet")
 @token_required
+@etag_ile(cari=True)
 def api_cari_ozet(cid):
     with get_db() as conn:
         cur = conn.cursor()
         cur.execute("""
-            SELECT COALESCE(SUM(borc),0),
-                   COALESCE(SUM(alacak),0)
-            FROM hareketler
+            SELECT borc, alacak FROM cari_bakiye
             WHERE cari_id=%s
         """, (cid,))
-        b, a = cur.fetchone()
+        b, a = cur.fetchone() or (Decimal("0.00"), Decimal("0.00"))
 
     return jsonify({
-        "borc": float(b),
-        "alacak": float(a),
-        "bakiye": float(b) - float(a)
+        "borc": b,
+        "alacak": a,
+        "bakiye": b - a
+    })
+
+@app.route("/api/cariler/<int:cid>/detay")
+@token_required
+@etag_ile("cariler", *DONEM_TABLOLARI, cari=True)
+def api_cari_detay(cid):
+    """
+    Cari ekrani tek istekte: {"cari", "ozet": {borc, alacak, bakiye}} + ekstrenin
+    ilk sayfasi (hareket_sayfasi alanlari). ?limit=, ?format=columns.
+    Hepsi ayni snapshot'tan okunur; ozet ile ekstre birbirini tutar.
+    """
+    with get_db(transaction=True) as conn:
+        cur = conn.cursor()
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        cur.execute("""
+            SELECT c.*, COALESCE(b.borc, 0) AS borc, COALESCE(b.alacak, 0) AS alacak
+            FROM cariler c
+            LEFT JOIN cari_bakiye b ON b.cari_id = c.id
+            WHERE c.id=%s
+        """, (cid,))
+        rows = rows_to_dicts(cur)
+        if not rows:
+            return jsonify({"error": "Cari bulunamadi"}), 404
+        cari = rows[0]
+        borc, alacak = cari.pop("borc"), cari.pop("alacak")
+        sayfa = hareket_sayfasi(cur, cid, page_limit())
+
+    return jsonify({
+        "cari": cari,
+        "ozet": {"borc": borc, "alacak": alacak, "bakiye": borc - alacak},
+        **sayfa,
     })
 
 # ───────────────────────────────────────────────────────
 # HAREKETLER
 # ───────────────────────────────────────────────────────
 
+def hareket_sayfasi(cur, cid, limit, cursor=None, baslangic=None, bitis=None):
+    """
+    Cari ekstresinden en yeniden eskiye bir sayfa okur.
+
+    Yuruyen bakiye veritabaninda hesaplanir: sayfanin en yeni satirindaki
+    bakiye = cari_bakiye toplami − sayfadan daha yeni hareketlerin toplami,
+    sonraki satirlar pencere fonksiyonuyla bundan dusulur. Boylece sayfa
+    basina sadece (cari_id, tarih, id) indeksinde kisa bir aralik okunur.
+    Sayfa kapanmis bir yildaysa cari_bakiye yerine o yilin kapanis devri
+    alinir; daha yeni hareketler yalnizca o yilin bolumunden okunur.
+    """
+    where = ["cari_id=%s"]
+    params = [cid]
+    if cursor:
+        where.append("(tarih, id) < (%s, %s)")
+        params += [cursor[0], cursor[1]]
+    if baslangic:
+        where.append("tarih >= %s")
+        params.append(baslangic)
+    if bitis:
+        where.append("tarih <= %s")
+        params.append(bitis)
+
+    cur.execute(f"""
+        WITH sayfa AS (
+            SELECT id, cari_id, tarih, aciklama, borc, alacak, tur, ref_id
+            FROM hareketler
+            WHERE {" AND ".join(where)}
+            ORDER BY tarih DESC, id DESC
+            LIMIT %s
+        ),
+        ust AS (
+            SELECT tarih, id FROM sayfa
+            ORDER BY tarih DESC, id DESC
+            LIMIT 1
+        ),
+        kapanis AS (
+            SELECT d.borc - d.alacak AS tutar, make_date(d.yil, 1, 1) AS sinir
+            FROM devir_bakiyeleri d, ust
+            WHERE d.cari_id=%s AND d.yil = extract(year FROM ust.tarih)::int + 1
+        ),
+        sonra AS (
+            SELECT COALESCE(SUM(COALESCE(h.borc,0) - COALESCE(h.alacak,0)), 0) AS tutar
+            FROM hareketler h, ust
+            WHERE h.cari_id=%s AND (h.tarih, h.id) > (ust.tarih, ust.id)
+              AND h.tarih >= (SELECT tarih FROM ust)
+              AND h.tarih < COALESCE((SELECT sinir FROM kapanis), 'infinity')
+        )
+        SELECT s.*,
+               COALESCE((SELECT tutar FROM kapanis),
+                        (SELECT bakiye FROM cari_bakiye WHERE cari_id=%s), 0)
+               - (SELECT tutar FROM sonra)
+               - COALESCE(SUM(COALESCE(s.borc,0) - COALESCE(s.alacak,0)) OVER (
+                     ORDER BY s.tarih DESC, s.id DESC
+                     ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                 ), 0) AS bakiye
+        FROM sayfa s
+        ORDER BY s.tarih DESC, s.id DESC
+    """, params + [limit + 1, cid, cid, cid])
+    cols, rows = liste_sorgusu(cur)
+    i = {k: cols.index(k) for k in ("tarih", "id", "borc", "alacak", "bakiye")}
+
+    sonraki = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        sonraki = encode_cursor(rows[-1][i["tarih"]], rows[-1][i["id"]])
+
+    acilis = kapanis = None
+    if rows:
+        kapanis = rows[0][i["bakiye"]]
+        son = rows[-1]
+        acilis = son[i["bakiye"]] - ((son[i["borc"]] or 0) - (son[i["alacak"]] or 0))
+
+    return {
+        "hareketler": liste_bicimi(cols, rows),
+        "acilis_bakiye": acilis,
+        "kapanis_bakiye": kapanis,
+        "sonraki": sonraki,
+    }
+
 @app.route("/api/hareketler/<int:cid>")
 @token_required
+@etag_ile(*DONEM_TABLOLARI, cari=True)
 def api_hareketler(cid):
+    """
+    En yeniden eskiye sayfali ekstre.
+    ?limit=50&cursor=<sonraki>&baslangic=YYYY-MM-DD&bitis=YYYY-MM-DD (ya da ?ay=YYYY-MM, ?yil=YYYY)
+    """
+    cursor = None
+    if request.args.get("cursor"):
+        try:
+            tarih, hid = decode_cursor(request.args["cursor"])
+            cursor = (parse_date(tarih), int(hid))
+        except ValueError:
+            return jsonify({"error": "Gecersiz imlec"}), 400
+    try:
+        baslangic, bitis = tarih_araligi()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     with get_db() as conn:
         cur = conn.cursor()
-        cur.execute("""
-            SELECT * FROM hareketler
-            WHERE cari_id=%s
-            ORDER BY tarih,id
-        """, (cid,))
-        rows = rows_to_dicts(cur)
-
-    result = []
-    bakiye = 0
-    for r in rows:
-        bakiye += float(r["borc"]) - float(r["alacak"])
-        r["bakiye"] = bakiye
-        result.append(r)
+        sayfa = hareket_sayfasi(
+            cur, cid, page_limit(),
+            cursor=cursor,
+            baslangic=baslangic,
+            bitis=bitis,
+        )
+    return jsonify(sayfa)
 
-    return jsonify(result)
+def hareket_ekle(cur, d):
+    zorunlu(d, "cari_id", "tarih")
+    cur.execute("""
+        INSERT INTO hareketler
+        (cari_id,tarih,aciklama,borc,alacak,tur)
+        VALUES (%s,%s,%s,%s,%s,'manuel')
+        RETURNING id
+    """, (
+        d["cari_id"],
+        parse_date(d["tarih"]),
+        d.get("aciklama",""),
+        money(d.get("borc", 0)),
+        money(d.get("alacak", 0))
+    ))
+    return {"id": cur.fetchone()[0]}
 
 @app.route("/api/hareketler", methods=["POST"])
 @token_required
 def api_hareket_ekle():
-    d = request.json
-    with get_db() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO hareketler
-            (cari_id,tarih,aciklama,borc,alacak,tur)
-            VALUES (%s,%s,%s,%s,%s,'manuel')
-        """, (
-            d["cari_id"],
-            d["tarih"],
-            d.get("aciklama",""),
-            float(d.get("borc",0)),
-            float(d.get("alacak",0))
-        ))
-    return jsonify({"ok": True})
+    return yazma_yaniti(hareket_ekle, "hareket")
 
 @app.route("/api/hareketler/<int:hid>", methods=["DELETE"])
 @token_required
 def api_hareket_sil(hid):
     with get_db() as conn:
         cur = conn.cursor()
-        cur.execute("DELETE FROM hareketler WHERE id=%s", (hid,))
+        # Satis/odeme/fatura hareketleri kaynagiyla birlikte silinir
+        cur.execute("DELETE FROM hareketler WHERE id=%s AND kaynak IS NULL RETURNING id", (hid,))
+        if not cur.fetchone():
+            cur.execute("SELECT kaynak, ref_id FROM hareketler WHERE id=%s", (hid,))
+            r = cur.fetchone()
+            if r:
+                return jsonify({"error": f"Bu hareket {r[0]} #{r[1]} kaydına bağlı; kaynağı silin"}), 409
     return jsonify({"ok": True})
 
 # ───────────────────────────────────────────────────────
@@ -439,12 +3891,14 @@ def api_hareket_sil(hid):
 
 @app.route("/api/urunler")
 @token_required
+@etag_ile("urunler")
+@onbellekli("urunler")
 def api_urunler():
     with get_db() as conn:
         cur = conn.cursor()
         cur.execute("SELECT * FROM urunler ORDER BY ad")
-        rows = rows_to_dicts(cur)
-    return jsonify(rows)
+        cols, rows = liste_sorgusu(cur)
+    return jsonify(liste_bicimi(cols, rows))
 
 @app.route("/api/urunler", methods=["POST"])
 @token_required
@@ -460,8 +3914,8 @@ def api_urun_ekle():
             d["ad"],
             d.get("kod",""),
             d.get("birim","Adet"),
-            float(d.get("fiyat",0)),
-            float(d.get("stok",0)),
+            money(d.get("fiyat",0)),
+            parse_amount(d.get("stok",0)),
             d.get("notlar","")
         ))
     return jsonify({"ok": True})
@@ -480,8 +3934,8 @@ def api_urun_guncelle(uid):
             d["ad"],
             d.get("kod",""),
             d.get("birim","Adet"),
-            float(d.get("fiyat",0)),
-            float(d.get("stok",0)),
+            money(d.get("fiyat",0)),
+            parse_amount(d.get("stok",0)),
             d.get("notlar",""),
             uid
         ))
@@ -504,76 +3958,292 @@ def api_urun_sil(uid):
 
 @app.route("/api/satislar")
 @token_required
+@etag_ile("satislar", "cariler", "urunler")
 def api_satislar():
-    with get_db() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT s.*,c.firma_adi,u.ad as urun_adi
-            FROM satislar s
-            JOIN cariler c ON s.cari_id=c.id
-            JOIN urunler u ON s.urun_id=u.id
-            ORDER BY s.tarih DESC,s.id DESC
-        """)
-        rows = rows_to_dicts(cur)
-    return jsonify(rows)
+    return sayfali_liste("satislar", """
+        SELECT s.*,c.firma_adi,u.ad as urun_adi
+        FROM satislar s
+        JOIN cariler c ON s.cari_id=c.id
+        JOIN urunler u ON s.urun_id=u.id
+    """, "s", ("cari_id", "urun_id"))
+
+def satis_aciklama(urun_adi, adet, fiyat, aciklama=""):
+    hr = f"Satış: {urun_adi or 'Ürün'} x{adet:g} @ {fiyat:,.2f}₺"
+    if aciklama:
+        hr += f" – {aciklama}"
+    return hr
+
+def satis_ekle(cur, d):
+    zorunlu(d, "cari_id", "urun_id", "tarih", "adet", "birim_fiyat")
+    tarih = parse_date(d["tarih"])
+    adet = parse_amount(d["adet"])
+    fiyat = money(d["birim_fiyat"])
+    toplam = (adet * fiyat).quantize(KURUS, rounding=ROUND_HALF_UP)
+
+    cur.execute("""
+        INSERT INTO satislar
+        (cari_id,urun_id,tarih,adet,birim_fiyat,toplam,aciklama)
+        VALUES (%s,%s,%s,%s,%s,%s,%s)
+        RETURNING id
+    """, (
+        d["cari_id"],
+        d["urun_id"],
+        tarih,
+        adet,
+        fiyat,
+        toplam,
+        d.get("aciklama","")
+    ))
+    sid = cur.fetchone()[0]
+
+    cur.execute("""
+        INSERT INTO hareketler
+        (cari_id,tarih,aciklama,borc,alacak,tur,kaynak,ref_id)
+        VALUES (%s,%s,%s,%s,0,'satış','satislar',%s)
+    """, (
+        d["cari_id"],
+        tarih,
+        satis_aciklama(d.get("urun_adi"), adet, fiyat, d.get("aciklama")),
+        toplam,
+        sid
+    ))
+    return {"id": sid, "toplam": toplam}
 
 @app.route("/api/satislar", methods=["POST"])
 @token_required
 def api_satis_ekle():
-    d = request.json
-    adet = float(d["adet"])
-    fiyat = float(d["birim_fiyat"])
-    toplam = adet * fiyat
+    return yazma_yaniti(satis_ekle, "satis")
 
-    hr = f"Satış: {d.get('urun_adi','Ürün')} x{adet:g} @ {fiyat:,.2f}₺"
-    if d.get("aciklama"):
-        hr += f" – {d['aciklama']}"
+def fatura_kalemi_mi(cur, sid):
+    """Satis bir fatura kalemi ise fatura id'si; bunlar fatura uzerinden yonetilir."""
+    cur.execute("SELECT fatura_id FROM satislar WHERE id=%s FOR UPDATE", (sid,))
+    r = cur.fetchone()
+    return None if r is None else (r[0] or False)
 
-    with get_db() as conn:
+@app.route("/api/satislar/<int:sid>", methods=["PUT"])
+@token_required
+def api_satis_guncelle(sid):
+    """Satisi ve ona bagli cari hareketini ayni transaction'da gunceller."""
+    d = request.json or {}
+    with get_db(transaction=True) as conn:
         cur = conn.cursor()
+        fid = fatura_kalemi_mi(cur, sid)
+        if fid is None:
+            return jsonify({"error": "Satış bulunamadı"}), 404
+        if fid:
+            return jsonify({"error": f"Bu satış {fid} numaralı faturanın kalemi; faturayı silip yeniden oluşturun"}), 409
+
+        cur.execute("SELECT cari_id,urun_id,tarih,adet,birim_fiyat,aciklama FROM satislar WHERE id=%s", (sid,))
+        eski = dict(zip(("cari_id", "urun_id", "tarih", "adet", "birim_fiyat", "aciklama"), cur.fetchone()))
+        yeni = {k: d.get(k, v) for k, v in eski.items()}
+        try:
+            yeni["tarih"] = parse_date(yeni["tarih"])
+            adet = parse_amount(yeni["adet"])
+            fiyat = money(yeni["birim_fiyat"])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        toplam = (adet * fiyat).quantize(KURUS, rounding=ROUND_HALF_UP)
+
+        cur.execute("SELECT ad FROM urunler WHERE id=%s", (yeni["urun_id"],))
+        urun = cur.fetchone()
+        if not urun:
+            return jsonify({"error": "Ürün bulunamadı"}), 400
+
         cur.execute("""
-            INSERT INTO satislar
-            (cari_id,urun_id,tarih,adet,birim_fiyat,toplam,aciklama)
-            VALUES (%s,%s,%s,%s,%s,%s,%s)
-        """, (
-            d["cari_id"],
-            d["urun_id"],
-            d["tarih"],
-            adet,
-            fiyat,
-            toplam,
-            d.get("aciklama","")
-        ))
+            UPDATE satislar SET
+            cari_id=%s,urun_id=%s,tarih=%s,adet=%s,birim_fiyat=%s,toplam=%s,aciklama=%s
+            WHERE id=%s
+        """, (yeni["cari_id"], yeni["urun_id"], yeni["tarih"], adet, fiyat, toplam,
+              yeni["aciklama"] or "", sid))
 
+        # Bagli hareket yoksa (eslesmemis eski kayit) yenisi yazilir
+        hareket = (yeni["cari_id"], yeni["tarih"],
+                   satis_aciklama(urun[0], adet, fiyat, yeni["aciklama"]), toplam, sid)
         cur.execute("""
-            INSERT INTO hareketler
-            (cari_id,tarih,aciklama,borc,alacak,tur)
-            VALUES (%s,%s,%s,%s,0,'satış')
-        """, (
-            d["cari_id"],
-            d["tarih"],
-            hr,
-            toplam
-        ))
+            UPDATE hareketler SET cari_id=%s, tarih=%s, aciklama=%s, borc=%s, alacak=0
+            WHERE kaynak='satislar' AND ref_id=%s
+        """, hareket)
+        if cur.rowcount == 0:
+            cur.execute("""
+                INSERT INTO hareketler
+                (cari_id,tarih,aciklama,borc,alacak,tur,kaynak,ref_id)
+                VALUES (%s,%s,%s,%s,0,'satış','satislar',%s)
+            """, hareket)
 
-    return jsonify({"ok": True, "toplam": toplam})
+    return jsonify({"ok": True, "id": sid, "toplam": toplam})
 
 @app.route("/api/satislar/<int:sid>", methods=["DELETE"])
 @token_required
 def api_satis_sil(sid):
-    with get_db() as conn:
+    with get_db(transaction=True) as conn:
         cur = conn.cursor()
-        cur.execute("SELECT cari_id,tarih,toplam FROM satislar WHERE id=%s", (sid,))
-        r = cur.fetchone()
+        fid = fatura_kalemi_mi(cur, sid)
+        if fid:
+            return jsonify({"error": f"Bu satış {fid} numaralı faturanın kalemi; faturayı silin"}), 409
+        cur.execute("DELETE FROM hareketler WHERE kaynak='satislar' AND ref_id=%s", (sid,))
+        cur.execute("DELETE FROM satislar WHERE id=%s", (sid,))
 
-        if r:
-            cur.execute("""
-                DELETE FROM hareketler
-                WHERE cari_id=%s AND tarih=%s AND borc=%s AND tur='satış'
-            """, (r[0], r[1], r[2]))
+    return jsonify({"ok": True})
 
-        cur.execute("DELETE FROM satislar WHERE id=%s", (sid,))
+# ───────────────────────────────────────────────────────
+# 🧾 FATURALAR
+# ───────────────────────────────────────────────────────
+
+def fatura_kalemleri(kalemler, urunler):
+    """Kalemleri dogrular; birim_fiyat verilmezse urunun fiyati kullanilir."""
+    if not isinstance(kalemler, list) or not kalemler:
+        raise ValueError("En az bir kalem gerekli")
+    if len(kalemler) > FATURA_MAX_KALEM:
+        raise ValueError(f"En fazla {FATURA_MAX_KALEM} kalem girilebilir")
+    sonuc = []
+    for i, k in enumerate(kalemler, 1):
+        try:
+            uid = int(k["urun_id"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Kalem {i}: urun_id zorunludur")
+        if uid not in urunler:
+            raise ValueError(f"Kalem {i}: urun bulunamadi ({uid})")
+        adet = parse_amount(k.get("adet"))
+        if adet <= 0:
+            raise ValueError(f"Kalem {i}: adet pozitif olmali")
+        fiyat = k.get("birim_fiyat")
+        fiyat = urunler[uid]["fiyat"] if fiyat in (None, "") else money(fiyat)
+        if fiyat < 0:
+            raise ValueError(f"Kalem {i}: birim fiyat negatif olamaz")
+        sonuc.append({"urun_id": uid, "adet": adet, "birim_fiyat": fiyat,
+                      "toplam": (adet * fiyat).quantize(KURUS, rounding=ROUND_HALF_UP),
+                      "aciklama": k.get("aciklama") or ""})
+    return sonuc
+
+
+def fatura_ekle(cur, d):
+    """
+    Cok kalemli satis: fatura + satislar + cari hareket(ler) + stok dususu
+    tek transaction'da, toplu INSERT'lerle yazilir. Yarim kalan fatura olmaz.
+    """
+    hareket = d.get("hareket") or FATURA_HAREKET
+    if hareket not in ("ozet", "satir"):
+        raise ValueError("hareket 'ozet' veya 'satir' olmali")
+    zorunlu(d, "cari_id", "tarih")
+    tarih = parse_date(d["tarih"])
+
+    cur.execute("SELECT 1 FROM cariler WHERE id=%s", (d["cari_id"],))
+    if not cur.fetchone():
+        raise KayitBulunamadi("Cari bulunamadi")
+
+    ids = set()
+    for k in d.get("kalemler") or []:
+        try:
+            ids.add(int(k["urun_id"]))
+        except (KeyError, TypeError, ValueError):
+            pass
+    # Stok guncellemesi icin urun satirlari kilitlenir (sirali: kilitlenme olmasin)
+    cur.execute("""
+        SELECT id, ad, birim, fiyat FROM urunler
+        WHERE id = ANY(%s) ORDER BY id FOR UPDATE
+    """, (sorted(ids),))
+    urunler = {r[0]: {"ad": r[1], "birim": r[2], "fiyat": r[3] or Decimal(0)}
+               for r in cur.fetchall()}
+    kalemler = fatura_kalemleri(d.get("kalemler"), urunler)
 
+    toplam = sum(k["toplam"] for k in kalemler)
+    cur.execute("""
+        INSERT INTO faturalar (cari_id,tarih,no,aciklama,toplam,hareket)
+        VALUES (%s,%s,%s,%s,%s,%s) RETURNING id
+    """, (d["cari_id"], tarih, d.get("no"), d.get("aciklama", ""), toplam, hareket))
+    fid = cur.fetchone()[0]
+
+    satis_ids = [r[0] for r in execute_values(cur, """
+        INSERT INTO satislar
+        (fatura_id,cari_id,urun_id,tarih,adet,birim_fiyat,toplam,aciklama)
+        VALUES %s RETURNING id
+    """, [
+        (fid, d["cari_id"], k["urun_id"], tarih, k["adet"], k["birim_fiyat"],
+         k["toplam"], k["aciklama"])
+        for k in kalemler
+    ], fetch=True)]
+
+    if hareket == "ozet":
+        hr = f"Fatura {d.get('no') or '#' + str(fid)}: {len(kalemler)} kalem"
+        if d.get("aciklama"):
+            hr += f" – {d['aciklama']}"
+        hareket_rows = [(d["cari_id"], tarih, hr, toplam, "fatura", "faturalar", fid)]
+    else:
+        hareket_rows = []
+        for sid, k in zip(satis_ids, kalemler):
+            hr = satis_aciklama(urunler[k["urun_id"]]["ad"], k["adet"], k["birim_fiyat"],
+                                k["aciklama"])
+            hareket_rows.append((d["cari_id"], tarih, hr, k["toplam"], "satış", "satislar", sid))
+    hareket_ids = [r[0] for r in execute_values(cur, """
+        INSERT INTO hareketler (cari_id,tarih,aciklama,borc,alacak,tur,kaynak,ref_id)
+        VALUES %s RETURNING id
+    """, [(c, t, a, b, 0, tur, kay, ref) for c, t, a, b, tur, kay, ref in hareket_rows],
+        template="(%s,%s,%s,%s,%s,%s,%s,%s)", fetch=True)]
+
+    # Ayni urun birden fazla kalemde olabilir; stok tek UPDATE ile dusulur
+    adetler = {}
+    for k in kalemler:
+        adetler[k["urun_id"]] = adetler.get(k["urun_id"], 0) + k["adet"]
+    execute_values(cur, """
+        UPDATE urunler u SET stok = COALESCE(u.stok, 0) - v.adet
+        FROM (VALUES %s) AS v(id, adet)
+        WHERE u.id = v.id
+    """, list(adetler.items()), template="(%s::int,%s::numeric)")
+
+    return {
+        "fatura_id": fid,
+        "satis_ids": satis_ids,
+        "hareket_ids": hareket_ids,
+        "toplam": toplam,
+    }
+
+@app.route("/api/faturalar", methods=["POST"])
+@token_required
+def api_fatura_ekle():
+    return yazma_yaniti(fatura_ekle, "fatura")
+
+@app.route("/api/faturalar/<int:fid>", methods=["GET"])
+@token_required
+def api_fatura(fid):
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT f.id, f.cari_id, c.firma_adi, f.tarih, f.no, f.aciklama, f.toplam, f.hareket
+            FROM faturalar f JOIN cariler c ON c.id = f.cari_id
+            WHERE f.id=%s
+        """, (fid,))
+        fatura = rows_to_dicts(cur)
+        if not fatura:
+            return jsonify({"error": "Fatura bulunamadi"}), 404
+        cur.execute("""
+            SELECT s.id, s.urun_id, u.ad AS urun_adi, u.birim, s.adet, s.birim_fiyat, s.toplam, s.aciklama
+            FROM satislar s JOIN urunler u ON u.id = s.urun_id
+            WHERE s.fatura_id=%s ORDER BY s.id
+        """, (fid,))
+        fatura[0]["kalemler"] = rows_to_dicts(cur)
+    return jsonify(fatura[0])
+
+@app.route("/api/faturalar/<int:fid>", methods=["DELETE"])
+@token_required
+def api_fatura_sil(fid):
+    """Faturayi, kalemlerini ve cari hareketlerini siler; stoku geri ekler."""
+    with get_db(transaction=True) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM faturalar WHERE id=%s FOR UPDATE", (fid,))
+        if not cur.fetchone():
+            return jsonify({"error": "Fatura bulunamadi"}), 404
+        cur.execute("""
+            DELETE FROM hareketler
+            WHERE (kaynak='faturalar' AND ref_id=%s)
+               OR (kaynak='satislar' AND ref_id IN (SELECT id FROM satislar WHERE fatura_id=%s))
+        """, (fid, fid))
+        cur.execute("""
+            UPDATE urunler u SET stok = COALESCE(u.stok, 0) + s.adet
+            FROM (SELECT urun_id, SUM(adet) AS adet FROM satislar
+                  WHERE fatura_id=%s GROUP BY urun_id) s
+            WHERE u.id = s.urun_id
+        """, (fid,))
+        cur.execute("DELETE FROM faturalar WHERE id=%s", (fid,))
     return jsonify({"ok": True})
 
 # ───────────────────────────────────────────────────────
@@ -582,84 +4252,485 @@ def api_satis_sil(sid):
 
 @app.route("/api/odemeler")
 @token_required
+@etag_ile("odemeler", "cariler")
 def api_odemeler():
+    return sayfali_liste("odemeler", """
+        SELECT o.*,c.firma_adi
+        FROM odemeler o
+        JOIN cariler c ON o.cari_id=c.id
+    """, "o", ("cari_id",))
+
+def odeme_ekle(cur, d):
+    zorunlu(d, "cari_id", "tarih", "tutar")
+    tarih = parse_date(d["tarih"])
+    tutar = money(d["tutar"])
+
+    hr = f"Ödeme ({d.get('yontem','Nakit')})"
+    if d.get("aciklama"):
+        hr += f" – {d['aciklama']}"
+
+    cur.execute("""
+        INSERT INTO odemeler
+        (cari_id,tarih,tutar,yontem,aciklama)
+        VALUES (%s,%s,%s,%s,%s)
+        RETURNING id
+    """, (
+        d["cari_id"],
+        tarih,
+        tutar,
+        d.get("yontem","Nakit"),
+        d.get("aciklama","")
+    ))
+    oid = cur.fetchone()[0]
+
+    cur.execute("""
+        INSERT INTO hareketler
+        (cari_id,tarih,aciklama,borc,alacak,tur,kaynak,ref_id)
+        VALUES (%s,%s,%s,0,%s,'ödeme','odemeler',%s)
+    """, (
+        d["cari_id"],
+        tarih,
+        hr,
+        tutar,
+        oid
+    ))
+    return {"id": oid}
+
+@app.route("/api/odemeler", methods=["POST"])
+@token_required
+def api_odeme_ekle():
+    return yazma_yaniti(odeme_ekle, "odeme")
+
+@app.route("/api/odemeler/<int:oid>", methods=["DELETE"])
+@token_required
+def api_odeme_sil(oid):
+    with get_db(transaction=True) as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM hareketler WHERE kaynak='odemeler' AND ref_id=%s", (oid,))
+        cur.execute("DELETE FROM odemeler WHERE id=%s", (oid,))
+
+    return jsonify({"ok": True})
+
+# ───────────────────────────────────────────────────────
+# 📊 RAPORLAR
+# ───────────────────────────────────────────────────────
+# Raporlar kaynak tablolari degil, tetikleyicilerle guncel tutulan aylik
+# ozetleri (rapor_*) okur; sure toplam gecmisle degil ay/cari sayisiyla buyur.
+
+def rapor_aylari():
+    """tarih_araligi() ay basina yuvarlanir; verilmezse son 12 ay."""
+    baslangic, bitis = tarih_araligi()
+    bitis = (bitis or date.today()).replace(day=1)
+    if baslangic is None:
+        yil, ay = divmod(bitis.year * 12 + bitis.month - 12, 12)
+        baslangic = date(yil, ay + 1, 1)
+    return baslangic.replace(day=1), bitis
+
+YASLANDIRMA_DILIMLERI = ["0-30", "31-60", "61-90", "90+"]
+
+@app.route("/api/raporlar/aylik-satis")
+@token_required
+@etag_ile("satislar", "cariler", "urunler")
+def api_rapor_aylik_satis():
+    """?grup=urun|cari, ?ay= / ?yil= / ?baslangic=&bitis= (ay bazinda)."""
+    grup = request.args.get("grup", "urun")
+    if grup not in ("urun", "cari"):
+        return jsonify({"error": "Gecersiz grup"}), 400
+    try:
+        baslangic, bitis = rapor_aylari()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if grup == "urun":
+        ad, katilim = "u.ad", "JOIN urunler u ON u.id = r.urun_id"
+    else:
+        ad, katilim = "c.firma_adi", "JOIN cariler c ON c.id = r.cari_id"
+
     with get_db() as conn:
         cur = conn.cursor()
-        cur.execute("""
-            SELECT o.*,c.firma_adi
-            FROM odemeler o
-            JOIN cariler c ON o.cari_id=c.id
-            ORDER BY o.tarih DESC,o.id DESC
-        """)
+        cur.execute(f"""
+            SELECT to_char(r.ay, 'YYYY-MM') AS ay, r.{grup}_id AS id, {ad} AS ad,
+                   SUM(r.adet) AS adet, SUM(r.tutar) AS tutar, SUM(r.satir) AS satis_sayisi
+            FROM rapor_aylik_satis r
+            {katilim}
+            WHERE r.ay BETWEEN %s AND %s
+            GROUP BY r.ay, r.{grup}_id, {ad}
+            ORDER BY r.ay, tutar DESC
+        """, (baslangic, bitis))
         rows = rows_to_dicts(cur)
     return jsonify(rows)
 
-@app.route("/api/odemeler", methods=["POST"])
+@app.route("/api/raporlar/odeme-yontemleri")
 @token_required
-def api_odeme_ekle():
-    d = request.json
-    tutar = float(d["tutar"])
+@etag_ile("odemeler")
+def api_rapor_odeme_yontemleri():
+    try:
+        baslangic, bitis = rapor_aylari()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT yontem, SUM(tutar) AS tutar, SUM(satir) AS odeme_sayisi
+            FROM rapor_aylik_odeme
+            WHERE ay BETWEEN %s AND %s
+            GROUP BY yontem
+            ORDER BY tutar DESC
+        """, (baslangic, bitis))
+        rows = rows_to_dicts(cur)
+    return jsonify(rows)
 
-    hr = f"Ödeme ({d.get('yontem','Nakit')})"
-    if d.get("aciklama"):
-        hr += f" – {d['aciklama']}"
+@app.route("/api/raporlar/borclular")
+@token_required
+@etag_ile("hareketler", "cariler")
+def api_rapor_borclular():
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT c.id, c.firma_adi, c.telefon, b.bakiye, b.son_tarih
+            FROM cari_bakiye b
+            JOIN cariler c ON c.id = b.cari_id
+            WHERE b.bakiye > 0
+            ORDER BY b.bakiye DESC, c.id
+            LIMIT %s
+        """, (page_limit(default=10, maximum=100),))
+        rows = rows_to_dicts(cur)
+    return jsonify(rows)
 
+@app.route("/api/raporlar/yaslandirma")
+@token_required
+def api_rapor_yaslandirma():
+    """
+    Alacak yaslandirmasi (ay cozunurlugunde): borclu carinin bakiyesi, tahsilatlar
+    en eski borcu kapatir varsayimiyla (FIFO) en yeni aylarin borcuna dagitilir.
+    Dilim = borc ayinin bu aydan kac ay once oldugu (0 → "0-30", 1 → "31-60" ...).
+    """
+    bu_ay = date.today().replace(day=1)
     with get_db() as conn:
         cur = conn.cursor()
         cur.execute("""
-            INSERT INTO odemeler
-            (cari_id,tarih,tutar,yontem,aciklama)
-            VALUES (%s,%s,%s,%s,%s)
-        """, (
-            d["cari_id"],
-            d["tarih"],
-            tutar,
-            d.get("yontem","Nakit"),
-            d.get("aciklama","")
-        ))
+            WITH a AS (
+                SELECT m.cari_id, m.ay, m.borc, b.bakiye,
+                       SUM(m.borc) OVER (PARTITION BY m.cari_id
+                                         ORDER BY m.ay DESC) - m.borc AS sonraki
+                FROM cari_bakiye b
+                JOIN rapor_cari_aylik m ON m.cari_id = b.cari_id AND m.borc > 0
+                WHERE b.bakiye > 0
+            ), d AS (
+                SELECT cari_id, bakiye,
+                       LEAST(borc, bakiye - sonraki) AS tutar,
+                       LEAST(GREATEST((EXTRACT(YEAR FROM %(ay)s::date) - EXTRACT(YEAR FROM ay)) * 12
+                             + EXTRACT(MONTH FROM %(ay)s::date) - EXTRACT(MONTH FROM ay), 0), 3)::int AS dilim
+                FROM a WHERE sonraki < bakiye
+            )
+            SELECT d.cari_id, c.firma_adi, d.bakiye,
+                   SUM(tutar) FILTER (WHERE dilim = 0) AS d0,
+                   SUM(tutar) FILTER (WHERE dilim = 1) AS d1,
+                   SUM(tutar) FILTER (WHERE dilim = 2) AS d2,
+                   SUM(tutar) FILTER (WHERE dilim = 3) AS d3
+            FROM d JOIN cariler c ON c.id = d.cari_id
+            GROUP BY d.cari_id, c.firma_adi, d.bakiye
+            ORDER BY d.bakiye DESC, d.cari_id
+        """, {"ay": bu_ay})
+        rows = cur.fetchall()
+
+    toplam = dict.fromkeys(YASLANDIRMA_DILIMLERI, money(0))
+    cariler = []
+    for cari_id, firma_adi, bakiye, *dilimler in rows:
+        kayit = {"cari_id": cari_id, "firma_adi": firma_adi, "bakiye": bakiye}
+        for ad, tutar in zip(YASLANDIRMA_DILIMLERI, dilimler):
+            kayit[ad] = money(tutar or 0)
+            toplam[ad] += kayit[ad]
+        cariler.append(kayit)
+    limit = page_limit(default=100, maximum=1000)
+    return jsonify({"tarih": date.today(), "toplam": toplam, "cariler": cariler[:limit]})
+
+# ───────────────────────────────────────────────────────
+# 🔄 SENKRONİZASYON (delta + çevrimdışı kuyruk)
+# ───────────────────────────────────────────────────────
+
+SYNC_ISLEMLER = {
+    "cari": cari_ekle,
+    "hareket": hareket_ekle,
+    "satis": satis_ekle,
+    "odeme": odeme_ekle,
+    "fatura": fatura_ekle,
+}
+
+@app.route("/api/sync")
+@token_required
+def api_sync():
+    """
+    ?cursor=<onceki yanittaki cursor> → o andan beri degisen satirlar:
+    {"cursor", "reset", "degisiklikler": {tablo: {"kayitlar": [...], "silinen": [id]}}}
+    reset=true ise istemci listeleri bastan yukler ve yeni cursor'i saklar.
+    Imlec bir veritabani snapshot'idir; degisiklik_log'daki xid'ler ona gore suzulur.
+    """
+    with get_db(transaction=True) as conn:
+        cur = conn.cursor()
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        cur.execute("SELECT pg_current_snapshot()::text, sinir::text FROM senkron_sinir")
+        simdi, sinir = cur.fetchone()
+        sonuc = {"cursor": encode_cursor(simdi), "reset": True, "degisiklikler": {}}
+
+        if not request.args.get("cursor"):
+            return jsonify(sonuc)
+        try:
+            (onceki,) = decode_cursor(request.args["cursor"], size=1)
+            cur.execute("SELECT pg_snapshot_xmin(%s::pg_snapshot) >= %s::xid8", (onceki, sinir))
+            gecerli = cur.fetchone()[0]
+        except (ValueError, psycopg2.DataError):
+            return jsonify({"error": "Gecersiz imlec"}), 400
+        if not gecerli:
+            return jsonify(sonuc)
 
         cur.execute("""
-            INSERT INTO hareketler
-            (cari_id,tarih,aciklama,borc,alacak,tur)
-            VALUES (%s,%s,%s,0,%s,'ödeme')
-        """, (
-            d["cari_id"],
-            d["tarih"],
-            hr,
-            tutar
-        ))
+            SELECT tablo, array_agg(DISTINCT kayit_id) FROM degisiklik_log
+            WHERE xid >= pg_snapshot_xmin(%s::pg_snapshot)
+              AND NOT pg_visible_in_snapshot(xid, %s::pg_snapshot)
+            GROUP BY tablo
+        """, (onceki, onceki))
+        degisen = dict(cur.fetchall())
+        if sum(len(ids) for ids in degisen.values()) > SYNC_MAX_CHANGES:
+            return jsonify(sonuc)
 
-    return jsonify({"ok": True})
+        for table in BACKUP_TABLES:
+            ids = degisen.get(table)
+            if not ids:
+                continue
+            cur.execute(f"SELECT * FROM {table} WHERE id = ANY(%s) ORDER BY id", (ids,))
+            kayitlar = rows_to_dicts(cur)
+            bulunan = {r["id"] for r in kayitlar}
+            sonuc["degisiklikler"][table] = {
+                "kayitlar": kayitlar,
+                "silinen": sorted(set(ids) - bulunan),
+            }
+        sonuc["reset"] = False
+    return jsonify(sonuc)
 
-@app.route("/api/odemeler/<int:oid>", methods=["DELETE"])
+@app.route("/api/sync/yaz", methods=["POST"])
 @token_required
-def api_odeme_sil(oid):
-    with get_db() as conn:
+def api_sync_yaz():
+    """
+    Cevrimdisi kuyruktan toplu yazma: {"islemler": [{"istemci_id", "tur", "veri"}]}.
+    Her islem istemci_id ile bir kez uygulanir; tekrar gonderilirse ilk sonuc
+    doner (durum="tekrar"). Islemler ayri savepoint'lerde, tek commit ile yazilir.
+    """
+    islemler = (request.json or {}).get("islemler")
+    if not isinstance(islemler, list) or not islemler:
+        return jsonify({"error": "islemler listesi zorunludur"}), 400
+    if len(islemler) > SYNC_MAX_BATCH:
+        return jsonify({"error": f"En fazla {SYNC_MAX_BATCH} islem gonderilebilir"}), 400
+
+    sonuclar = []
+    with get_db(transaction=True) as conn:
         cur = conn.cursor()
-        cur.execute("SELECT cari_id,tarih,tutar FROM odemeler WHERE id=%s", (oid,))
-        r = cur.fetchone()
+        for op in islemler:
+            op = op if isinstance(op, dict) else {}
+            iid = str(op.get("istemci_id") or "")
+            fn = SYNC_ISLEMLER.get(op.get("tur"))
+            if not 8 <= len(iid) <= 64 or not fn:
+                sonuclar.append({"istemci_id": iid, "durum": "hata",
+                                 "hata": "Gecersiz istemci_id veya tur"})
+                continue
 
-        if r:
-            cur.execute("""
-                DELETE FROM hareketler
-                WHERE cari_id=%s AND tarih=%s AND alacak=%s AND tur='ödeme'
-            """, (r[0], r[1], r[2]))
+            cur.execute("SAVEPOINT islem")
+            try:
+                cur.execute("""
+                    INSERT INTO istemci_islemleri (istemci_id, tur) VALUES (%s,%s)
+                    ON CONFLICT DO NOTHING RETURNING 1
+                """, (iid, op["tur"]))
+                if not cur.fetchone():
+                    cur.execute("SELECT sonuc FROM istemci_islemleri WHERE istemci_id=%s", (iid,))
+                    sonuclar.append({"istemci_id": iid, "durum": "tekrar", "sonuc": cur.fetchone()[0]})
+                else:
+                    sonuc = fn(cur, op.get("veri") or {})
+                    cur.execute("UPDATE istemci_islemleri SET sonuc=%s WHERE istemci_id=%s",
+                                (app.json.dumps(sonuc), iid))
+                    sonuclar.append({"istemci_id": iid, "durum": "tamam", "sonuc": sonuc})
+                cur.execute("RELEASE SAVEPOINT islem")
+            except (ValueError, KayitBulunamadi, psycopg2.Error) as e:
+                cur.execute("ROLLBACK TO SAVEPOINT islem")
+                hata = str(e)
+                if isinstance(e, psycopg2.Error) and e.diag.message_primary:
+                    hata = e.diag.message_primary
+                sonuclar.append({"istemci_id": iid, "durum": "hata", "hata": hata})
 
-        cur.execute("DELETE FROM odemeler WHERE id=%s", (oid,))
+        cur.execute("DELETE FROM istemci_islemleri WHERE olusturma < now() - make_interval(days => %s)",
+                    (SYNC_LOG_DAYS,))
+    return jsonify({"sonuclar": sonuclar})
 
-    return jsonify({"ok": True})
+# ───────────────────────────────────────────────────────
+# 📥 TOPLU İÇE AKTARMA
+# ───────────────────────────────────────────────────────
+
+def read_import_rows():
+    """
+    Istekten satirlari okur: JSON dizi / {"rows": [...]} ya da CSV
+    (multipart 'file' alani veya ham govde). CSV ayiricisi , ; veya TAB.
+    """
+    if request.is_json:
+        data = request.get_json(silent=True)
+        rows = data.get("rows") if isinstance(data, dict) else data
+        if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+            raise ValueError("JSON nesne dizisi bekleniyor")
+    else:
+        f = request.files.get("file")
+        raw = f.read() if f else request.get_data()
+        try:
+            text = raw.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise ValueError("CSV UTF-8 olmali")
+        try:
+            dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        rows = list(csv.DictReader(io.StringIO(text), dialect=dialect))
+    if len(rows) > IMPORT_MAX_ROWS:
+        raise ValueError(f"En fazla {IMPORT_MAX_ROWS} satir aktarilabilir")
+    return [
+        {str(k).strip().lower(): (v.strip() if isinstance(v, str) else v)
+         for k, v in r.items() if k is not None}
+        for r in rows
+    ]
+
+
+def _text(r, key, default=""):
+    v = r.get(key)
+    return default if v is None or v == "" else str(v)
+
+
+def _import_cari(r, ctx):
+    if not r.get("firma_adi"):
+        raise ValueError("Firma adı zorunludur")
+    return (_text(r, "firma_adi"), _text(r, "yetkili"), _text(r, "telefon"),
+            _text(r, "email"), _text(r, "adres"), _text(r, "notlar"))
+
+
+def _import_urun(r, ctx):
+    if not r.get("ad"):
+        raise ValueError("Ürün adı zorunludur")
+    return (_text(r, "ad"), _text(r, "kod"), _text(r, "birim", "Adet"),
+            money(r.get("fiyat")), parse_amount(r.get("stok")), _text(r, "notlar"))
+
+
+def _import_hareket(r, ctx):
+    cid = r.get("cari_id")
+    if cid not in (None, ""):
+        try:
+            cid = int(cid)
+        except (TypeError, ValueError):
+            raise ValueError(f"Gecersiz cari_id: {cid}")
+        if cid not in ctx["cari_ids"]:
+            raise ValueError(f"Cari bulunamadi: {cid}")
+    elif r.get("firma_adi"):
+        ids = ctx["cari_adlari"].get(str(r["firma_adi"]).casefold(), [])
+        if len(ids) != 1:
+            raise ValueError(f"Cari {'bulunamadi' if not ids else 'birden fazla'}: {r['firma_adi']}")
+        cid = ids[0]
+    else:
+        raise ValueError("cari_id veya firma_adi zorunludur")
+
+    borc, alacak = money(r.get("borc")), money(r.get("alacak"))
+    if borc < 0 or alacak < 0:
+        raise ValueError("Borc/alacak negatif olamaz")
+    tur = _text(r, "tur", "manuel")
+    if tur not in ("manuel", "devir"):
+        raise ValueError(f"Gecersiz tur: {tur} (manuel/devir)")
+    return (cid, parse_date(r.get("tarih")), _text(r, "aciklama"), borc, alacak, tur)
+
+
+def _hareket_context(cur):
+    cur.execute("SELECT id, firma_adi FROM cariler")
+    ids, adlar = set(), {}
+    for cid, ad in cur.fetchall():
+        ids.add(cid)
+        adlar.setdefault((ad or "").casefold(), []).append(cid)
+    return {"cari_ids": ids, "cari_adlari": adlar}
+
+
+IMPORT_KINDS = {
+    "cariler": ("cariler", ("firma_adi", "yetkili", "telefon", "email", "adres", "notlar"),
+                _import_cari, None),
+    "urunler": ("urunler", ("ad", "kod", "birim", "fiyat", "stok", "notlar"),
+                _import_urun, None),
+    "hareketler": ("hareketler", ("cari_id", "tarih", "aciklama", "borc", "alacak", "tur"),
+                   _import_hareket, _hareket_context),
+}
+IMPORT_MAX_ERRORS = 1000
+
+
+def copy_rows(cur, table, columns, rows):
+    """Satirlari tek COPY FROM STDIN ile yukler (bos metin NULL olmasin diye hepsi tirnakli)."""
+    buf = io.StringIO()
+    csv.writer(buf, quoting=csv.QUOTE_ALL, lineterminator="\n").writerows(rows)
+    buf.seek(0)
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf
+    )
+
+
+@app.route("/api/import/<kind>", methods=["POST"])
+@token_required
+def api_import(kind):
+    """
+    Toplu ice aktarma: cariler, urunler ve acilis bakiyeleri (hareketler).
+    Tum satirlar once dogrulanir; hata varsa hicbiri yuklenmez
+    (?skip_invalid=1 ile gecerliler yuklenir). ?dry_run=1 sadece dogrular.
+    """
+    if kind not in IMPORT_KINDS:
+        return jsonify({"error": f"Gecersiz tur: {kind}"}), 404
+    table, columns, validate, context = IMPORT_KINDS[kind]
+    dry_run = request.args.get("dry_run") == "1"
+    skip_invalid = request.args.get("skip_invalid") == "1"
+
+    try:
+        rows = read_import_rows()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not rows:
+        return jsonify({"error": "Aktarilacak satir yok"}), 400
+
+    with get_db(transaction=True) as conn:
+        cur = conn.cursor()
+        ctx = context(cur) if context else None
+        valid, hatalar = [], []
+        for i, r in enumerate(rows, 1):
+            try:
+                valid.append(validate(r, ctx))
+            except ValueError as e:
+                hatalar.append({"satir": i, "hata": str(e)})
+
+        sonuc = {
+            "dry_run": dry_run,
+            "toplam": len(rows),
+            "gecerli": len(valid),
+            "hatali": len(hatalar),
+            "eklenen": 0,
+            "hatalar": hatalar[:IMPORT_MAX_ERRORS],
+        }
+        if hatalar and not skip_invalid and not dry_run:
+            return jsonify({**sonuc, "error": "Hatali satirlar var, hicbir kayit eklenmedi"}), 400
+        if not dry_run and valid:
+            copy_rows(cur, table, columns, valid)
+            sonuc["eklenen"] = len(valid)
+
+    return jsonify(sonuc)
 
 # ───────────────────────────────────────────────────────
 # BAŞLAT
 # ───────────────────────────────────────────────────────
 
-# Gunicorn veya direkt python ile baslatilsin - tablolari her zaman olustur
-try:
-    init_db()
-    print("✓ Veritabani tablolari hazir")
-except Exception as e:
-    print(f"⚠ init_db hatasi: {e}")
+# Sema artik deploy oncesi `flask --app app db upgrade` ile guncellenir.
+# Tek surec calisan ortamlarda AUTO_MIGRATE=1 ile import sirasinda da uygulanabilir.
+if os.environ.get("AUTO_MIGRATE") == "1":
+    try:
+        migrate()
+        print("✓ Veritabani semasi guncel")
+    except Exception as e:
+        print(f"⚠ migrate hatasi: {e}")
 
 if __name__ == "__main__":
+    migrate()
+    start_background()
     print(f"✓ Sunucu baslatildi → http://localhost:{PORT}")
     app.run(host="0.0.0.0", port=PORT, debug=False)
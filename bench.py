@@ -0,0 +1,545 @@
+"""
+Cari Hesap Takip - performans olcumu
+
+Yerel bir PostgreSQL'e tekrarlanabilir sentetik veri yukler (carilere carpik
+dagilan hareketler, satislar ve odemeler), uclari Flask test istemcisiyle ya da
+--gunicorn ile gercek sunucu uzerinden cagirir ve uc basina throughput ile
+p50/p95/p99 gecikmeyi JSON olarak kaydeder.
+
+    BENCH_DATABASE_URL=postgresql://postgres@127.0.0.1:5432/cari_bench \\
+        python bench.py --cariler 500 --hareket 200 --out bench_output.json
+
+    python bench.py --compare onceki.json          # yavaslayan uclari isaretler
+    python bench.py --gunicorn --workers 2 -c 8    # gercek sunucu, 8 eszamanli istemci
+
+Uygulama varsayilan olarak SSL ister (DB_SSLMODE=require); SSL'siz yerel
+sunucu icin olcum DB_SSLMODE'u tanimli degilse "prefer" yapar.
+
+Yedek/geri yukleme olcumu icin SUPABASE_URL ve SUPABASE_SERVICE_ROLE_KEY
+tanimli olmali (yerel bir Storage ornegi yeterli); yoksa bu uclar atlanir.
+
+DIKKAT: BENCH_DATABASE_URL veritabanindaki tum veri silinir.
+"""
+
+import json
+import os
+import platform
+import random
+import re
+import secrets
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import click
+import jwt
+import requests
+
+KURUS = Decimal("0.01")
+
+FIRMA_ADLARI = ["Yıldız", "Özkan", "Çelik", "Güneş", "Doğan", "Şahin", "Aydın", "Kılıç",
+                "Işık", "Ege", "Anadolu", "Karadeniz", "Marmara", "Ak", "Demir", "Umut"]
+FIRMA_TURLERI = ["Gıda", "İnşaat", "Tekstil", "Ticaret", "Yapı", "Otomotiv", "Market", "Lojistik"]
+ODEME_YONTEMLERI = ["Nakit"] * 5 + ["Havale"] * 3 + ["Kredi Kartı"] * 2 + ["Çek"]
+
+
+def uygulamayi_yukle(db_url, pool_max):
+    # app modulu import sirasinda ortami okur; once ayarlanmali
+    os.environ["DATABASE_URL"] = db_url
+    os.environ.setdefault("SUPABASE_JWT_SECRET", secrets.token_hex(32))
+    os.environ["BACKUP_INTERVAL_MINUTES"] = "0"
+    os.environ.pop("AUTO_MIGRATE", None)
+    os.environ["DB_POOL_MAX"] = str(pool_max)
+    # Yerel sunucuda SSL olmayabilir; --gunicorn da bu ortami devralir
+    os.environ.setdefault("DB_SSLMODE", "prefer")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as A
+    return A
+
+
+def token_uret():
+    return jwt.encode(
+        {"sub": "bench", "aud": "authenticated", "role": "authenticated",
+         "exp": int(time.time()) + 24 * 3600},
+        os.environ["SUPABASE_JWT_SECRET"], algorithm="HS256",
+    )
+
+
+# ───────────────────────────────────────────────────────
+# SENTETİK VERİ
+# ───────────────────────────────────────────────────────
+
+def veri_uret(A, cari_sayisi, ort_hareket, gun, seed):
+    """
+    cari_sayisi cari, cari basina ortalama ort_hareket hareket. Hareket sayisi
+    Pareto ile dagitilir (az sayida cari hareketlerin cogunu tasir), urun
+    secimi de birkac urune yigilir. Ayni seed ayni veriyi uretir.
+    """
+    rng = random.Random(seed)
+    started = time.monotonic()
+    urun_sayisi = max(20, cari_sayisi // 5)
+    bugun = date.today()
+
+    with A.get_db(transaction=True) as conn:
+        cur = conn.cursor()
+        A.truncate_data_tables(cur)
+        cur.execute("TRUNCATE degisiklik_log, istemci_islemleri")
+
+        urunler = []
+        for i in range(urun_sayisi):
+            fiyat = Decimal(str(round(rng.lognormvariate(4, 1), 2))).quantize(KURUS)
+            urunler.append((f"U{i:05d}", f"{rng.choice(FIRMA_TURLERI)} ürünü {i}", fiyat))
+        urun_ids = [r[0] for r in A.execute_values(cur, """
+            INSERT INTO urunler (kod, ad, fiyat, stok) VALUES %s RETURNING id
+        """, [(k, a, f, 1000) for k, a, f in urunler], fetch=True)]
+
+        cariler = [(f"{rng.choice(FIRMA_ADLARI)} {rng.choice(FIRMA_TURLERI)} {i}",
+                    f"Yetkili {i}", f"05{rng.randint(300000000, 599999999)}", f"cari{i}@ornek.com")
+                   for i in range(cari_sayisi)]
+        cari_ids = [r[0] for r in A.execute_values(cur, """
+            INSERT INTO cariler (firma_adi, yetkili, telefon, email) VALUES %s RETURNING id
+        """, cariler, fetch=True)]
+
+        agirlik = [rng.paretovariate(1.2) for _ in cari_ids]
+        toplam_agirlik = sum(agirlik)
+        hedef = cari_sayisi * ort_hareket
+        sayilar = [max(1, round(hedef * w / toplam_agirlik)) for w in agirlik]
+
+        satis, odeme, manuel = [], [], []
+        for cid, n in zip(cari_ids, sayilar):
+            for _ in range(n):
+                tarih = bugun - timedelta(days=rng.randrange(gun))
+                r = rng.random()
+                if r < 0.6:
+                    u = min(int(urun_sayisi * rng.random() ** 3), urun_sayisi - 1)
+                    adet = rng.randint(1, 20)
+                    fiyat = urunler[u][2]
+                    satis.append((cid, urun_ids[u], urunler[u][1], tarih, adet, fiyat,
+                                  (fiyat * adet).quantize(KURUS)))
+                elif r < 0.9:
+                    tutar = Decimal(str(round(rng.lognormvariate(6, 1), 2))).quantize(KURUS)
+                    odeme.append((cid, tarih, tutar, rng.choice(ODEME_YONTEMLERI)))
+                else:
+                    tutar = Decimal(str(round(rng.lognormvariate(5, 1), 2))).quantize(KURUS)
+                    manuel.append((cid, tarih, "Devir / düzeltme", tutar, Decimal(0), "manuel"))
+
+        # Kaynak satirlar ve bagli hareketler, uygulamanin yazdigi bicimde
+        for i in range(0, len(satis), 5000):
+            parca = satis[i:i + 5000]
+            ids = [r[0] for r in A.execute_values(cur, """
+                INSERT INTO satislar (cari_id, urun_id, tarih, adet, birim_fiyat, toplam, aciklama)
+                VALUES %s RETURNING id
+            """, [(c, u, t, a, f, tp, "") for c, u, _, t, a, f, tp in parca], fetch=True)]
+            A.execute_values(cur, """
+                INSERT INTO hareketler (cari_id, tarih, aciklama, borc, alacak, tur, kaynak, ref_id)
+                VALUES %s
+            """, [(c, t, A.satis_aciklama(ad, a, f), tp, 0, "satış", "satislar", sid)
+                  for (c, _, ad, t, a, f, tp), sid in zip(parca, ids)])
+        for i in range(0, len(odeme), 5000):
+            parca = odeme[i:i + 5000]
+            ids = [r[0] for r in A.execute_values(cur, """
+                INSERT INTO odemeler (cari_id, tarih, tutar, yontem, aciklama) VALUES %s RETURNING id
+            """, [(c, t, tp, y, "") for c, t, tp, y in parca], fetch=True)]
+            A.execute_values(cur, """
+                INSERT INTO hareketler (cari_id, tarih, aciklama, borc, alacak, tur, kaynak, ref_id)
+                VALUES %s
+            """, [(c, t, f"Ödeme ({y})", 0, tp, "ödeme", "odemeler", oid)
+                  for (c, t, tp, y), oid in zip(parca, ids)])
+        for i in range(0, len(manuel), 5000):
+            A.execute_values(cur, """
+                INSERT INTO hareketler (cari_id, tarih, aciklama, borc, alacak, tur) VALUES %s
+            """, manuel[i:i + 5000])
+
+    with A.get_db() as conn:
+        conn.cursor().execute("ANALYZE")
+
+    return {
+        "cariler": cari_sayisi,
+        "urunler": urun_sayisi,
+        "satislar": len(satis),
+        "odemeler": len(odeme),
+        "hareketler": len(satis) + len(odeme) + len(manuel),
+        "en_yogun_cari_hareket": max(sayilar),
+        "gun": gun,
+        "seed": seed,
+        "sure_ms": int((time.monotonic() - started) * 1000),
+    }, cari_ids, sayilar
+
+
+# ───────────────────────────────────────────────────────
+# İSTEMCİLER
+# ───────────────────────────────────────────────────────
+
+class TestIstemci:
+    """Flask test istemcisi; her thread kendi istemcisini kullanir."""
+
+    def __init__(self, app, headers):
+        self.app = app
+        self.headers = headers
+        self._yerel = threading.local()
+
+    def istek(self, method, url, body=None, headers=None):
+        c = getattr(self._yerel, "c", None)
+        if c is None:
+            c = self._yerel.c = self.app.test_client()
+        r = c.open(url, method=method, json=body,
+                   headers={**self.headers, **(headers or {})})
+        data = r.get_data()
+        return r.status_code, r.headers, data
+
+
+class HttpIstemci:
+    """Gercek sunucu (gunicorn) uzerinden; thread basina bir oturum."""
+
+    def __init__(self, base, headers):
+        self.base = base
+        self.headers = headers
+        self._yerel = threading.local()
+
+    def istek(self, method, url, body=None, headers=None):
+        s = getattr(self._yerel, "s", None)
+        if s is None:
+            s = self._yerel.s = requests.Session()
+            s.headers.update(self.headers)
+        r = s.request(method, self.base + url, json=body, headers=headers, timeout=300)
+        return r.status_code, r.headers, r.content
+
+
+def gunicorn_baslat(db_url, port, workers, threads):
+    env = {**os.environ, "DATABASE_URL": db_url}
+    proc = subprocess.Popen(
+        ["gunicorn", "app:app", "--bind", f"127.0.0.1:{port}",
+         "--workers", str(workers), "--threads", str(threads),
+         "--timeout", "300", "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+    )
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        if proc.poll() is not None:
+            raise click.ClickException("gunicorn baslatilamadi")
+        try:
+            requests.get(base + "/", timeout=1)
+            break
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    else:
+        proc.terminate()
+        raise click.ClickException("gunicorn 30 sn icinde cevap vermedi")
+    # "/" veritabanina dokunmaz; baglanti sorunu (sslmode vb.) olcumden once yakalansin
+    r = requests.get(base + "/api/cariler?limit=1", timeout=30,
+                     headers={"Authorization": f"Bearer {token_uret()}"})
+    if r.status_code != 200:
+        proc.terminate()
+        raise click.ClickException(f"gunicorn veritabanina ulasamiyor: {r.status_code} {r.text[:200]}")
+    return proc, base
+
+
+# ───────────────────────────────────────────────────────
+# ÖLÇÜM
+# ───────────────────────────────────────────────────────
+
+def yuzdelik(sureler):
+    if len(sureler) < 2:
+        v = sureler[0] if sureler else 0.0
+        return v, v, v
+    q = statistics.quantiles(sureler, n=100, method="inclusive")
+    return q[49], q[94], q[98]
+
+
+def olc(istemci, uretec, n, isinma, eszamanli, beklenen=(200, 201, 202, 304)):
+    """uretec() → (method, url, body, headers); n istek, eszamanli thread."""
+    for _ in range(isinma):
+        istemci.istek(*uretec())
+
+    sureler, hatalar, baytlar = [], [], [0]
+    kilit = threading.Lock()
+
+    def calis(adet):
+        yerel = []
+        for _ in range(adet):
+            method, url, body, headers = uretec()
+            t0 = time.perf_counter()
+            status, _, data = istemci.istek(method, url, body, headers)
+            yerel.append((time.perf_counter() - t0) * 1000)
+            with kilit:
+                baytlar[0] += len(data)
+                if status not in beklenen:
+                    hatalar.append(f"{status} {method} {url}: {data[:200]!r}")
+        with kilit:
+            sureler.extend(yerel)
+
+    paylar = [n // eszamanli + (1 if i < n % eszamanli else 0) for i in range(eszamanli)]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(eszamanli) as ex:
+        list(ex.map(calis, [p for p in paylar if p]))
+    sure = time.perf_counter() - t0
+
+    p50, p95, p99 = yuzdelik(sureler)
+    return {
+        "requests": len(sureler),
+        "errors": len(hatalar),
+        "error_sample": hatalar[:3],
+        "seconds": round(sure, 3),
+        "rps": round(len(sureler) / sure, 1) if sure else None,
+        "mean_ms": round(statistics.fmean(sureler), 2) if sureler else None,
+        "p50_ms": round(p50, 2),
+        "p95_ms": round(p95, 2),
+        "p99_ms": round(p99, 2),
+        "max_ms": round(max(sureler), 2) if sureler else None,
+        "bytes_per_request": round(baytlar[0] / len(sureler)) if sureler else None,
+    }
+
+
+def is_bekle(istemci, job_id, zaman_asimi=600):
+    bitis = time.monotonic() + zaman_asimi
+    while time.monotonic() < bitis:
+        _, _, data = istemci.istek("GET", f"/api/jobs/{job_id}")
+        job = json.loads(data)
+        if job.get("durum") in ("tamam", "hata", "kesildi"):
+            return job
+        time.sleep(0.05)
+    raise click.ClickException(f"is {job_id} {zaman_asimi} sn icinde bitmedi")
+
+
+def is_olc(istemci, url, n):
+    """Kuyruga alinan isleri (yedek/geri yukleme) sonuclanana kadar olcer."""
+    sureler, hatalar = [], []
+    t_toplam = time.perf_counter()
+    for _ in range(n):
+        t0 = time.perf_counter()
+        status, _, data = istemci.istek("GET", url)
+        if status != 202:
+            hatalar.append(f"{status}: {data[:200]!r}")
+            continue
+        job = is_bekle(istemci, json.loads(data)["job_id"])
+        sureler.append((time.perf_counter() - t0) * 1000)
+        if job["durum"] != "tamam":
+            hatalar.append(job.get("hata"))
+    sure = time.perf_counter() - t_toplam
+    p50, p95, p99 = yuzdelik(sureler or [0.0])
+    return {
+        "requests": n,
+        "errors": len(hatalar),
+        "error_sample": hatalar[:3],
+        "seconds": round(sure, 3),
+        "rps": round(len(sureler) / sure, 3) if sure else None,
+        "mean_ms": round(statistics.fmean(sureler), 2) if sureler else None,
+        "p50_ms": round(p50, 2),
+        "p95_ms": round(p95, 2),
+        "p99_ms": round(p99, 2),
+        "max_ms": round(max(sureler), 2) if sureler else None,
+    }
+
+
+def is_yaz(ad, r):
+    click.echo(f"{ad:<52} p50 {r['p50_ms']:>10.1f}  max {r['max_ms'] or 0:>10.1f} ms"
+               + (f"  ⚠ {r['errors']} hata: {r['error_sample'][0]}" if r["errors"] else ""))
+
+
+def senaryolar(istemci, cari_ids, sayilar, seed):
+    """(ad, uretec, yazma_mi) listesi. Cari secimi hareket yogunluguna gore agirlikli."""
+    rng = random.Random(seed + 1)
+    kilit = threading.Lock()
+
+    def cari():
+        with kilit:
+            return rng.choices(cari_ids, weights=sayilar)[0]
+
+    def rastgele(a, b):
+        with kilit:
+            return rng.randint(a, b)
+
+    def sabit(url, headers=None):
+        return lambda: ("GET", url, None, headers)
+
+    def etag(url):
+        _, h, _ = istemci.istek("GET", url)
+        return {"If-None-Match": h.get("ETag", "")}
+
+    _, _, data = istemci.istek("GET", "/api/sync")
+    sync_cursor = json.loads(data)["cursor"]
+    bu_yil = date.today().year
+    bugun = date.today().isoformat()
+    aramalar = ["yildiz", "gida", "ozkan", "celik insaat", "isik", "marmra", "05", "cari1"]
+
+    return [
+        ("GET /api/bootstrap", sabit("/api/bootstrap"), False),
+        ("GET /api/bootstrap (304)", sabit("/api/bootstrap", etag("/api/bootstrap")), False),
+        ("GET /api/cariler", sabit("/api/cariler"), False),
+        ("GET /api/cariler (304)", sabit("/api/cariler", etag("/api/cariler")), False),
+        ("GET /api/cariler?with_balance=1&sort=bakiye_desc",
+         sabit("/api/cariler?with_balance=1&sort=bakiye_desc&limit=50"), False),
+        ("GET /api/cariler?format=columns", sabit("/api/cariler?format=columns"), False),
+        ("GET /api/urunler", sabit("/api/urunler"), False),
+        ("GET /api/satislar", sabit("/api/satislar"), False),
+        ("GET /api/satislar?cari_id", lambda: ("GET", f"/api/satislar?cari_id={cari()}", None, None), False),
+        ("GET /api/odemeler", sabit("/api/odemeler"), False),
+        ("GET /api/hareketler/<id>", lambda: ("GET", f"/api/hareketler/{cari()}", None, None), False),
+        ("GET /api/hareketler/<id>?yil",
+         lambda: ("GET", f"/api/hareketler/{cari()}?yil={bu_yil}", None, None), False),
+        ("GET /api/cariler/<id>/ozet", lambda: ("GET", f"/api/cariler/{cari()}/ozet", None, None), False),
+        ("GET /api/cariler/<id>/detay", lambda: ("GET", f"/api/cariler/{cari()}/detay", None, None), False),
+        ("GET /api/ara", lambda: ("GET", f"/api/ara?q={aramalar[rastgele(0, len(aramalar) - 1)]}",
+                                  None, None), False),
+        ("GET /api/raporlar/aylik-satis", sabit("/api/raporlar/aylik-satis?grup=urun"), False),
+        ("GET /api/raporlar/odeme-yontemleri", sabit("/api/raporlar/odeme-yontemleri"), False),
+        ("GET /api/raporlar/borclular", sabit("/api/raporlar/borclular"), False),
+        ("GET /api/raporlar/yaslandirma", sabit("/api/raporlar/yaslandirma"), False),
+        ("GET /api/sync?cursor", sabit(f"/api/sync?cursor={sync_cursor}"), False),
+        ("POST /api/hareketler",
+         lambda: ("POST", "/api/hareketler",
+                  {"cari_id": cari(), "tarih": bugun, "aciklama": "bench", "borc": rastgele(1, 500),
+                   "alacak": 0}, None), True),
+        ("POST /api/satislar",
+         lambda: ("POST", "/api/satislar",
+                  {"cari_id": cari(), "urun_id": rastgele(1, 20), "tarih": bugun,
+                   "adet": rastgele(1, 5), "birim_fiyat": rastgele(10, 100)}, None), True),
+        ("POST /api/odemeler",
+         lambda: ("POST", "/api/odemeler",
+                  {"cari_id": cari(), "tarih": bugun, "tutar": rastgele(10, 1000),
+                   "yontem": "Nakit"}, None), True),
+    ]
+
+
+def git_surumu():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def karsilastir(onceki_yol, sonuclar, esik):
+    """p95'i esikten fazla artan uclari listeler."""
+    with open(onceki_yol) as f:
+        onceki = json.load(f)["results"]
+    kotulesen = []
+    click.echo(f"\n{'uc':<52} {'onceki p95':>11} {'simdi p95':>11} {'fark':>8}")
+    for ad, r in sonuclar.items():
+        o = onceki.get(ad)
+        if not o or not o.get("p95_ms") or not r.get("p95_ms"):
+            continue
+        fark = r["p95_ms"] / o["p95_ms"] - 1
+        isaret = "  ⚠" if fark > esik else ""
+        click.echo(f"{ad:<52} {o['p95_ms']:>11.2f} {r['p95_ms']:>11.2f} {fark:>+7.0%}{isaret}")
+        if fark > esik:
+            kotulesen.append(ad)
+    return kotulesen
+
+
+@click.command()
+@click.option("--database-url", envvar="BENCH_DATABASE_URL", required=True,
+              help="Olcum veritabani (icerigi silinir). BENCH_DATABASE_URL")
+@click.option("--cariler", default=200, show_default=True, help="Cari sayisi")
+@click.option("--hareket", default=50, show_default=True, help="Cari basina ortalama hareket")
+@click.option("--gun", default=730, show_default=True, help="Hareketlerin yayildigi gun sayisi")
+@click.option("--seed", default=42, show_default=True)
+@click.option("-n", "--istek", default=200, show_default=True, help="Uc basina istek")
+@click.option("--isinma", default=10, show_default=True, help="Uc basina isinma istegi")
+@click.option("-c", "--eszamanli", default=1, show_default=True, help="Eszamanli istemci")
+@click.option("--yedek-tekrar", default=3, show_default=True, help="backup-now / restore tekrari")
+@click.option("--sadece", default=None, help="Yalnizca adi bu regex'e uyan uclar")
+@click.option("--veri-yok", is_flag=True, help="Veriyi yeniden uretme (onceki calistirmadaki kalir)")
+@click.option("--onbelleksiz", is_flag=True, help="Surec ici onbellegi kapali olc")
+@click.option("--gunicorn", "gunicorn_", is_flag=True, help="Gercek gunicorn sunucusu uzerinden")
+@click.option("--workers", default=1, show_default=True)
+@click.option("--threads", default=1, show_default=True)
+@click.option("--port", default=8123, show_default=True)
+@click.option("--out", default="bench_output.json", show_default=True)
+@click.option("--compare", default=None, type=click.Path(exists=True), help="Onceki sonuc JSON'u")
+@click.option("--esik", default=0.2, show_default=True, help="--compare icin p95 artis esigi")
+def main(database_url, cariler, hareket, gun, seed, istek, isinma, eszamanli, yedek_tekrar,
+         sadece, veri_yok, onbelleksiz, gunicorn_, workers, threads, port, out, compare, esik):
+    A = uygulamayi_yukle(database_url, pool_max=max(10, eszamanli + 4))
+    A.migrate()
+
+    if veri_yok:
+        with A.get_db() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT cari_id, hareket_sayisi FROM cari_bakiye WHERE hareket_sayisi > 0")
+            rows = cur.fetchall()
+        veri = {"yeniden_uretilmedi": True, "cariler": len(rows)}
+        cari_ids, sayilar = [r[0] for r in rows], [r[1] for r in rows]
+    else:
+        click.echo(f"Veri uretiliyor: {cariler} cari x ~{hareket} hareket ...")
+        veri, cari_ids, sayilar = veri_uret(A, cariler, hareket, gun, seed)
+        click.echo(f"✓ {veri['hareketler']} hareket, {veri['sure_ms']} ms")
+
+    headers = {"Authorization": "Bearer " + token_uret()}
+    proc = None
+    if gunicorn_:
+        proc, base = gunicorn_baslat(database_url, port, workers, threads)
+        istemci = HttpIstemci(base, headers)
+    else:
+        if not onbelleksiz:
+            A.start_background()
+            time.sleep(0.5)  # dinleyici baglansin
+        istemci = TestIstemci(A.app, headers)
+
+    sonuclar = {}
+    try:
+        for ad, uretec, _ in senaryolar(istemci, cari_ids, sayilar, seed):
+            if sadece and not re.search(sadece, ad):
+                continue
+            sonuclar[ad] = r = olc(istemci, uretec, istek, isinma, eszamanli)
+            click.echo(f"{ad:<52} {r['rps']:>8} rps  p50 {r['p50_ms']:>8.2f}  "
+                       f"p95 {r['p95_ms']:>8.2f}  p99 {r['p99_ms']:>8.2f} ms"
+                       + (f"  ⚠ {r['errors']} hata" if r["errors"] else ""))
+
+        if A.SUPABASE_URL and A.SUPABASE_KEY and yedek_tekrar:
+            for ad, url in [("GET /backup-now (full)", "/backup-now?tur=full"),
+                            ("GET /backup-now (incremental)", "/backup-now?tur=incremental")]:
+                if sadece and not re.search(sadece, ad):
+                    continue
+                sonuclar[ad] = is_olc(istemci, url, yedek_tekrar)
+                is_yaz(ad, sonuclar[ad])
+            ad = "GET /restore/<set>"
+            if not sadece or re.search(sadece, ad):
+                _, _, data = istemci.istek("GET", "/backup-now?tur=full")
+                job = is_bekle(istemci, json.loads(data)["job_id"])
+                if job["durum"] == "tamam":
+                    sonuclar[ad] = is_olc(istemci, f"/restore/{job['sonuc']['file']}", yedek_tekrar)
+                    is_yaz(ad, sonuclar[ad])
+                else:
+                    click.echo(f"• geri yukleme atlandi, yedek alinamadi: {job.get('hata')}")
+        else:
+            click.echo("• SUPABASE_URL/SUPABASE_SERVICE_ROLE_KEY yok: yedek/geri yukleme atlandi")
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+    rapor = {
+        "meta": {
+            "tarih": datetime.now().isoformat(timespec="seconds"),
+            "git": git_surumu(),
+            "python": platform.python_version(),
+            "mod": f"gunicorn w={workers} t={threads}" if gunicorn_ else "test_client",
+            "onbellek": not onbelleksiz,
+            "istek": istek,
+            "isinma": isinma,
+            "eszamanli": eszamanli,
+        },
+        "veri": veri,
+        "results": sonuclar,
+    }
+    with open(out, "w") as f:
+        json.dump(rapor, f, indent=2, ensure_ascii=False)
+    click.echo(f"\n✓ Sonuclar: {out}")
+
+    if compare:
+        kotulesen = karsilastir(compare, sonuclar, esik)
+        if kotulesen:
+            click.echo(f"⚠ {len(kotulesen)} uc %{esik * 100:.0f}'den fazla yavasladi")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+# Gunicorn bu dosyayi calisma dizininden otomatik okur.
+
+def post_worker_init(worker):
+    # Zamanlanmis yedekleme thread'i her worker surecinde fork sonrasi baslar
+    from app import start_background
+    start_background()
@@ -1,6 +1,29 @@
-const CACHE_NAME = 'cari-pwa-v4';
+const CACHE_NAME = 'cari-pwa-v7';
+const API_CACHE = 'cari-api-v1';
 const SHELL = ['/static/manifest.json', '/static/icon-192.png'];
 
+// Stale-while-revalidate ile sunulan liste uclari (ETag destekli)
+const SWR_PATHS = [
+  /^\/api\/cariler$/,
+  /^\/api\/cariler\/\d+\/ozet$/,
+  /^\/api\/cariler\/\d+\/detay$/,
+  /^\/api\/bootstrap$/,
+  /^\/api\/urunler$/,
+  /^\/api\/satislar$/,
+  /^\/api\/odemeler$/,
+  /^\/api\/hareketler\/\d+$/,
+];
+
+// Cevrimdisiyken kuyruga alinan yazmalar → /api/sync/yaz islem turu
+const QUEUE_PATHS = {
+  '/api/cariler': 'cari',
+  '/api/hareketler': 'hareket',
+  '/api/satislar': 'satis',
+  '/api/odemeler': 'odeme',
+  '/api/faturalar': 'fatura',
+};
+const QUEUE_BATCH = 50;
+
 // ── Install ─────────────────────────────────────
 self.addEventListener('install', e => {
   e.waitUntil(
@@ -14,7 +37,7 @@ self.addEventListener('activate', e => {
   e.waitUntil(
     caches.keys().then(keys =>
       Promise.all(
-        keys.filter(k => k !== CACHE_NAME)
+        keys.filter(k => k !== CACHE_NAME && k !== API_CACHE)
             .map(k => caches.delete(k))
       )
     )
@@ -22,20 +45,174 @@ self.addEventListener('activate', e => {
   self.clients.claim();
 });
 
+// ── API yardimcilari ────────────────────────────
+function offline() {
+  return new Response(JSON.stringify({error: 'Çevrimdışı'}), {
+    status: 503,
+    headers: {'Content-Type': 'application/json'}
+  });
+}
+
+// Ag istegi If-None-Match ile HTTP onbellegi uzerinden gider (304 ucuz);
+// icerik degistiyse (ETag farkli) acik sayfalara haber verilir.
+async function revalidate(request) {
+  const resp = await fetch(request);
+  if (resp.status === 200) {
+    const cache = await caches.open(API_CACHE);
+    const old = await cache.match(request);
+    await cache.put(request, resp.clone());
+    if (old && old.headers.get('ETag') !== resp.headers.get('ETag')) {
+      const clients = await self.clients.matchAll();
+      clients.forEach(c => c.postMessage({type: 'api-guncellendi', url: request.url}));
+    }
+  }
+  return resp;
+}
+
+// ── Yazma kuyrugu (IndexedDB) ───────────────────
+function kuyrukDb() {
+  return new Promise((resolve, reject) => {
+    const req = indexedDB.open('cari-kuyruk', 1);
+    req.onupgradeneeded = () => req.result.createObjectStore('islemler', {keyPath: 'istemci_id'});
+    req.onsuccess = () => resolve(req.result);
+    req.onerror = () => reject(req.error);
+  });
+}
+
+async function kuyruk(mode, fn) {
+  const db = await kuyrukDb();
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction('islemler', mode);
+    const req = fn(tx.objectStore('islemler'));
+    tx.oncomplete = () => resolve(req && req.result);
+    tx.onerror = () => reject(tx.error);
+  });
+}
+
+const kuyrugaEkle = item => kuyruk('readwrite', s => s.put(item));
+const kuyruguOku = () => kuyruk('readonly', s => s.getAll())
+  .then(items => items.sort((a, b) => a.zaman - b.zaman));
+const kuyruktanSil = ids => kuyruk('readwrite', s => { ids.forEach(id => s.delete(id)); });
+
+async function bildir(mesaj) {
+  const clients = await self.clients.matchAll();
+  clients.forEach(c => c.postMessage(mesaj));
+}
+
+// Kuyrugu partiler halinde gonderir. Sunucu istemci_id ile tekrari ayikladigi
+// icin yarida kesilen gonderim guvenle yeniden denenebilir. Token yalnizca
+// sayfadan gelir; yoksa ya da suresi dolmussa sayfadan taze token istenir.
+let gonderim = null;
+function kuyruguGonder(token) {
+  if (!gonderim) gonderim = _kuyruguGonder(token).finally(() => { gonderim = null; });
+  return gonderim;
+}
+
+async function _kuyruguGonder(token) {
+  const items = await kuyruguOku();
+  if (!items.length) return;
+  if (!token) {
+    await bildir({type: 'kuyruk-token-gerekli', kalan: items.length});
+    return;
+  }
+  let gonderilen = 0;
+  const hatalar = [];
+  for (let i = 0; i < items.length; i += QUEUE_BATCH) {
+    const parti = items.slice(i, i + QUEUE_BATCH);
+    const resp = await fetch('/api/sync/yaz', {
+      method: 'POST',
+      headers: {'Content-Type': 'application/json', 'Authorization': 'Bearer ' + token},
+      body: JSON.stringify({islemler: parti.map(({istemci_id, tur, veri}) => ({istemci_id, tur, veri}))}),
+    });
+    if (resp.status === 401) {
+      await bildir({type: 'kuyruk-token-gerekli', token, kalan: items.length - i});
+      return;
+    }
+    if (!resp.ok) break;   // sunucu hatasi; kuyruk sonraki denemeye kalir
+    const {sonuclar} = await resp.json();
+    // tamam / tekrar / hata: hepsi kesin sonuc, kuyruktan cikar
+    await kuyruktanSil(sonuclar.map(r => r.istemci_id));
+    gonderilen += sonuclar.filter(r => r.durum !== 'hata').length;
+    hatalar.push(...sonuclar.filter(r => r.durum === 'hata'));
+  }
+  if (gonderilen) await caches.delete(API_CACHE);
+  const kalan = (await kuyruguOku()).length;
+  await bildir({type: 'kuyruk-gonderildi', gonderilen, hatalar, kalan});
+}
+
+// Yazma istegi: basariliysa onbellekteki listeler eskidi; ag yoksa
+// kuyruga alinabilen POST'lar IndexedDB'ye yazilip 202 ile onaylanir.
+// istemci_id ilk denemeden once atanir (X-Istemci-Id): sunucu yazip yanit
+// yolda kaybolduysa kuyruktan ayni id ile gelen tekrar ikinci kez yazilmaz.
+async function yazVeyaKuyruk(request) {
+  const tur = request.method === 'POST' && QUEUE_PATHS[new URL(request.url).pathname];
+  const kopya = tur ? request.clone() : null;
+  const istemciId = tur ? crypto.randomUUID() : null;
+  if (tur) {
+    const headers = new Headers(request.headers);
+    headers.set('X-Istemci-Id', istemciId);
+    request = new Request(request, {headers});
+  }
+  try {
+    const resp = await fetch(request);
+    if (resp.ok) await caches.delete(API_CACHE);
+    return resp;
+  } catch (err) {
+    if (!tur) return offline();
+    const item = {
+      istemci_id: istemciId,
+      tur,
+      veri: await kopya.json(),
+      zaman: Date.now(),
+    };
+    await kuyrugaEkle(item);
+    if (self.registration.sync) self.registration.sync.register('kuyruk').catch(() => {});
+    return new Response(JSON.stringify({ok: true, kuyrukta: true, istemci_id: item.istemci_id}), {
+      status: 202,
+      headers: {'Content-Type': 'application/json'}
+    });
+  }
+}
+
+self.addEventListener('sync', e => {
+  if (e.tag === 'kuyruk') e.waitUntil(kuyruguGonder());
+});
+
+self.addEventListener('message', e => {
+  if (e.data?.type === 'kuyrugu-gonder') {
+    e.waitUntil(kuyruguGonder(e.data.token).catch(() => {}));
+  }
+});
+
 // ── Fetch ───────────────────────────────────────
 self.addEventListener('fetch', e => {
   const url = new URL(e.request.url);
 
-  // API → Network First
   if (url.pathname.startsWith('/api/')) {
-    e.respondWith(
-      fetch(e.request).catch(() =>
-        new Response(JSON.stringify({error: 'Çevrimdışı'}), {
-          status: 503,
-          headers: {'Content-Type': 'application/json'}
+    // Liste GET'leri → Stale-While-Revalidate
+    if (e.request.method === 'GET' && !url.searchParams.has('stream') &&
+        SWR_PATHS.some(r => r.test(url.pathname))) {
+      e.respondWith(
+        caches.open(API_CACHE).then(c => c.match(e.request)).then(cached => {
+          const network = revalidate(e.request);
+          if (cached) {
+            e.waitUntil(network.catch(() => {}));
+            return cached;
+          }
+          return network.catch(offline);
         })
-      )
-    );
+      );
+      return;
+    }
+
+    // Yazma istekleri → ag yoksa kuyruk
+    if (e.request.method !== 'GET') {
+      e.respondWith(yazVeyaKuyruk(e.request));
+      return;
+    }
+
+    // Diger API → Network First
+    e.respondWith(fetch(e.request).catch(offline));
     return;
   }
 